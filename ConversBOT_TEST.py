@@ -1,18 +1,55 @@
+import time  # For time-related functions
+_SCRIPT_RUN_T0 = time.perf_counter()  # Początek wykonania skryptu – do pomiaru zimnego startu
+
 import streamlit as st
 import os, uuid
+import logging
+import threading
 from datetime import datetime, timedelta  # Import timedelta for date calculations
-import openai  # OpenAI SDK v1.x for API interactions
 import numpy as np
-import faiss  # FAISS for efficient similarity search
-from sentence_transformers import SentenceTransformer  # For embedding models
 from typing import List, Dict, Any  # Type hints for better code clarity
 import json  # JSON handling for data storage
-import time  # For time-related functions
 import random  # For generating random numbers
-import gspread  # Google Sheets API for data storage
-from google.oauth2.service_account import Credentials  # For Google Sheets authentication
+from retrieval_batcher import RetrievalBatcher  # Wspólne, zbiorcze wyszukiwanie RAG
+from sentence_segmenter import split_sentences  # Podział odpowiedzi bota na zdania
+from participant_record import ParticipantRecord  # Przyrostowo budowany wiersz arkusza
+from turn_store import Turn, TurnStore  # Zwarta reprezentacja rozmowy w session_state
+from rag_config import (  # Ustawienia wyszukiwania wspólne z narzędziami offline
+    TOP_K, RAG_QUERY_SUFFIX, QUERY_SUFFIX_WEIGHT, QUERY_HISTORY_WEIGHT, QUERY_HISTORY_DECAY,
+    RERANK_ENABLED, RERANK_MODEL, RERANK_TOP_N, RERANK_BUDGET_MS, RAG_CANDIDATES_K,
+    RAG_CORPUS_DIR, FREQUENT_OPENERS_PATH, POSTULATES_SOURCE, normalize_query,
+)
+# faiss, sentence_transformers, openai i gspread są importowane leniwie (patrz niżej),
+# żeby strona zgody renderowała się bez czekania na ciężkie biblioteki.
+
+logging.basicConfig(level=os.environ.get("CONVERSBOT_LOG_LEVEL", "INFO"))
+logger = logging.getLogger("conversbot")
+
+# Tryb profilowania przebiegów (run_profiler.py): PROFILE_RERUNS=1 dla wszystkich sesji
+# albo ?profile=<PROFILE_KEY> dla jednej; profile i podsumowania na krok trafiają do PROFILE_DIR
+PROFILE_RERUNS = os.environ.get("PROFILE_RERUNS", "0") == "1"
+PROFILE_KEY = os.environ.get("PROFILE_KEY", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP_RUNS = int(os.environ.get("PROFILE_KEEP_RUNS", "200"))  # pliki pojedynczych przebiegów na krok
+
+@st.cache_resource
+def get_profile_store():
+    """Katalog profili i zbiorcze statystyki – jeden na proces."""
+    from run_profiler import ProfileStore
+    return ProfileStore(PROFILE_DIR, interval=PROFILE_INTERVAL_MS / 1000.0, keep_runs=PROFILE_KEEP_RUNS)
 
-TOP_K = 20  # Number of top results to return from RAG search
+def _in_script_run() -> bool:
+    """Czy moduł wykonuje się jako przebieg skryptu Streamlit (a nie import, np. w replay_runner.py)."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+# Profil tego przebiegu skryptu (od tego miejsca do końca main()), oznaczony krokiem,
+# który przebieg renderuje; None = profilowanie wyłączone. Tylko w przebiegu skryptu:
+# przy imporcie main() się nie wykonuje, więc nikt nie zatrzymałby próbkowania.
+_run_profile = None
+if _in_script_run() and (PROFILE_RERUNS or (PROFILE_KEY and st.query_params.get("profile") == PROFILE_KEY)):
+    _run_profile = get_profile_store().start(f"step{st.session_state.get('current_step', 0)}")
 
 
 # ----------------------
@@ -42,126 +79,24 @@ def build_full_row_data():
     AL: feedback_negative
     AM: feedback_positive
     AN: total_study_duration_seconds
+
+    Wiersz jest utrzymywany przyrostowo przez ParticipantRecord (participant_record.py):
+    log rozmowy jest tylko dopisywany, a zmienione kolumny są oznaczane jako brudne.
     """
+    record = st.session_state.get("participant_record")
+    if record is None:
+        record = st.session_state.participant_record = ParticipantRecord(len(TIPI_QUESTIONS), 11)
+    return record.sync(st.session_state)
 
-    # 1) participant_id i timestamp początku badania
-    participant_id = st.session_state.participant_id
-    start_ts = st.session_state.start_timestamp  # zapisane w kroku 0 jako ISO-string
-
-    # 2) group
-    group = st.session_state.get("group", "")
-
-    # 3) Demografia
-    demo = st.session_state.get("demographics", {})
-    age = demo.get("age", "")
-    gender = demo.get("gender", "")
-    education = demo.get("education", "")
-
-    # 4) Opinie (attitude)
-    att = st.session_state.get("attitude", {})
-    attitude1 = att.get("attitude1", "")
-    attitude2 = att.get("attitude2", "")
-    attitude3 = att.get("attitude3", "")
-
-    # 5) TIPI-PL (10 odpowiedzi)
-    tipi = st.session_state.get("tipi_answers", [""] * len(TIPI_QUESTIONS))
-    tipi_list = tipi[: len(TIPI_QUESTIONS)] + [""] * max(0, len(TIPI_QUESTIONS) - len(tipi))
-
-    # 6) Konwersacja: moment rozpoczęcia i zakończenia
-    conv_start_dt = st.session_state.get("timer_start_time")  # datetime lub None
-    if conv_start_dt:
-        conversation_start_timestamp = conv_start_dt.isoformat()
-    else:
-        conversation_start_timestamp = ""
-
-    conv_end_dt = st.session_state.get("conversation_end_time")  # jest ustawiane w momencie 10 minut lub kliknięcia “Przejdź do oceny”
-    if conv_end_dt:
-        conversation_end_timestamp = conv_end_dt.isoformat()
-    else:
-        conversation_end_timestamp = ""
-
-    # Oblicz czas trwania konwersacji w sekundach, jeśli oba czasy są dostępne
-    if conv_start_dt and conv_end_dt:
-        duration = int((conv_end_dt - conv_start_dt).total_seconds())
-    else:
-        duration = ""
-
-    # 7) Liczniki wiadomości
-    num_user = st.session_state.get("num_user_messages", 0)
-    num_bot = st.session_state.get("num_bot_messages", 0)
-
-    # 8) Połączony log konwersacji
-    conv_history = st.session_state.get("conversation_history", [])
-    conv_lines = []
-    for turn in conv_history:
-        if turn.get("user") is not None:
-            conv_lines.append(f"User: {turn['user']}")
-        if turn.get("bot") is not None:
-            bot_text = ". ".join(turn["bot"]) if isinstance(turn["bot"], list) else turn["bot"]
-            conv_lines.append(f"Bot: {bot_text}")
-    conversation_string = "\n".join(conv_lines)
-
-    # 9) BUS-11 (11 wartości)
-    bus = st.session_state.get("bus_answers", [""] * 11)
-    bus_list = bus[:11] + [""] * max(0, 11 - len(bus))
-
-    # 10) Decision (petycja)
-    decision = st.session_state.get("decision", "")
-
-    # 11) Feedback
-    feedback = st.session_state.get("feedback", {})
-    feedback_neg = feedback.get("negative", "")
-    feedback_pos = feedback.get("positive", "")
-
-    # 12) Łączny czas trwania badania (od start_timestamp do teraz/koniec)
-    try:
-        delta = datetime.now() - datetime.fromisoformat(start_ts)
-        total_sec = int(delta.total_seconds())
-        minutes, seconds = divmod(total_sec, 60)
-        # zapisujemy jako string "MM:SS"
-        study_duration = f"{minutes:02d}:{seconds:02d}"
-    except Exception:
-        study_duration = ""
-
-
-    # Budujemy wiersz w dokładnej kolejności kolumn
-    row = [
-        participant_id,              # A
-        start_ts,                    # B
-        group,                       # C
-        age,                         # D
-        gender,                      # E
-        education,                   # F
-        attitude1,                   # G
-        attitude2,                   # H
-        attitude3                    # I
-    ]
-    # TIPI-PL (J–S)
-    row.extend(tipi_list)           # 10 elementów
-    # conversation_start_timestamp (T)
-    row.append(conversation_start_timestamp)
-    # conversation_end_timestamp (U)
-    row.append(conversation_end_timestamp)
-    # conversation_duration_seconds (V)
-    row.append(duration)
-    # num_user_messages (W)
-    row.append(num_user)
-    # num_bot_messages (X)
-    row.append(num_bot)
-    # conversation_log (Y)
-    row.append(conversation_string)
-    # BUS-11 (Z–AJ)
-    row.extend(bus_list)            # 11 elementów
-    # decision (AK)
-    row.append(decision)
-    # feedback_negative (AL)
-    row.append(feedback_neg)
-    # feedback_positive (AM)
-    row.append(feedback_pos)
-    # total_study_duration_seconds (AN)
-    row.append(study_duration)
-
-    return row
+
+def save_full_row(sheet, row_idx: int) -> None:
+    """Zapisuje do wiersza `row_idx` tylko kolumny zmienione od poprzedniego zapisu (jedno batch_update)."""
+    build_full_row_data()
+    record = st.session_state.participant_record
+    ranges = record.dirty_ranges(row_idx)
+    if ranges:
+        sheet.batch_update(ranges)
+    record.mark_clean()
 
 
 
@@ -225,32 +160,143 @@ st.markdown(
 OPENAI_API_KEY = st.secrets["TEST_KEY_OPENAI_API"]  # Retrieve API key from secrets
 if not OPENAI_API_KEY:
     raise EnvironmentError("Ustaw TEST_KEY_OPENAI_API w zmiennych środowiskowych")  # Raise error if key is missing
-client = openai.OpenAI(api_key=OPENAI_API_KEY)  # Initialize OpenAI client
+# Opcjonalny adres API (np. lokalny serwer llm_standin.py: http://127.0.0.1:8800/v1)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or st.secrets.get("OPENAI_BASE_URL")
+
+@st.cache_resource
+def get_openai_client():
+    """Tworzy klienta OpenAI przy pierwszym użyciu (kroki 0–2 go nie potrzebują)."""
+    import openai  # OpenAI SDK v1.x – import leniwy, skraca zimny start
+    # Ponowienia i limity czasu obsługuje ResilientChatClient (llm_resilience.py)
+    return openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None, max_retries=0)
+
+# Wspólne dla procesu limity wywołań OpenAI (llm_limiter.py) – dobierz do limitów konta
+OPENAI_RPM = float(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.environ.get("OPENAI_TPM", "200000"))
+LLM_QUEUE_TIMEOUT_S = float(os.environ.get("LLM_QUEUE_TIMEOUT_S", "120"))
+# Limit wiadomości jednego uczestnika na minutę (0 = bez limitu)
+PARTICIPANT_MESSAGES_PER_MINUTE = int(os.environ.get("PARTICIPANT_MESSAGES_PER_MINUTE", "8"))
+
+@st.cache_resource
+def get_llm_admission():
+    """Kolejka dopuszczania wywołań LLM – jedna na proces, wspólna dla wszystkich sesji."""
+    from llm_limiter import AdmissionController
+    return AdmissionController(OPENAI_RPM, OPENAI_TPM)
+
+# Terminy, ponowienia, hedging i bezpiecznik wywołań LLM (llm_resilience.py)
+LLM_ATTEMPT_TIMEOUT_S = float(os.environ.get("LLM_ATTEMPT_TIMEOUT_S", "30"))
+LLM_DEADLINE_S = float(os.environ.get("LLM_DEADLINE_S", "60"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+
+@st.cache_resource
+def get_llm_client():
+    """Odporny klient LLM – jeden na proces (wspólny bezpiecznik i statystyki opóźnień)."""
+    from llm_resilience import ResilientChatClient
+    return ResilientChatClient(
+        get_openai_client().chat.completions.create,
+        attempt_timeout=LLM_ATTEMPT_TIMEOUT_S,
+        deadline=LLM_DEADLINE_S,
+        max_retries=LLM_MAX_RETRIES,
+        hedge=LLM_HEDGE,
+        hedge_admit=admit_hedge,
+        retry_admit=admit_retry,
+    )
+
+def admit_hedge(kwargs: Dict[str, Any]):
+    """
+    Zapasowe zapytanie dostaje własny bilet limitu RPM/TPM – tylko gdy nikt nie czeka
+    w kolejce i oba kubełki mają zapas; po odpowiedzi zużycie jest korygowane.
+    """
+    from llm_limiter import estimate_tokens
+    admission = get_llm_admission()
+    ticket = admission.try_acquire("hedge", estimate_tokens(kwargs.get("messages", [])))
+    if ticket is None:
+        return None
+    return lambda resp: admission.settle(ticket, getattr(getattr(resp, "usage", None), "total_tokens", None))
+
+def admit_retry(kwargs: Dict[str, Any], timeout: float):
+    """
+    Ponowienie czeka w kolejce limitu RPM/TPM jak zwykłe zapytanie (zajmuje miejsce w RPM).
+    Tokeny odpowiedzi rozlicza bilet pierwszej próby w create_chat_completion, a odrzucone
+    próby (429/5xx) tokenów nie zużywają – po próbie szacunek wraca do kubełka TPM.
+    """
+    from llm_limiter import estimate_tokens
+    admission = get_llm_admission()
+    ticket = admission.acquire("retry", estimate_tokens(kwargs.get("messages", [])),
+                               timeout=min(timeout, LLM_QUEUE_TIMEOUT_S))
+    return lambda: admission.settle(ticket, 0)
+
+@st.cache_resource
+def get_message_limiter():
+    from llm_limiter import MessageRateLimiter
+    return MessageRateLimiter(PARTICIPANT_MESSAGES_PER_MINUTE)
+
+def create_chat_completion(session_id: str, messages: List[Dict[str, str]], on_wait=None, **kwargs):
+    """
+    `chat.completions.create` za wspólnym limiterem RPM/TPM: czeka w kolejce FIFO
+    (pozycja i szacowany czas przez `on_wait`), a po odpowiedzi koryguje zużycie tokenów.
+    """
+    from llm_limiter import estimate_tokens
+    admission = get_llm_admission()
+    ticket = admission.acquire(session_id, estimate_tokens(messages),
+                               timeout=LLM_QUEUE_TIMEOUT_S, on_wait=on_wait)
+    llm_client = get_llm_client()
+    t0 = time.perf_counter()
+    resp = llm_client.create(messages=messages, **kwargs)
+    usage = getattr(resp, "usage", None)
+    admission.settle(ticket, getattr(usage, "total_tokens", None))
+    logger.info("LLM: %.2f s (kolejka %.2f s), %s", time.perf_counter() - t0, ticket.waited,
+                llm_client.latency_summary())
+    return resp
 
 # Google Sheets Configuration
 GDRIVE_SHEET_ID = "1R47dD1SaAWIRCQkuYfLveHXtXJAWJEk18J2m1kbyHUo"  # Your Google Sheet ID
 
-# ZAMIANA: budujemy creds z wielu st.secrets zamiast z JSON-stringa
-creds_info = {
-    "type": st.secrets["GDRIVE_TYPE"],
-    "project_id": st.secrets["GDRIVE_PROJECT_ID"],
-    "private_key_id": st.secrets["GDRIVE_PRIVATE_KEY_ID"],
-    "private_key": st.secrets["GDRIVE_PRIVATE_KEY"],
-    "client_email": st.secrets["GDRIVE_CLIENT_EMAIL"],
-    "client_id": st.secrets["GDRIVE_CLIENT_ID"],
-    "auth_uri": st.secrets["GDRIVE_AUTH_URI"],
-    "token_uri": st.secrets["GDRIVE_TOKEN_URI"],
-    "auth_provider_x509_cert_url": st.secrets["GDRIVE_AUTH_PROVIDER_CERT_URL"],
-    "client_x509_cert_url": st.secrets["GDRIVE_CLIENT_CERT_URL"]
-}
-_gspread_creds = Credentials.from_service_account_info(
-    creds_info,
-    scopes=[
-        "https://www.googleapis.com/auth/spreadsheets",  # Access to Google Sheets
-        "https://www.googleapis.com/auth/drive",  # Access to Google Drive
-    ],
-)
-_gspread_client = gspread.authorize(_gspread_creds)  # Authorize gspread client
+# Backend arkusza: "google" (domyślnie) lub "local" (sheets_standin.py, bez sieci)
+GSHEETS_BACKEND = os.environ.get("GSHEETS_BACKEND") or st.secrets.get("GSHEETS_BACKEND", "google")
+
+@st.cache_resource
+def get_gspread_client():
+    """
+    Zwraca klienta arkusza – jeden na proces, autoryzowany dopiero przy pierwszym zapisie,
+    a nie przy każdym wykonaniu skryptu.
+    """
+    if GSHEETS_BACKEND == "local":
+        from sheets_standin import FakeClient
+
+        # GSHEETS_LOCAL_PATH: plik SQLite lub ":memory:"; GSHEETS_LATENCY_MS: np. "80,250"
+        latency = [float(v) for v in os.environ.get("GSHEETS_LATENCY_MS", "0,0").split(",")]
+        return FakeClient(
+            path=os.environ.get("GSHEETS_LOCAL_PATH", ":memory:"),
+            latency_ms=(latency[0], latency[-1]),
+            writes_per_minute=int(os.environ.get("GSHEETS_WRITES_PER_MINUTE", "60")),
+        )
+
+    import gspread  # Google Sheets API for data storage
+    from google.oauth2.service_account import Credentials  # For Google Sheets authentication
+
+    # ZAMIANA: budujemy creds z wielu st.secrets zamiast z JSON-stringa
+    creds_info = {
+        "type": st.secrets["GDRIVE_TYPE"],
+        "project_id": st.secrets["GDRIVE_PROJECT_ID"],
+        "private_key_id": st.secrets["GDRIVE_PRIVATE_KEY_ID"],
+        "private_key": st.secrets["GDRIVE_PRIVATE_KEY"],
+        "client_email": st.secrets["GDRIVE_CLIENT_EMAIL"],
+        "client_id": st.secrets["GDRIVE_CLIENT_ID"],
+        "auth_uri": st.secrets["GDRIVE_AUTH_URI"],
+        "token_uri": st.secrets["GDRIVE_TOKEN_URI"],
+        "auth_provider_x509_cert_url": st.secrets["GDRIVE_AUTH_PROVIDER_CERT_URL"],
+        "client_x509_cert_url": st.secrets["GDRIVE_CLIENT_CERT_URL"]
+    }
+    gspread_creds = Credentials.from_service_account_info(
+        creds_info,
+        scopes=[
+            "https://www.googleapis.com/auth/spreadsheets",  # Access to Google Sheets
+            "https://www.googleapis.com/auth/drive",  # Access to Google Drive
+        ],
+    )
+    return gspread.authorize(gspread_creds)  # Authorize gspread client
 
 # --- Sekcja: Dane eksperymentalne i stałe konfiguracje ---
 # Pytania do kwestionariusza TIPI-PL
@@ -409,14 +455,63 @@ Jeśli nie wyrażasz zgody, prosimy o zamknięcie tej strony.
 RAG_JSON_PATH   = "RAG/rag_chunks_full.json"
 RAG_INDEX_PATH  = "RAG/rag.index"
 
-# Załaduj model embeddingów (model wielojęzyczny, działa dla polskiego)
+# Pytania podpowiadane w instrukcji kroku 3 i typowe powitania – ich wyniki
+# wyszukiwania liczymy raz przy starcie, więc pierwsza tura zwykle pomija encode i search
+STARTER_QUESTIONS: List[str] = [
+    "Jaki jest główny cel tej petycji?",
+    "Jakie konkretnie problemy ma rozwiązać?",
+    "Poproszę o streszczenie najważniejszych argumentów.",
+    "Kto jest organizatorem akcji?",
+    "Witaj",
+    "Cześć",
+    "Dzień dobry",
+    "Hej",
+]
+
+# Ekstrakcyjna kompresja kontekstu (context_compression.py): do promptu trafiają tylko
+# zdania najbardziej podobne do zapytania, w limicie znaków; wymaga zdań policzonych
+# przy budowie wersji korpusu (corpus_store.py)
+COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "1") == "1"
+CONTEXT_BUDGET_CHARS = int(os.environ.get("CONTEXT_BUDGET_CHARS", "3000"))
+
+# Mikro-paczkowanie wyszukiwań między sesjami
+RAG_BATCH_WAIT_MS = float(os.environ.get("RAG_BATCH_WAIT_MS", "5"))
+RAG_MAX_BATCH = int(os.environ.get("RAG_MAX_BATCH", "32"))
+
+
 @st.cache_resource
+def get_postulate_table():
+    """Tabela postulatów wspólna dla wszystkich sesji; None, gdy brak pliku źródłowego."""
+    from postulates import PostulateTable
+    if not os.path.exists(POSTULATES_SOURCE):
+        return None
+    return PostulateTable.load(POSTULATES_SOURCE)
+
+
+def load_frequent_openers() -> List[str]:
+    openers = list(STARTER_QUESTIONS)
+    if os.path.exists(FREQUENT_OPENERS_PATH):
+        with open(FREQUENT_OPENERS_PATH, 'r', encoding='utf-8') as f:
+            openers.extend(str(q) for q in json.load(f))
+    # Usuń duplikaty z zachowaniem kolejności
+    unique = {}
+    for q in openers:
+        unique.setdefault(normalize_query(q), q)
+    return list(unique.values())
+
+# Backend modelu embeddingów: "torch" (domyślnie), "onnx" lub "onnx-int8" (embedding_backend.py)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+# Załaduj model embeddingów (model wielojęzyczny, działa dla polskiego)
 def load_embedding_model():
-    """Loads the SentenceTransformer embedding model."""
-    return SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+    """Loads the embedding model (SentenceTransformer or its ONNX Runtime export)."""
+    from embedding_backend import load_embedding_backend
+    return load_embedding_backend(EMBEDDING_BACKEND)
+
+# Wersja korpusu z RAG_CORPUS_DIR (rag_config.py) jest podmieniana bez restartu
+RAG_CORPUS_WATCH_INTERVAL = float(os.environ.get("RAG_CORPUS_WATCH_INTERVAL", "10"))
 
 # Załaduj streszczenia z pliku JSON
-@st.cache_resource
 def load_summaries():
     if os.path.exists(RAG_JSON_PATH):
         with open(RAG_JSON_PATH, 'r', encoding='utf-8') as f:
@@ -426,21 +521,175 @@ def load_summaries():
     return []
 
 # Załaduj FAISS index
-@st.cache_resource
 def load_faiss_index():
+    import faiss  # FAISS for efficient similarity search
     if os.path.exists(RAG_INDEX_PATH):
         return faiss.read_index(RAG_INDEX_PATH)
     return None
 
-# Załaduj zasoby RAG przy starcie aplikacji
-embedding_model = load_embedding_model()
-summary_texts = load_summaries()
-faiss_index = load_faiss_index()
+# Załaduj korpus: najnowsza wersja z RAG_CORPUS_DIR, a gdy jej brak – pliki RAG_JSON_PATH/RAG_INDEX_PATH
+def load_corpus():
+    from corpus_store import CorpusVersion, latest_version_path, load_version
+
+    latest = latest_version_path(RAG_CORPUS_DIR)
+    if latest:
+        return load_version(latest)
+    summary_texts = load_summaries()
+    faiss_index = load_faiss_index()
+    if faiss_index is None or not summary_texts:
+        return None
+    manifest = {"version": "legacy", "chunk_count": len(summary_texts), "dim": faiss_index.d,
+                "index_type": type(faiss_index).__name__, "content_hash": ""}
+    # Stary indeks jest pozycyjny: id fragmentu = numer wiersza
+    chunks = [{"id": str(i), "text": text} for i, text in enumerate(summary_texts)]
+    return CorpusVersion("legacy", manifest, chunks, faiss_index)
+
+
+class RagResources:
+    """
+    Zasoby RAG ładowane w tle: model embeddingów i bieżąca wersja korpusu
+    (fragmenty + indeks FAISS) plus jedno rozgrzewkowe `encode`. Krok 3 czeka
+    na `ready` tylko wtedy, gdy uczestnik dotrze do czatu przed końcem ładowania.
+
+    `corpus` jest podmieniane jednym przypisaniem – wyszukiwanie, które już
+    pobrało referencję do starej wersji, kończy się na niej.
+    """
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.embedding_model = None
+        self.corpus = None
+        self.error = None
+        self.timings: Dict[str, float] = {}
+        # Wspólny wykonawca: zapytania z wielu sesji trafiają do jednego encode/search
+        self.batcher = None
+        self.watcher = None
+        self.reranker = None
+        self.query_builder = None
+
+    def load(self):
+        try:
+            t0 = time.perf_counter()
+            self.embedding_model = load_embedding_model()
+            self.timings["model_load_s"] = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            corpus = load_corpus()
+            self.timings["index_load_s"] = time.perf_counter() - t0
+
+            # Rozgrzewka: pierwsze encode inicjalizuje wątki i bufory modelu
+            t0 = time.perf_counter()
+            self.embedding_model.encode(["rozgrzewka"], convert_to_numpy=True)
+            self.timings["warmup_encode_s"] = time.perf_counter() - t0
+
+            from query_vector import QueryVectorBuilder
+            suffix_embedding = self.embedding_model.encode([RAG_QUERY_SUFFIX], convert_to_numpy=True)[0]
+            self.query_builder = QueryVectorBuilder(
+                suffix_embedding,
+                suffix_weight=QUERY_SUFFIX_WEIGHT,
+                history_weight=QUERY_HISTORY_WEIGHT,
+                history_decay=QUERY_HISTORY_DECAY,
+            )
+
+            if RERANK_ENABLED:
+                # Re-ranking jest opcjonalny: błąd modelu nie może wyłączyć całego RAG
+                try:
+                    from reranker import CrossEncoderReranker
+                    t0 = time.perf_counter()
+                    reranker = CrossEncoderReranker(RERANK_MODEL)
+                    reranker.warm_up(RAG_CANDIDATES_K)  # mierzy koszt pełnej listy kandydatów
+                    self.reranker = reranker
+                    self.timings["reranker_load_s"] = time.perf_counter() - t0
+                except Exception:
+                    logger.exception("Nie udało się wczytać modelu re-rankingu %s – wyszukiwanie bez re-rankingu", RERANK_MODEL)
+                    self.reranker = None
+
+            self.batcher = RetrievalBatcher(
+                encode_fn=lambda queries: self.embedding_model.encode(queries, convert_to_numpy=True),
+                search_fn=lambda embeddings, k: self.corpus.search(embeddings, k),
+                max_wait_ms=RAG_BATCH_WAIT_MS,
+                max_batch=RAG_MAX_BATCH,
+            )
+            if corpus is None or not len(corpus):
+                self.error = "Brak plików indeksu lub streszczeń RAG."
+            else:
+                t0 = time.perf_counter()
+                self.swap_corpus(corpus)
+                self.timings["precompute_openers_s"] = time.perf_counter() - t0
+
+            from corpus_store import CorpusWatcher
+            self.watcher = CorpusWatcher(
+                RAG_CORPUS_DIR,
+                current_version=corpus.version if corpus is not None else None,
+                on_new_version=self.swap_corpus,
+                interval=RAG_CORPUS_WATCH_INTERVAL,
+            ).start()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            logger.info("RAG warm-up: %s (błąd: %s)", self.timings, self.error)
+            self.ready.set()
+
+    def swap_corpus(self, corpus):
+        """Przygotowuje nową wersję (cache pierwszych pytań) i podmienia ją atomowo."""
+        self.precompute_openers(corpus, load_frequent_openers())
+        self.corpus = corpus
+        self.error = None
+
+    def precompute_openers(self, corpus, openers: List[str]):
+        """
+        Jedno zbiorcze encode i jedno search dla wszystkich częstych pierwszych pytań
+        (pierwsza tura – bez historii rozmowy).
+        """
+        if not openers:
+            return
+        embeddings = self.embedding_model.encode(openers, convert_to_numpy=True, batch_size=64)
+        vectors = np.vstack([self.query_builder.combine(e) for e in embeddings])
+        _, indices = corpus.search(vectors, RAG_CANDIDATES_K)
+        for query, row, embedding in zip(openers, indices, embeddings):
+            corpus.precomputed[normalize_query(query)] = (row, embedding)
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.ready.wait(timeout)
+
+
+@st.cache_resource
+def get_rag_resources() -> RagResources:
+    """Uruchamia ładowanie RAG w wątku tła – raz na proces."""
+    resources = RagResources()
+    threading.Thread(target=resources.load, name="rag-warmup", daemon=True).start()
+    return resources
+
+# Rozpocznij ładowanie zasobów RAG przy starcie aplikacji (nie blokuje renderowania)
+rag_resources = get_rag_resources()
+
+# Wyszukiwanie w FAISS: id fragmentów i embedding zapytania (dla kolejnych etapów)
+def search_rag_hits(user_query, k=TOP_K, history=None):
+    """
+    Zwraca (corpus, ids, text_embedding) dla top K fragmentów.
+    Kodowany jest tylko tekst pytania; wektor wyszukiwania dokłada do niego dopisek
+    tematyczny i historię rozmowy `history` (QueryVectorBuilder).
+    `corpus` to migawka bieżącej wersji – podmiana korpusu w trakcie nie wpływa na wynik.
+    """
+    rag_resources.wait()
+    corpus = rag_resources.corpus
+    if corpus is None or rag_resources.embedding_model is None or not len(corpus):
+        raise RuntimeError("Zasoby RAG nie zostały poprawnie załadowane.")
+
+    # Szybka ścieżka: wynik policzony przy starcie dla podpowiadanych pytań i powitań
+    cached = corpus.precomputed.get(normalize_query(user_query)) if history is None else None
+    if cached is not None and k <= RAG_CANDIDATES_K:
+        ids, text_embedding = cached
+        return corpus, ids[:k], text_embedding
+
+    # FAISS zwraca stabilne id fragmentów (-1 gdy wyników jest mniej niż k)
+    builder = rag_resources.query_builder
+    _, ids, text_embedding = rag_resources.batcher.search(
+        user_query, k, timeout=30, search_fn=corpus.search,
+        vector_fn=lambda embedding: builder.combine(embedding, history),
+    )
+    return corpus, ids, text_embedding
 
-# Sprawdź, czy zasoby RAG zostały poprawnie załadowane
-if embedding_model is None or summary_texts is None or faiss_index is None:
-    st.error("Błąd ładowania zasobów RAG. Upewnij się, że pliki summaries.json i summaries.index istnieją w folderze RAG.")
-    st.stop() # Zatrzymaj aplikację, jeśli RAG nie działa
 
 # Funkcja do wyszukiwania top K dokumentów w FAISS index
 def search_rag(user_query, k=TOP_K):
@@ -448,20 +697,76 @@ def search_rag(user_query, k=TOP_K):
     Przyjmuje zapytanie użytkownika i zwraca listę top K streszczeń
     na podstawie wyszukiwania w FAISS index.
     """
-    if faiss_index is None or embedding_model is None or not summary_texts:
-        return ["Błąd: Zasoby RAG nie zostały poprawnie załadowane."]
-
     try:
-        query_embedding = embedding_model.encode([user_query], convert_to_numpy=True)
-        distances, indices = faiss_index.search(query_embedding, k)
-        # Upewnij się, że indeksy są w zakresie summary_texts
-        top_docs = [summary_texts[idx] for idx in indices[0] if idx < len(summary_texts)]
+        corpus, ids, _ = search_rag_hits(user_query, k)
+        top_docs = corpus.resolve(ids)
         return top_docs
     except Exception as e:
         st.error(f"Błąd podczas wyszukiwania w RAG: {e}")
         return ["Błąd podczas wyszukiwania w RAG."]
 
 
+def retrieve_context(user_message: str, turn_start: float, history=None):
+    """
+    Fragmenty do promptu: wyszukiwanie w FAISS, opcjonalny re-ranking cross-encoderem
+    (w ramach budżetu tury) i ekstrakcyjna kompresja do najtrafniejszych zdań.
+    Pytania o konkretne postulaty ("Co mówi postulat 5?") albo o ich listę omijają
+    wyszukiwanie – kontekstem jest dokładny tekst z tabeli postulatów (postulates.py).
+
+    Zwraca (fragmenty, nowa historia wektora zapytania) – historię trzyma session_state.
+    """
+    postulate_table = get_postulate_table()
+    structured = postulate_table.match(user_message) if postulate_table is not None else None
+    if structured:
+        return structured, history
+
+    k = TOP_K if rag_resources.reranker is None else RAG_CANDIDATES_K
+    try:
+        corpus, ids, text_embedding = search_rag_hits(user_message, k, history)
+    except Exception as e:
+        st.error(f"Błąd podczas wyszukiwania w RAG: {e}")
+        return ["Błąd podczas wyszukiwania w RAG."], history
+    builder = rag_resources.query_builder
+    query_embedding = builder.combine(text_embedding, history)
+    history = builder.update(history, text_embedding)
+    ids = [int(i) for i in ids if int(i) in corpus.text_by_id]
+
+    if rag_resources.reranker is not None:
+        id_by_text = {corpus.text_by_id[i]: i for i in ids}
+        ranked = rag_resources.reranker.rerank(
+            user_message,
+            [corpus.text_by_id[i] for i in ids],
+            top_n=RERANK_TOP_N,
+            deadline=turn_start + RERANK_BUDGET_MS / 1000.0,
+            fallback_k=TOP_K,
+        )
+        ids = [id_by_text[text] for text in ranked]
+
+    if COMPRESS_ENABLED and corpus.sentences is not None:
+        return corpus.sentences.compress(query_embedding, ids, CONTEXT_BUDGET_CHARS,
+                                         fallback=corpus.text_by_id.get), history
+    return corpus.resolve(ids), history
+
+
+def build_chat_messages(system_prompt: str, history: TurnStore, retrieved_context: List[str]) -> List[Dict[str, str]]:
+    """
+    Wiadomości dla modelu w jednej turze: prompt systemowy grupy, fragmenty RAG
+    i cała dotychczasowa rozmowa (ostatnia wiadomość to pytanie użytkownika).
+    Używane przez krok 3 i przez replay_runner.py.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "system",
+         "content": "Korzystaj TYLKO z poniższych fragmentów:\n" + "\n".join(f"- {d}" for d in retrieved_context)},
+    ]
+    for m in history:
+        if m.user is not None:
+            messages.append({"role": "user", "content": m.user})
+        if m.has_bot:
+            messages.append({"role": "assistant", "content": m.bot_text})
+    return messages
+
+
 # --- Sekcja: Funkcje pomocnicze ---
 
 # Function to read group data from Google Sheet
@@ -473,7 +778,7 @@ def get_previous_groups_from_gsheet() -> List[str]:
         List[str]: A list of group assignments from the Google Sheet.
     """
     try:
-        sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
+        sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
 
         group_column_values = sheet.col_values(3)
         if group_column_values and group_column_values[0].lower() == 'group':
@@ -516,6 +821,160 @@ def assign_group() -> str:
     return grp
 
 
+# Ile bieżących tur może przybyć w panelu czatu, zanim pełny przebieg przeniesie je do bloku historii
+CHAT_LIVE_TURNS_MAX = 4
+
+def render_turn_html(turn: Turn, bot_name: str) -> str:
+    """HTML jednej zakończonej tury – te same dymki co przy wyświetlaniu na bieżąco."""
+    parts = []
+    if turn.user is not None:
+        parts.append(f"<div class='chat-user'><div>{turn.user}</div></div>")
+    if turn.has_bot:
+        parts.append(f"<div class='chat-name'>{bot_name}</div>")
+        parts.extend(f"<div class='chat-bot'><div>{sentence}</div></div>" for sentence in turn.bot_sentences)
+    return "".join(parts)
+
+# Tempo „pisania” bota: kolejne zdanie pojawia się po len(poprzednie zdanie) * 40 ms
+TYPEWRITER_SECONDS_PER_CHAR = 0.04
+
+def typewriter_html(sentences: List[str]) -> str:
+    """
+    Zdania bota z opóźnionym pojawianiem się (animacja CSS `chat-reveal` w przeglądarce) –
+    serwer wysyła całą turę od razu i nie czeka, a uczestnik widzi to samo tempo co wcześniej.
+    """
+    parts = []
+    delay = 0.0
+    for sentence in sentences:
+        parts.append(f"<div class='chat-bot chat-typed' style='animation-delay: {delay:.2f}s'>"
+                     f"<div>{sentence}</div></div>")
+        delay += len(sentence) * TYPEWRITER_SECONDS_PER_CHAR
+    return "".join(parts)
+
+def update_chat_html(bot_name: str) -> int:
+    """
+    Dokleja do `chat_html` tury zakończone od ostatniego wywołania (z odpowiedzią bota,
+    już wyświetloną) i zwraca indeks pierwszej tury, która nie weszła do bloku.
+    """
+    history = st.session_state.conversation_history
+    settled = st.session_state.get("chat_html_turns", 0)
+    html = st.session_state.get("chat_html", "")
+    while settled < len(history) and history[settled].has_bot and history[settled].shown:
+        html += render_turn_html(history[settled], bot_name)
+        settled += 1
+    st.session_state.chat_html = html
+    st.session_state.chat_html_turns = settled
+    return settled
+
+
+# Diagnostyka pamięci sesji (session_memory.py): widok pod adresem ?diagnostics=<DIAGNOSTICS_KEY>
+DIAGNOSTICS_KEY = os.environ.get("DIAGNOSTICS_KEY", "")
+# Po zakończeniu badania (krok 7) w sesji zostaje tylko identyfikacja uczestnika i numer wiersza
+FINISHED_SESSION_KEEP = {"participant_id", "group", "row_index", "current_step", "start_timestamp", "resume_token"}
+
+@st.cache_resource
+def get_session_memory_registry():
+    """Rejestr rozmiarów wszystkich sesji – jeden na proces."""
+    from session_memory import SessionMemoryRegistry
+    return SessionMemoryRegistry()
+
+def report_session_memory():
+    """Zgłasza rozmiar session_state tej sesji (najwyżej raz na kilkadziesiąt sekund lub przy zmianie kroku)."""
+    from session_memory import measure
+    registry = get_session_memory_registry()
+    participant_id = st.session_state.participant_id
+    step = st.session_state.get("current_step", 0)
+    if registry.due(participant_id, step):
+        nbytes, by_field = measure((key, st.session_state[key]) for key in list(st.session_state.keys()))
+        registry.report(participant_id, step, nbytes, by_field)
+
+def release_finished_session():
+    """Usuwa z zakończonej sesji ciężkie pola: rozmowę, HTML czatu, rekord wiersza, odpowiedzi i klucze widżetów."""
+    for key in list(st.session_state.keys()):
+        if key not in FINISHED_SESSION_KEEP:
+            del st.session_state[key]
+
+# Punkty kontrolne sesji (session_checkpoint.py): po odświeżeniu strony lub zerwaniu połączenia
+# sesja z parametrem ?resume=<token> wraca do zapisanego stanu zamiast tworzyć nowego uczestnika
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", ".session_checkpoints")
+CHECKPOINT_TTL_H = float(os.environ.get("CHECKPOINT_TTL_H", "24"))
+CHECKPOINT_KEYS = (
+    "participant_id", "group", "row_index", "current_step", "start_timestamp",
+    "tipi_answers", "bus_answers", "demographics", "attitude", "feedback", "decision", "final_survey",
+    "conversation_history", "query_history", "chat_started", "chat_input_disabled",
+    "timer_start_time", "timer_active", "button_disabled", "conversation_end_time",
+    "num_user_messages", "num_bot_messages", "process_user_input", "show_petition_link",
+)
+
+@st.cache_resource
+def get_checkpoint_store():
+    from session_checkpoint import CheckpointStore
+    store = CheckpointStore(CHECKPOINT_DIR, ttl=CHECKPOINT_TTL_H * 3600)
+    store.prune()
+    return store
+
+def restore_session() -> bool:
+    """Wczytuje stan sesji z punktu kontrolnego wskazanego przez ?resume=; False, gdy go brak."""
+    token = st.query_params.get("resume")
+    if not token:
+        return False
+    data = get_checkpoint_store().load(token)
+    if not data or "participant_id" not in data:
+        return False
+    for key, value in data.items():
+        st.session_state[key] = value
+    st.session_state.resume_token = token
+    history = st.session_state.get("conversation_history")
+    if history is not None:
+        # Po powrocie rozmowa pokazuje się od razu, bez ponownego efektu pisania
+        for turn in history:
+            turn.shown = True
+        # Tura użytkownika bez odpowiedzi (rozłączenie w trakcie generowania) – generujemy ją ponownie
+        if len(history) and history[-1].user is not None and not history[-1].has_bot:
+            st.session_state.process_user_input = True
+        st.session_state.chat_html = ""
+        st.session_state.chat_html_turns = 0
+    logger.info("Wznowiono sesję uczestnika %s (krok %s)",
+                st.session_state.participant_id, st.session_state.get("current_step"))
+    return True
+
+def checkpoint_session():
+    """Zapisuje punkt kontrolny, gdy zmienił się krok, wiersz arkusza lub rozmowa."""
+    token = st.session_state.get("resume_token")
+    if not token:
+        return
+    history = st.session_state.get("conversation_history")
+    fingerprint = (
+        st.session_state.get("current_step"), st.session_state.get("row_index"),
+        st.session_state.get("group"), st.session_state.get("decision"),
+        len(history) if history is not None else -1,
+        bool(history is not None and len(history) and history[-1].has_bot),
+    )
+    if st.session_state.get("checkpoint_fingerprint") == fingerprint:
+        return
+    data = {key: st.session_state[key] for key in CHECKPOINT_KEYS if key in st.session_state}
+    try:
+        get_checkpoint_store().save(token, data)
+        st.session_state.checkpoint_fingerprint = fingerprint
+    except Exception as e:
+        logger.warning("Nie udało się zapisać punktu kontrolnego sesji: %s", e)
+
+def render_memory_diagnostics():
+    registry = get_session_memory_registry()
+    rows = registry.snapshot()
+    total = registry.total_bytes()
+    st.header("Diagnostyka pamięci sesji")
+    col_sessions, col_total, col_avg = st.columns(3)
+    col_sessions.metric("Sesje", len(rows))
+    col_total.metric("Łącznie", f"{total / 1024:.1f} KiB")
+    col_avg.metric("Średnio na sesję", f"{total / max(1, len(rows)) / 1024:.1f} KiB")
+    st.dataframe([
+        {"sesja": r["session"][:8], "krok": r["step"], "KiB": round(r["bytes"] / 1024, 1),
+         "bezczynność [s]": r["idle_s"],
+         "największe pola": ", ".join(f"{k} ({v / 1024:.1f} KiB)" for k, v in r["top_fields"].items())}
+        for r in rows
+    ])
+
+
 # --- Sekcja: Główna aplikacja Streamlit ---
 
 def main():
@@ -523,12 +982,18 @@ def main():
     Główna funkcja aplikacji Streamlit.
     Zarządza krokami eksperymentu i interfejsem użytkownika.
     """
-    # Inicjalizacja stanu sesji dla nowego uczestnika
-    if "participant_id" not in st.session_state:
+    # Inicjalizacja stanu sesji dla nowego uczestnika (chyba że wznawia sesję z ?resume=)
+    if "participant_id" not in st.session_state and not restore_session():
         st.session_state.participant_id = str(uuid.uuid4())
-        st.session_state.group = assign_group()  # Przypisanie grupy przy pierwszej wizycie
+        st.session_state.resume_token = get_checkpoint_store().new_token()
+        st.query_params["resume"] = st.session_state.resume_token
+        # Grupa jest przypisywana dopiero po kliknięciu "Dalej" na stronie zgody
+        # (assign_group czyta kolumnę z arkusza – nie blokujemy tym pierwszego renderu)
+        st.session_state.group = ""
         st.session_state.tipi_answers = [None] * len(TIPI_QUESTIONS)
-        st.session_state.conversation_history = []
+        st.session_state.conversation_history = TurnStore()
+        # Wygaszana suma embeddingów poprzednich pytań (query_vector.py)
+        st.session_state.query_history = None
         st.session_state.decision = None
         st.session_state.final_survey = {}
         st.session_state.demographics = {}  # New: Initialize demographics data
@@ -536,12 +1001,6 @@ def main():
         st.session_state.feedback = {}  # New: Initialize feedback data
         st.session_state.current_step = 0
         st.session_state.start_timestamp = datetime.now().isoformat()  # Zapis czasu rozpoczęcia
-        # Dodaj wiadomość powitalną do historii konwersacji tylko przy pierwszym uruchomieniu
-        group_welcome_message = DEFAULT_PROMPTS.get(st.session_state.group, {}).get("welcome", "Witaj!")
-        st.session_state.conversation_history.append({"user": None, "bot": group_welcome_message})
-        # Inicjalizacja flagi do śledzenia wyświetlonych wiadomości bota
-        if "shown_sentences" not in st.session_state:
-            st.session_state.shown_sentences = {}
         # Inicjalizacja zmiennych dla timera
         if "timer_start_time" not in st.session_state:
             st.session_state.timer_start_time = None
@@ -552,7 +1011,14 @@ def main():
         if "conversation_end_time" not in st.session_state:
             st.session_state.conversation_end_time = None
 
+    # Widok diagnostyczny pamięci (tylko z kluczem ustawionym w DIAGNOSTICS_KEY)
+    if DIAGNOSTICS_KEY and st.query_params.get("diagnostics") == DIAGNOSTICS_KEY:
+        render_memory_diagnostics()
+        return
+
     step = st.session_state.current_step
+    report_session_memory()
+    checkpoint_session()
 
     # Funkcja callback do zmiany kroku
     def go_to(step: int):
@@ -575,11 +1041,24 @@ def main():
         st.header("")
         st.markdown(CONSENT_TEXT, unsafe_allow_html=True)
 
+        # Pomiar zimnego startu: czas od początku skryptu do wyrenderowania zgody
+        if "first_paint_ms" not in st.session_state:
+            st.session_state.first_paint_ms = (time.perf_counter() - _SCRIPT_RUN_T0) * 1000
+            logger.info("Czas do pierwszego renderu (krok 0): %.1f ms, RAG gotowy: %s",
+                        st.session_state.first_paint_ms, rag_resources.ready.is_set())
+
         def on_consent_next():
+            # 0) Przypisanie grupy i wiadomość powitalna
+            if not st.session_state.group:
+                st.session_state.group = assign_group()
+                group_welcome_message = DEFAULT_PROMPTS.get(st.session_state.group, {}).get("welcome", "Witaj!")
+                st.session_state.conversation_history.append_bot(group_welcome_message)
+
             # 1) Dodajemy nowy wiersz w arkuszu
-            sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
+            sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
             row = build_full_row_data()
             sheet.append_row(row)
+            st.session_state.participant_record.mark_clean()
 
             # 2) Zapamiętujemy numer tego wiersza (ostatni)
             all_values = sheet.get_all_values()
@@ -708,9 +1187,8 @@ def main():
             # 2) Nadpisujemy wiersz row_index
             row_idx = st.session_state.get("row_index")
             if row_idx:
-                sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                full_row = build_full_row_data()
-                sheet.update(f"A{row_idx}:AN{row_idx}", [full_row])
+                sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                save_full_row(sheet, row_idx)
 
             # 3) Przechodzimy do kroku 2 (TIPI-PL)
             go_to(2)
@@ -834,9 +1312,8 @@ def main():
             # 2) Nadpisz wiersz row_index
             row_idx = st.session_state.get("row_index")
             if row_idx:
-                sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                full_row = build_full_row_data()
-                sheet.update(f"A{row_idx}:AN{row_idx}", [full_row])
+                sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                save_full_row(sheet, row_idx)
 
             # 3) Przejdź do kroku 3 (Rozmowa)
             go_to(3)
@@ -892,10 +1369,12 @@ def main():
                 st.session_state.chat_started = True
                 st.session_state.timer_active = False
                 st.session_state.chat_input_disabled = False
-                st.session_state.conversation_history = [
-                    {"user": None, "bot": DEFAULT_PROMPTS.get(st.session_state.group, {}).get("welcome", "Witaj!")}
-                ]
-                st.session_state.shown_sentences = {0: False}  # Flagi wyświetlenia dla opóźnionych zdań bota
+                # Powitanie jako pierwsza tura bota; Turn.shown – czy zdania zostały już wyświetlone
+                st.session_state.conversation_history = TurnStore([
+                    Turn(bot=DEFAULT_PROMPTS.get(st.session_state.group, {}).get("welcome", "Witaj!"))
+                ])
+                st.session_state.chat_html = ""  # Blok HTML zakończonych tur (update_chat_html)
+                st.session_state.chat_html_turns = 0
                 st.session_state.timer_start_time = None
                 st.session_state.conversation_end_time = None
                 st.session_state.num_user_messages = 0
@@ -905,10 +1384,21 @@ def main():
         # 3B) Gdy rozmowa już się rozpoczęła, wyświetl panel czatu
         st.header("Rozmowa z asystentem AI")
 
+        # Zasoby RAG ładują się w tle od startu – czekamy tylko, jeśli jeszcze nie są gotowe
+        if not rag_resources.ready.is_set():
+            with st.spinner("Przygotowywanie asystenta..."):
+                rag_resources.wait()
+        if rag_resources.error:
+            st.error("Błąd ładowania zasobów RAG. Upewnij się, że pliki summaries.json i summaries.index istnieją w folderze RAG.")
+            st.stop() # Zatrzymaj aplikację, jeśli RAG nie działa
+
         # --- Styl czatu za pomocą CSS ---
         st.markdown("""
         <style>
         .chat-container { max-height: 60vh; overflow-y: auto; margin-bottom: 10px; }
+        .chat-name { font-weight: 700; margin: 10px 0 2px 0; }
+        .chat-bot.chat-typed { max-height: 0; margin: 0; overflow: hidden; animation: chat-reveal 0s linear forwards; }
+        @keyframes chat-reveal { to { max-height: 100vh; margin: 5px 0; } }
         .chat-user { display: flex; justify-content: flex-end; margin: 5px 0; }
         .chat-user > div {
             background-color: #4169E1;
@@ -928,205 +1418,212 @@ def main():
         </style>
         """, unsafe_allow_html=True)
 
-        # --- 1) Wyświetl historię konwersacji ---
-        st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
+        # --- 1) Historia rozmowy ---
+        # Zakończone tury są doklejane przyrostowo do jednego bloku HTML (session_state),
+        # więc kolejne przebiegi nie generują osobnego elementu dla każdego zdania.
         bot_name = DEFAULT_PROMPTS.get(st.session_state.group, {}).get("name", "Asystent")
-        for i, turn in enumerate(st.session_state.conversation_history):
-            # Wiadomość użytkownika
-            if turn.get("user") is not None:
-                st.markdown(f"<div class='chat-user'><div>{turn['user']}</div></div>", unsafe_allow_html=True)
-            # Wiadomość bota (asystenta)
-            if turn.get("bot") is not None:
-                st.markdown(f"**{bot_name}**", unsafe_allow_html=True)
-                # Bot może mieć listę zdań do wyświetlenia z opóźnieniem
-                bot_sentences = turn["bot"] if isinstance(turn["bot"], list) else [turn["bot"]]
-                if st.session_state.shown_sentences.get(i, False):
-                    # Jeśli już wyświetliliśmy tę turę wcześniej, pokaż wszystkie zdania od razu
-                    for sentence in bot_sentences:
-                        st.markdown(f"<div class='chat-bot'><div>{sentence}</div></div>", unsafe_allow_html=True)
-                else:
-                    # Inaczej wyświetlamy zdania z opóźnieniem (40ms na znak)
-                    for sentence in bot_sentences:
-                        st.markdown(f"<div class='chat-bot'><div>{sentence}</div></div>", unsafe_allow_html=True)
-                        time.sleep(len(sentence) * 0.04)
-                    # Oznacz tę turę jako wyświetloną
-                    st.session_state.shown_sentences[i] = True
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        # --- 2) Pole do wpisywania wiadomości ---
-        # Placeholder dynamiczny: pierwsza wiadomość vs kolejne
-        if len(st.session_state.conversation_history) <= 1:
-            prompt_text = "Proszę wpisać pierwszą wiadomość, aby rozpocząć konwersację..."
-        else:
-            prompt_text = "Proszę wpisać wiadomość..."
-        user_input = st.chat_input(
-            prompt_text,
-            key="chat_input",
-            disabled=st.session_state.get("chat_input_disabled", False)
-        )
-
-        # --- 3) Timer i przycisk „Przejdź do oceny rozmowy” ---
-        timer_col, button_col = st.columns([1, 1])
-        # with timer_col:
-        #     if st.session_state.timer_active and st.session_state.timer_start_time:
-        #         elapsed = datetime.now() - st.session_state.timer_start_time
-        #         if elapsed < timedelta(minutes=3):
-        #             rem = timedelta(minutes=3) - elapsed
-        #             disp = f"Pozostało: {rem.seconds//60:02d}:{rem.seconds%60:02d}"
-        #         elif elapsed < timedelta(minutes=10):
-        #             extra = elapsed - timedelta(minutes=3)
-        #             disp = f"+{extra.seconds//60:02d}:{extra.seconds%60:02d}"
-        #         else:
-        #             disp = "+07:00"
-        #         st.markdown(f"Czas: **{disp}**")
-        #     else:
-        #         st.markdown("Czas: **––:––**")
-
-
-        with button_col:
-            if st.session_state.timer_active and st.session_state.timer_start_time:
-                elapsed = datetime.now() - st.session_state.timer_start_time
-
-                # Po 3 minutach:
-                if elapsed >= timedelta(minutes=3) and elapsed < timedelta(minutes=10):
-                    if st.button("Przejdź do oceny rozmowy"):
-                        # → 1) Zanim przejdziemy dalej, nadpisujemy aktualny wiersz
-                        row_idx = st.session_state.get("row_index")
-                        if row_idx:
-                            sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                            full_row = build_full_row_data()
-                            sheet.update(f"A{row_idx}:AN{row_idx}", [full_row])
-
-                        go_to(4)
-
-                # Po 10 minutach:
-                elif elapsed >= timedelta(minutes=10):
-                    st.session_state.chat_input_disabled = True
-                    st.markdown("**Czas rozmowy upłynął.**")
-                    if st.button("Przejdź do oceny rozmowy"):
-                        # → 2) Gdy czas się skończył, też zapisujemy wiersz
-                        row_idx = st.session_state.get("row_index")
-                        if row_idx:
-                            sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                            full_row = build_full_row_data()
-                            sheet.update(f"A{row_idx}:AN{row_idx}", [full_row])
-
-                        go_to(4)
-
-        # --- 4) Obsługa wpisania wiadomości przez użytkownika ---
-        if user_input and not st.session_state.get("chat_input_disabled", False):
-            # 4.1) Dodaj wiadomość użytkownika do historii
-            st.session_state.conversation_history.append({"user": user_input, "bot": None})
-            st.session_state.num_user_messages += 1
-
-            # 4.2) Uruchom timer przy pierwszej wiadomości (pierwsza wiadomość to indeks 1)
-            if not st.session_state.timer_active and len(st.session_state.conversation_history) == 2:
-                st.session_state.timer_start_time = datetime.now()
-                st.session_state.timer_active = True
-                st.session_state.conversation_end_time = (
-                    st.session_state.timer_start_time + timedelta(minutes=10)
-                )
-
-            # 4.3) Ustaw flagę procesowania odpowiedzi bota i odśwież widok
-            st.session_state.process_user_input = True
-            st.rerun()
-
-        # --- 5) Generowanie odpowiedzi asystenta po ustawieniu process_user_input ---
-        if st.session_state.get("process_user_input", False):
-            st.session_state.process_user_input = False
-
-            # Placeholder „pisanie...” dla bota
-            bot_response_placeholder = st.empty()
-            bot_response_placeholder.markdown(f"**{bot_name}**", unsafe_allow_html=True)
-            bot_response_placeholder.markdown("<div class='chat-bot'><div>[...]</div></div>", unsafe_allow_html=True)
-
-            model_to_use = DEFAULT_MODEL
-            system_prompt = DEFAULT_PROMPTS.get(st.session_state.group, {}).get("system_prompt", "")
-            messages = [{"role": "system", "content": system_prompt}]
-            for m in st.session_state.conversation_history:
-                if m.get("user") is not None:
-                    messages.append({"role": "user", "content": m["user"]})
-                if m.get("bot") is not None:
-                    bot_content = ". ".join(m["bot"]) if isinstance(m["bot"], list) else m["bot"]
-                    messages.append({"role": "assistant", "content": bot_content})
+        first_live_turn = update_chat_html(bot_name)
+        st.markdown(st.session_state.chat_html, unsafe_allow_html=True)
+
+        # Panel czatu (bieżące tury, pole wiadomości, timer, generowanie odpowiedzi) jest
+        # fragmentem: wysłanie wiadomości przelicza i wysyła tylko ten fragment, a nie historię.
+        @st.fragment
+        def chat_panel(first_live_turn: int):
+            # Przebieg samego fragmentu omija profil całego skryptu (ten jest już zamknięty)
+            if _run_profile is not None and _run_profile.stopped:
+                with get_profile_store().start(f"step{st.session_state.current_step}-fragment"):
+                    chat_panel_body(first_live_turn)
+            else:
+                chat_panel_body(first_live_turn)
+
+        def chat_panel_body(first_live_turn: int):
+            full_run = st.session_state.pop("chat_panel_full_run", False)
+            checkpoint_session()  # przebiegi samego fragmentu omijają zapis w main()
+            live_turns = len(st.session_state.conversation_history) - first_live_turn
+
+            def rerun_chat():
+                # Co kilka tur pełny przebieg przenosi bieżące tury do bloku historii
+                if full_run or live_turns >= CHAT_LIVE_TURNS_MAX:
+                    st.rerun()
+                st.rerun(scope="fragment")
+
+            # --- Bieżące tury (jeszcze nieprzeniesione do bloku historii) ---
+            for i in range(first_live_turn, len(st.session_state.conversation_history)):
+                turn = st.session_state.conversation_history[i]
+                # Wiadomość użytkownika
+                if turn.user is not None:
+                    st.markdown(f"<div class='chat-user'><div>{turn.user}</div></div>", unsafe_allow_html=True)
+                # Wiadomość bota (asystenta)
+                if turn.has_bot:
+                    st.markdown(f"<div class='chat-name'>{bot_name}</div>", unsafe_allow_html=True)
+                    # Bot może mieć listę zdań do wyświetlenia z opóźnieniem
+                    bot_sentences = turn.bot_sentences
+                    if turn.shown:
+                        # Jeśli już wyświetliliśmy tę turę wcześniej, pokaż wszystkie zdania od razu
+                        for sentence in bot_sentences:
+                            st.markdown(f"<div class='chat-bot'><div>{sentence}</div></div>", unsafe_allow_html=True)
+                    else:
+                        # Inaczej wyświetlamy zdania z opóźnieniem (40ms na znak) – odlicza przeglądarka
+                        st.markdown(typewriter_html(bot_sentences), unsafe_allow_html=True)
+                        # Oznacz tę turę jako wyświetloną
+                        turn.shown = True
+
+            # --- 2) Pole do wpisywania wiadomości ---
+            # Placeholder dynamiczny: pierwsza wiadomość vs kolejne
+            if len(st.session_state.conversation_history) <= 1:
+                prompt_text = "Proszę wpisać pierwszą wiadomość, aby rozpocząć konwersację..."
+            else:
+                prompt_text = "Proszę wpisać wiadomość..."
+            user_input = st.chat_input(
+                prompt_text,
+                key="chat_input",
+                disabled=st.session_state.get("chat_input_disabled", False)
+            )
 
-            try:
-                # 5.1) Pobranie kontekstu RAG
-                last_user_message = ""
-                for m in reversed(st.session_state.conversation_history):
-                    if m.get("user") is not None:
-                        last_user_message = m["user"]
-                        break
-                rag_query = f"{last_user_message} pseudohodowle dobrostan zwierząt petycja"
-                retrieved_context = search_rag(rag_query, k=TOP_K)
-                context_string = "\n".join([f"- {doc}" for doc in retrieved_context])
-                messages.insert(1, {
-                    "role": "system",
-                    "content": "Korzystaj TYLKO z poniższych fragmentów:\n" +
-                            "\n".join(f"- {d}" for d in retrieved_context)
-                })
-                # 5.2) Wywołanie API OpenAI
-                with st.spinner(""):
-                    resp = client.chat.completions.create(
-                        model=model_to_use,
-                        messages=messages,
-                        temperature=0.4
-                    )
-                bot_text = resp.choices[0].message.content
-                bot_response_placeholder.empty()
-
-                # 5.3) Wywołanie API OpenAI bez zmian
-                with st.spinner(""):
-                    resp = client.chat.completions.create(
-                        model=model_to_use,
-                        messages=messages,
-                        temperature=0.4
+            # --- 3) Timer i przycisk „Przejdź do oceny rozmowy” ---
+            timer_col, button_col = st.columns([1, 1])
+            # with timer_col:
+            #     if st.session_state.timer_active and st.session_state.timer_start_time:
+            #         elapsed = datetime.now() - st.session_state.timer_start_time
+            #         if elapsed < timedelta(minutes=3):
+            #             rem = timedelta(minutes=3) - elapsed
+            #             disp = f"Pozostało: {rem.seconds//60:02d}:{rem.seconds%60:02d}"
+            #         elif elapsed < timedelta(minutes=10):
+            #             extra = elapsed - timedelta(minutes=3)
+            #             disp = f"+{extra.seconds//60:02d}:{extra.seconds%60:02d}"
+            #         else:
+            #             disp = "+07:00"
+            #         st.markdown(f"Czas: **{disp}**")
+            #     else:
+            #         st.markdown("Czas: **––:––**")
+
+
+            with button_col:
+                if st.session_state.timer_active and st.session_state.timer_start_time:
+                    elapsed = datetime.now() - st.session_state.timer_start_time
+
+                    # Po 3 minutach:
+                    if elapsed >= timedelta(minutes=3) and elapsed < timedelta(minutes=10):
+                        if st.button("Przejdź do oceny rozmowy"):
+                            # → 1) Zanim przejdziemy dalej, nadpisujemy aktualny wiersz
+                            row_idx = st.session_state.get("row_index")
+                            if row_idx:
+                                sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                                save_full_row(sheet, row_idx)
+
+                            go_to(4)
+                            st.rerun()  # zmiana kroku wymaga przebiegu całej aplikacji
+
+                    # Po 10 minutach:
+                    elif elapsed >= timedelta(minutes=10):
+                        st.session_state.chat_input_disabled = True
+                        st.markdown("**Czas rozmowy upłynął.**")
+                        if st.button("Przejdź do oceny rozmowy"):
+                            # → 2) Gdy czas się skończył, też zapisujemy wiersz
+                            row_idx = st.session_state.get("row_index")
+                            if row_idx:
+                                sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                                save_full_row(sheet, row_idx)
+
+                            go_to(4)
+                            st.rerun()  # zmiana kroku wymaga przebiegu całej aplikacji
+
+            # --- 4) Obsługa wpisania wiadomości przez użytkownika ---
+            if user_input and not st.session_state.get("chat_input_disabled", False):
+                # Limit wiadomości na minutę: jeden uczestnik nie może zająć kolejki API pozostałym
+                retry_after = get_message_limiter().retry_after(st.session_state.participant_id)
+                if retry_after > 0:
+                    st.warning(f"Wysyłasz wiadomości zbyt szybko. Spróbuj ponownie za {retry_after:.0f} s.")
+                    st.stop()
+                get_message_limiter().record(st.session_state.participant_id)
+
+                # 4.1) Dodaj wiadomość użytkownika do historii
+                st.session_state.conversation_history.append_user(user_input)
+                st.session_state.num_user_messages += 1
+
+                # 4.2) Uruchom timer przy pierwszej wiadomości (pierwsza wiadomość to indeks 1)
+                if not st.session_state.timer_active and len(st.session_state.conversation_history) == 2:
+                    st.session_state.timer_start_time = datetime.now()
+                    st.session_state.timer_active = True
+                    st.session_state.conversation_end_time = (
+                        st.session_state.timer_start_time + timedelta(minutes=10)
                     )
-                bot_text = resp.choices[0].message.content
-                bot_response_placeholder.empty()
-
-
 
-                # === PRZYWRACAMY ORYGINALNE PODZIELENIE ODPOWIEDZI NA ZDANIA ===
-                import re
-                # 1) Rozbij odpowiedź bota na zdania (regex tak jak wcześniej)
-                sentences = re.findall(r'.+?[.!?](?=\s|$)', bot_text)
+                # 4.3) Ustaw flagę procesowania odpowiedzi bota i odśwież widok
+                st.session_state.process_user_input = True
+                rerun_chat()
+
+            # --- 5) Generowanie odpowiedzi asystenta po ustawieniu process_user_input ---
+            if st.session_state.get("process_user_input", False):
+                st.session_state.process_user_input = False
+                turn_start = time.perf_counter()  # początek budżetu czasu tej tury
+
+                # Placeholder „pisanie...” dla bota
+                bot_response_placeholder = st.empty()
+                bot_response_placeholder.markdown(f"**{bot_name}**", unsafe_allow_html=True)
+                bot_response_placeholder.markdown("<div class='chat-bot'><div>[...]</div></div>", unsafe_allow_html=True)
+
+                model_to_use = DEFAULT_MODEL
+                system_prompt = DEFAULT_PROMPTS.get(st.session_state.group, {}).get("system_prompt", "")
+
+                try:
+                    # 5.1) Pobranie kontekstu RAG
+                    last_user_message = st.session_state.conversation_history.last_user_message()
+                    retrieved_context, st.session_state.query_history = retrieve_context(
+                        last_user_message, turn_start, st.session_state.get("query_history"))
+                    messages = build_chat_messages(
+                        system_prompt, st.session_state.conversation_history, retrieved_context)
+                    # Gdy limit API jest wyczerpany, uczestnik widzi swoją pozycję w kolejce
+                    def show_queue(position: int, wait_s: float):
+                        bot_response_placeholder.markdown(
+                            f"<div class='chat-bot'><div>[...] Dużo osób rozmawia teraz z asystentem – "
+                            f"miejsce w kolejce: {position + 1}, szacowany czas oczekiwania: ok. {wait_s:.0f} s</div></div>",
+                            unsafe_allow_html=True,
+                        )
+
+                    # 5.2) Wywołanie API OpenAI
+                    with st.spinner(""):
+                        resp = create_chat_completion(
+                            st.session_state.participant_id,
+                            messages,
+                            on_wait=show_queue,
+                            model=model_to_use,
+                            temperature=0.4
+                        )
+                    bot_text = resp.choices[0].message.content
+                    bot_response_placeholder.empty()
+
+
+
+                    # 1–2) Rozbij odpowiedź bota na zdania bez końcowych kropek (sentence_segmenter.py:
+                    #      polskie skróty, punkty list, tekst bez końcowej interpunkcji)
+                    sentences = split_sentences(bot_text)
+
+                    # 3) Dodajemy całą listę 'sentences' jako jedną turę bota
+                    #    (najnowszy wpis w historii to zawsze użytkownik – odpowiedź trafia do tej tury);
+                    # 4) tura jest oznaczona jako jeszcze NIE wyświetlona (Turn.shown = False)
+                    st.session_state.conversation_history.append_bot(sentences)
+
+                    # 5) Odśwież widok, by w następnym przebiegu pokazać pierwsze zdanie z listy
+                    rerun_chat()
+
+
+                except Exception as e:
+                    from llm_limiter import AdmissionTimeout
+                    from llm_resilience import LLMUnavailableError
+                    if isinstance(e, (LLMUnavailableError, AdmissionTimeout)):
+                        # Upstream niedostępny lub przeciążony – bez szczegółów technicznych w czacie
+                        logger.warning("LLM niedostępny: %s", e)
+                        error_message = "Asystent jest chwilowo niedostępny. Spróbuj wysłać wiadomość ponownie za chwilę."
+                    else:
+                        st.error(f"Wystąpił błąd podczas generowania odpowiedzi: {e}")
+                        error_message = f"Błąd: {e}"
+                    st.session_state.conversation_history.append_bot(error_message)
+                    rerun_chat()
+
+        st.session_state.chat_panel_full_run = True
+        chat_panel(first_live_turn)
 
-                # 2) Oczyść każde zdanie (usuń nadmiarowe kropki i spacje)
-                cleaned = []
-                for s in sentences:
-                    s = s.strip()
-                    s = re.sub(r'\.+$', '', s)
-                    cleaned.append(s)
-                sentences = cleaned
-
-                # 3) Dodajemy całą listę 'sentences' jako jedną turę bota:
-                #    (najnowszy wpis w historii to zawsze użytkownik – dopiszemy tam 'bot': [sentences])
-                if st.session_state.conversation_history and \
-                   st.session_state.conversation_history[-1].get("user") is not None:
-                    st.session_state.conversation_history[-1]["bot"] = sentences
-                else:
-                    st.session_state.conversation_history.append({"user": None, "bot": sentences})
-
-                # 4) Oznacz, że ta tura bota jeszcze NIE została wyświetlona
-                last_index = len(st.session_state.conversation_history) - 1
-                st.session_state.shown_sentences[last_index] = False
-
-                # 5) Odśwież widok, by w następnym przebiegu pokazać pierwsze zdanie z listy
-                st.rerun()
-
-
-            except Exception as e:
-                st.error(f"Wystąpił błąd podczas generowania odpowiedzi: {e}")
-                error_message = f"Błąd: {e}"
-                if (
-                    st.session_state.conversation_history
-                    and st.session_state.conversation_history[-1].get("bot") is None
-                ):
-                    st.session_state.conversation_history[-1]["bot"] = error_message
-                else:
-                    st.session_state.conversation_history.append({"user": None, "bot": error_message})
-                st.rerun()
 
         # # --- Przycisk "Dalej" do przejścia do następnego kroku ---
         # st.button(
@@ -1237,10 +1734,8 @@ Prosimy o ocenę chatbota, z którym rozmawiałeś, na poniższej skali. Zaznacz
             key="next_4",
             on_click=lambda: [
                 # 1) Najpierw nadpisujemy wiersz aktualnymi danymi (w tym BUS-11)
-                _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1.update(
-                    f"A{st.session_state['row_index']}:AN{st.session_state['row_index']}",
-                    [build_full_row_data()]
-                ),
+                save_full_row(get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1,
+                              st.session_state['row_index']),
                 # 2) Dopiero przechodzimy do kroku 5 (Decyzja o petycji)
                 go_to(5)
             ],
@@ -1283,8 +1778,8 @@ Prosimy o ocenę chatbota, z którym rozmawiałeś, na poniższej skali. Zaznacz
             # → Nadpisanie wiersza, aby zapisać kolumnę AL="Tak"
             row_idx = st.session_state.get("row_index")
             if row_idx:
-                sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                sheet.update(f"A{row_idx}:AN{row_idx}", [build_full_row_data()])
+                sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                save_full_row(sheet, row_idx)
 
         def save_petition_no():
             st.session_state.decision = "Nie"
@@ -1292,8 +1787,8 @@ Prosimy o ocenę chatbota, z którym rozmawiałeś, na poniższej skali. Zaznacz
             # → Nadpisanie wiersza, aby zapisać kolumnę AL="Nie"
             row_idx = st.session_state.get("row_index")
             if row_idx:
-                sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                sheet.update(f"A{row_idx}:AN{row_idx}", [build_full_row_data()])
+                sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                save_full_row(sheet, row_idx)
 
             go_to(6)
 
@@ -1388,9 +1883,8 @@ Prosimy o ocenę chatbota, z którym rozmawiałeś, na poniższej skali. Zaznacz
             try:
                 row_idx = st.session_state.get("row_index")
                 if row_idx:
-                    sheet = _gspread_client.open_by_key(GDRIVE_SHEET_ID).sheet1
-                    full_row = build_full_row_data()
-                    sheet.update(f"A{row_idx}:AN{row_idx}", [full_row])
+                    sheet = get_gspread_client().open_by_key(GDRIVE_SHEET_ID).sheet1
+                    save_full_row(sheet, row_idx)
                 st.session_state.current_step = 7
 
             except Exception as e:
@@ -1419,7 +1913,18 @@ Prosimy o ocenę chatbota, z którym rozmawiałeś, na poniższej skali. Zaznacz
             """
         )
         # opcjonalnie jakieś grafiki, linki, itp.
+
+        # Wiersz jest już zapisany – sesja, która zostanie otwarta, nie musi trzymać danych badania
+        if "conversation_history" in st.session_state:
+            release_finished_session()
+            report_session_memory()
+            checkpoint_session()
         return
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Także przy st.rerun()/st.stop(), które kończą przebieg wyjątkiem
+        if _run_profile is not None:
+            _run_profile.stop()
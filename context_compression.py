@@ -0,0 +1,126 @@
+"""
+Ekstrakcyjna kompresja kontekstu: do promptu trafiają tylko zdania fragmentów
+najbardziej podobne do zapytania.
+
+Embeddingi zdań liczone są raz, przy budowie wersji korpusu (corpus_store.py),
+i zapisywane obok indeksu. W gorącej ścieżce wystarcza iloczyn skalarny z
+embeddingiem zapytania, który i tak powstaje przy wyszukiwaniu – bez
+dodatkowego wywołania modelu.
+"""
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SENTENCES_JSON = "sentences.json"
+SENTENCES_NPY = "sentences.npy"
+
+# Zdanie kończy się na . ! ? (lub nowej linii), po których jest spacja i wielka litera/cyfra
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-ZĄĆĘŁŃÓŚŹŻ0-9„\"(])|\n\s*\n")
+MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text: str) -> List[str]:
+    """Dzieli fragment na zdania; bardzo krótkie kawałki dokleja do poprzedniego zdania."""
+    sentences: List[str] = []
+    for part in _SENTENCE_BOUNDARY.split(text):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        if sentences and len(part) < MIN_SENTENCE_CHARS:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class SentenceStore:
+    """Zdania wszystkich fragmentów wersji korpusu i ich znormalizowane embeddingi."""
+
+    def __init__(self, rows: List[Tuple[str, str]], vectors: np.ndarray, id_fn: Callable[[Any], int]):
+        self.rows = rows  # (chunk_id, zdanie)
+        self.vectors = _normalize(vectors) if len(rows) else np.zeros((0, 0), dtype=np.float32)
+        self.rows_by_chunk: Dict[int, List[int]] = {}
+        for row, (chunk_id, _) in enumerate(rows):
+            self.rows_by_chunk.setdefault(id_fn(chunk_id), []).append(row)
+
+    @classmethod
+    def build(cls, chunks: Sequence[Dict[str, Any]], embed_fn: Callable[[List[str]], np.ndarray],
+              id_fn: Callable[[Any], int]) -> "SentenceStore":
+        rows = [(str(c["id"]), sentence) for c in chunks for sentence in split_sentences(c["text"])]
+        vectors = embed_fn([sentence for _, sentence in rows]) if rows else np.zeros((0, 0))
+        return cls(rows, vectors, id_fn)
+
+    @classmethod
+    def load(cls, path: str, id_fn: Callable[[Any], int]) -> Optional["SentenceStore"]:
+        json_path = os.path.join(path, SENTENCES_JSON)
+        npy_path = os.path.join(path, SENTENCES_NPY)
+        if not (os.path.exists(json_path) and os.path.exists(npy_path)):
+            return None
+        with open(json_path, "r", encoding="utf-8") as f:
+            rows = [tuple(r) for r in json.load(f)]
+        return cls(rows, np.load(npy_path), id_fn)
+
+    def save(self, path: str) -> None:
+        with open(os.path.join(path, SENTENCES_JSON), "w", encoding="utf-8") as f:
+            json.dump(self.rows, f, ensure_ascii=False)
+        np.save(os.path.join(path, SENTENCES_NPY), self.vectors)
+
+    def without_chunks(self, chunk_int_ids: set, id_fn: Callable[[Any], int]) -> "SentenceStore":
+        keep = [i for i, (chunk_id, _) in enumerate(self.rows) if id_fn(chunk_id) not in chunk_int_ids]
+        return SentenceStore([self.rows[i] for i in keep], self.vectors[keep], id_fn)
+
+    def merged_with(self, other: "SentenceStore", id_fn: Callable[[Any], int]) -> "SentenceStore":
+        if not other.rows:
+            return self
+        if not self.rows:
+            return other
+        return SentenceStore(self.rows + other.rows, np.vstack([self.vectors, other.vectors]), id_fn)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def compress(self, query_embedding: np.ndarray, chunk_ids: Sequence[int],
+                 budget_chars: int, fallback: Callable[[int], Optional[str]]) -> List[str]:
+        """
+        Wybiera zdania o największym podobieństwie cosinusowym do zapytania,
+        aż do wyczerpania `budget_chars`. Wynik: po jednym wpisie na fragment
+        (w kolejności wyszukiwania), zdania w oryginalnej kolejności.
+        Fragmenty bez zapisanych zdań są brane w całości przez `fallback`.
+        """
+        candidate_rows = [row for cid in chunk_ids for row in self.rows_by_chunk.get(int(cid), [])]
+        if not candidate_rows:
+            return [t for t in (fallback(int(cid)) for cid in chunk_ids) if t]
+
+        query = _normalize(query_embedding).reshape(-1)
+        scores = self.vectors[candidate_rows] @ query
+        selected: set = set()
+        used = 0
+        for position in np.argsort(-scores):
+            row = candidate_rows[position]
+            length = len(self.rows[row][1]) + 1
+            if used + length > budget_chars and selected:
+                continue
+            selected.add(row)
+            used += length
+
+        compressed = []
+        for cid in chunk_ids:
+            rows = self.rows_by_chunk.get(int(cid))
+            if rows is None:
+                text = fallback(int(cid))
+                if text:
+                    compressed.append(text)
+                continue
+            kept = [self.rows[r][1] for r in rows if r in selected]
+            if kept:
+                compressed.append(" ".join(kept))
+        return compressed
@@ -0,0 +1,225 @@
+"""
+Wykrywanie i scalanie prawie-duplikatów fragmentów przy budowie indeksu.
+
+Fragmenty to często nakładające się okna tekstu petycji i powtórzone
+postulaty ("1. uzupełnienie i dostosowanie definicji legalnych;"), które
+zajmują miejsca w top-k. Procedura:
+
+1. dokładne duplikaty po normalizacji tekstu,
+2. MinHash na 3-gramach słów + LSH (pasma) wyznaczają pary kandydatów;
+   krótkie fragmenty (np. pojedyncze postulaty) dostają dodatkowo kandydatów
+   z indeksu odwróconego n-gramów, bo LSH nie wykrywa zawierania w dłuższym tekście,
+3. para jest scalana, gdy podobieństwo Jaccarda >= `threshold` albo krótszy
+   fragment zawiera się w dłuższym (containment >= `containment`).
+
+Grupy (union-find) zastępuje najdłuższy fragment; zachowuje on sumę etykiet
+ról i listę id źródłowych fragmentów.
+
+    python corpus_dedup.py --source RAG/roles_cache.json
+    python corpus_dedup.py --source "RAG/rag old/summaries.json" --out dedup.json
+"""
+import argparse
+import json
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def shingles(text: str, size: int = 3) -> Set[int]:
+    """Zbiór hashy n-gramów słów (krótkie teksty: pojedyncze słowa)."""
+    words = normalize_text(text).split()
+    if len(words) < size:
+        grams = words or [""]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {zlib.crc32(g.encode("utf-8")) for g in grams}
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 7):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, (1 << 31) - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(0, (1 << 31) - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingle_set: Set[int]) -> np.ndarray:
+        values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        # (a*x + b) mod p, obcięte do 32 bitów; minimum po n-gramach dla każdej permutacji
+        hashed = (np.outer(values, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=0)
+
+
+def lsh_candidates(signatures: np.ndarray, bands: int) -> Set[Tuple[int, int]]:
+    """Pary dokumentów, które mają identyczne co najmniej jedno pasmo sygnatury."""
+    rows = signatures.shape[1] // bands
+    pairs: Set[Tuple[int, int]] = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for doc, key in enumerate(block):
+            buckets.setdefault(key.tobytes(), []).append(doc)
+        for members in buckets.values():
+            if len(members) > 1:
+                for i in range(len(members)):
+                    for j in range(i + 1, len(members)):
+                        pairs.add((members[i], members[j]))
+    return pairs
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int) -> None:
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+def containment_candidates(sets: Sequence[Set[int]], max_short: int, containment: float) -> Set[Tuple[int, int]]:
+    """Pary (krótki, dowolny), w których krótki fragment prawie w całości występuje w drugim."""
+    short = [i for i, s in enumerate(sets) if len(s) <= max_short]
+    wanted = set().union(*(sets[i] for i in short)) if short else set()
+    postings: Dict[int, List[int]] = {}
+    for doc, shingle_set in enumerate(sets):
+        for shingle in shingle_set & wanted:
+            postings.setdefault(shingle, []).append(doc)
+
+    pairs: Set[Tuple[int, int]] = set()
+    for i in short:
+        overlap: Dict[int, int] = {}
+        for shingle in sets[i]:
+            for doc in postings.get(shingle, ()):
+                if doc != i:
+                    overlap[doc] = overlap.get(doc, 0) + 1
+        for doc, count in overlap.items():
+            if count / len(sets[i]) >= containment:
+                pairs.add((min(i, doc), max(i, doc)))
+    return pairs
+
+
+def deduplicate(chunks: Sequence[Dict[str, Any]], threshold: float = 0.8, containment: float = 0.9,
+                num_perm: int = 64, bands: int = 16, max_short: int = 40) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Zwraca (scalone fragmenty, statystyki). Fragment wejściowy: {"id", "text"[, "roles"]}.
+    Fragment wynikowy ma dodatkowo "source_ids" (id wszystkich scalonych fragmentów)
+    i "roles" (suma etykiet ról, w kolejności pierwszego wystąpienia).
+    """
+    n = len(chunks)
+    uf = _UnionFind(n)
+
+    # 1) Dokładne duplikaty po normalizacji
+    first_by_text: Dict[str, int] = {}
+    for i, chunk in enumerate(chunks):
+        key = normalize_text(chunk["text"])
+        if key in first_by_text:
+            uf.union(first_by_text[key], i)
+        else:
+            first_by_text[key] = i
+    exact = n - len(first_by_text)
+
+    # 2) MinHash + LSH
+    sets = [shingles(c["text"]) for c in chunks]
+    hasher = MinHasher(num_perm)
+    signatures = np.vstack([hasher.signature(s) for s in sets]) if n else np.zeros((0, num_perm))
+    candidates = lsh_candidates(signatures, bands) if n else set()
+    candidates |= containment_candidates(sets, max_short, containment)
+
+    # 3) Weryfikacja kandydatów dokładnym Jaccardem / zawieraniem. Zawieranie nie jest
+    #    przechodnie: krótki fragment dołącza tylko do jednego (najlepszego) dłuższego,
+    #    żeby nie skleić dwóch różnych fragmentów, które akurat cytują ten sam postulat.
+    near = 0
+    absorbed: Dict[int, Tuple[float, int]] = {}
+    for i, j in sorted(candidates):
+        inter = len(sets[i] & sets[j])
+        jaccard = inter / len(sets[i] | sets[j])
+        if jaccard >= threshold:
+            if uf.find(i) != uf.find(j):
+                uf.union(i, j)
+                near += 1
+            continue
+        small, big = (i, j) if len(sets[i]) <= len(sets[j]) else (j, i)
+        contained = inter / len(sets[small])
+        if contained >= containment and contained > absorbed.get(small, (0.0, -1))[0]:
+            absorbed[small] = (contained, big)
+    for small, (_, big) in absorbed.items():
+        if uf.find(small) != uf.find(big):
+            uf.union(small, big)
+            near += 1
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(uf.find(i), []).append(i)
+
+    merged = []
+    for members in sorted(groups.values(), key=lambda m: m[0]):
+        representative = max(members, key=lambda i: (len(chunks[i]["text"]), -i))
+        roles: List[str] = []
+        source_ids: List[str] = []
+        for i in members:
+            source_ids.extend(chunks[i].get("source_ids") or [str(chunks[i]["id"])])
+            for role in chunks[i].get("roles", []):
+                if role not in roles:
+                    roles.append(role)
+        merged.append({
+            "id": str(chunks[representative]["id"]),
+            "text": chunks[representative]["text"],
+            "roles": roles,
+            "source_ids": source_ids,
+        })
+
+    stats = {
+        "input": n,
+        "output": len(merged),
+        "exact_duplicates": exact,
+        "near_duplicate_merges": near,
+        "lsh_candidates": len(candidates),
+    }
+    return merged, stats
+
+
+def read_chunks(path: str) -> List[Dict[str, Any]]:
+    """Czyta summaries.json (lista {"id", "content"}) lub roles_cache.json ({tekst: [role]})."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return [{"id": str(i), "text": text, "roles": list(roles)}
+                for i, (text, roles) in enumerate(data.items())]
+    return [{"id": str(item.get("id", i)), "text": item.get("content", item.get("text", "")),
+             "roles": list(item.get("roles", []))}
+            for i, item in enumerate(data)]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Deduplikacja fragmentów korpusu RAG (MinHash/LSH)")
+    parser.add_argument("--source", required=True)
+    parser.add_argument("--out", help="Zapisz scalone fragmenty do pliku JSON")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Próg podobieństwa Jaccarda")
+    parser.add_argument("--containment", type=float, default=0.9, help="Próg zawierania krótszego fragmentu")
+    args = parser.parse_args(argv)
+
+    merged, stats = deduplicate(read_chunks(args.source), args.threshold, args.containment)
+    print(json.dumps(stats, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(merged, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Wersjonowany katalog korpusu RAG z możliwością podmiany bez restartu aplikacji.
+
+Układ katalogu (domyślnie RAG/corpus):
+
+    RAG/corpus/
+        v20250701-120000/
+            chunks.json      – lista {"id": ..., "text": ...}
+            index.faiss      – IndexIDMap2: wektory kluczowane stabilnymi id fragmentów
+            sentences.json   – opcjonalnie: zdania fragmentów (kompresja kontekstu)
+            sentences.npy    – opcjonalnie: ich embeddingi, liczone raz przy budowie
+            manifest.json    – zapisywany na końcu: hash treści, wymiar, typ indeksu, liczba fragmentów
+
+Nowa wersja jest budowana w katalogu tymczasowym i przenoszona pod docelową
+nazwę jednym `os.rename`, więc obserwator nigdy nie widzi wersji w połowie
+zapisu. Obserwator (CorpusWatcher) sprawdza spójność (rozmiar indeksu ==
+liczba fragmentów == manifest) i dopiero wtedy przekazuje wersję dalej.
+
+    python corpus_store.py import-legacy --json "RAG/rag old/summaries.json" --index "RAG/rag old/summaries.index"
+    python corpus_store.py build --json "RAG/rag old/summaries.json"
+    python corpus_store.py build --json RAG/roles_cache.json --dedup
+    python corpus_store.py upsert --json nowe_fragmenty.json
+    python corpus_store.py remove --ids 21 22
+
+Wektory są kluczowane polem `id` z summaries.json (int64 w FAISS), więc
+dodanie, usunięcie lub podmiana fragmentu dotyka tylko zmienionych
+wektorów – bez przeliczania całego korpusu.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from context_compression import SentenceStore
+from corpus_dedup import deduplicate, read_chunks
+
+logger = logging.getLogger("conversbot.corpus")
+
+CORPUS_DIR = os.environ.get("RAG_CORPUS_DIR", "RAG/corpus")
+MANIFEST_NAME = "manifest.json"
+CHUNKS_NAME = "chunks.json"
+INDEX_NAME = "index.faiss"
+
+
+class CorpusError(Exception):
+    """Niespójna lub niekompletna wersja korpusu."""
+
+
+def chunk_int_id(chunk_id: Any) -> int:
+    """Stabilne id int64 dla FAISS: liczba wprost, inne napisy – 63-bitowy skrót."""
+    text = str(chunk_id)
+    if text.isdigit():
+        return int(text)
+    return int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big") & ((1 << 63) - 1)
+
+
+def index_ids(index) -> np.ndarray:
+    """Id zapisane w IndexIDMap/IndexIDMap2 (dla zwykłego indeksu: pozycje wierszy)."""
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CorpusVersion:
+    """Niemodyfikowalny komplet: fragmenty + indeks jednej wersji korpusu."""
+
+    def __init__(self, version: str, manifest: Dict[str, Any], chunks: List[Dict[str, Any]], index,
+                 sentences: Optional[SentenceStore] = None):
+        self.version = version
+        self.manifest = manifest
+        self.chunks: List[Dict[str, Any]] = chunks
+        # id FAISS -> treść fragmentu; rozwiązywanie wyników wyszukiwania w O(1)
+        self.text_by_id: Dict[int, str] = {chunk_int_id(c["id"]): c["text"] for c in chunks}
+        self.index = index
+        # Zdania i ich embeddingi do kompresji kontekstu (None = wysyłamy całe fragmenty)
+        self.sentences = sentences
+        # normalize_query(rag_query) -> (ids, embedding zapytania); wypełniane przed podmianą
+        self.precomputed: Dict[str, Any] = {}
+
+    def search(self, embeddings, k: int):
+        return self.index.search(np.ascontiguousarray(embeddings, dtype=np.float32), k)
+
+    def resolve(self, ids) -> List[str]:
+        """Zamienia id zwrócone przez FAISS na treści (pomija -1 i nieznane id)."""
+        texts = []
+        for chunk_id in ids:
+            text = self.text_by_id.get(int(chunk_id))
+            if text is not None:
+                texts.append(text)
+        return texts
+
+    def __len__(self) -> int:
+        return len(self.text_by_id)
+
+
+def load_version(path: str) -> CorpusVersion:
+    """Wczytuje wersję i sprawdza jej spójność z manifestem."""
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise CorpusError(f"Brak {MANIFEST_NAME} w {path}")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    chunks_path = os.path.join(path, CHUNKS_NAME)
+    if content_hash(chunks_path) != manifest["content_hash"]:
+        raise CorpusError(f"Hash {CHUNKS_NAME} nie zgadza się z manifestem ({path})")
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    index = faiss.read_index(os.path.join(path, INDEX_NAME))
+
+    if not (index.ntotal == len(chunks) == manifest["chunk_count"]):
+        raise CorpusError(
+            f"Niespójna wersja {path}: indeks {index.ntotal}, fragmenty {len(chunks)}, "
+            f"manifest {manifest['chunk_count']}")
+    if set(index_ids(index).tolist()) != {chunk_int_id(c["id"]) for c in chunks}:
+        raise CorpusError(f"Id w indeksie nie odpowiadają id fragmentów ({path})")
+    if index.d != manifest["dim"]:
+        raise CorpusError(f"Wymiar indeksu {index.d} != manifest {manifest['dim']} ({path})")
+    sentences = SentenceStore.load(path, chunk_int_id)
+    return CorpusVersion(os.path.basename(path.rstrip(os.sep)), manifest, chunks, index, sentences)
+
+
+def list_versions(root: str = CORPUS_DIR) -> List[str]:
+    """Nazwy kompletnych wersji (z manifestem), od najstarszej do najnowszej."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(".") and os.path.exists(os.path.join(root, name, MANIFEST_NAME))
+    )
+
+
+def latest_version_path(root: str = CORPUS_DIR) -> Optional[str]:
+    versions = list_versions(root)
+    return os.path.join(root, versions[-1]) if versions else None
+
+
+def write_version(chunks: List[Dict[str, Any]], index, root: str = CORPUS_DIR,
+                  source: str = "", version: Optional[str] = None,
+                  sentences: Optional[SentenceStore] = None) -> str:
+    """Zapisuje nową wersję atomowo (katalog tymczasowy + rename); zwraca ścieżkę."""
+    if index.ntotal != len(chunks):
+        raise CorpusError(f"Rozmiar indeksu {index.ntotal} != liczba fragmentów {len(chunks)}")
+    if len({chunk_int_id(c["id"]) for c in chunks}) != len(chunks):
+        raise CorpusError("Zduplikowane id fragmentów")
+    version = version or datetime.now().strftime("v%Y%m%d-%H%M%S")
+    final_path = os.path.join(root, version)
+    if os.path.exists(final_path):
+        raise CorpusError(f"Wersja {version} już istnieje")
+    tmp_path = os.path.join(root, f".tmp-{version}")
+    os.makedirs(tmp_path, exist_ok=False)
+    try:
+        chunks_path = os.path.join(tmp_path, CHUNKS_NAME)
+        with open(chunks_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        faiss.write_index(index, os.path.join(tmp_path, INDEX_NAME))
+        if sentences is not None:
+            sentences.save(tmp_path)
+        manifest = {
+            "version": version,
+            "content_hash": content_hash(chunks_path),
+            "dim": index.d,
+            "index_type": type(index).__name__,
+            "chunk_count": len(chunks),
+            "sentence_count": len(sentences) if sentences is not None else 0,
+            "created_at": datetime.now().isoformat(),
+            "source": source,
+        }
+        with open(os.path.join(tmp_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.rename(tmp_path, final_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return final_path
+
+
+def read_source_chunks(json_path: str) -> List[Dict[str, Any]]:
+    """Czyta fragmenty z summaries.json ({"id", "content"}) lub roles_cache.json ({tekst: [role]})."""
+    return read_chunks(json_path)
+
+
+def build_id_index(embeddings: np.ndarray, chunk_ids: List[Any]):
+    """IndexIDMap2(IndexFlatL2) z wektorami kluczowanymi id fragmentów."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(embeddings.shape[1]))
+    index.add_with_ids(embeddings, np.array([chunk_int_id(c) for c in chunk_ids], dtype=np.int64))
+    return index
+
+
+def wrap_positional_index(index, chunk_ids: List[Any]):
+    """Przepisuje stary indeks (wiersz i = fragment i) na IndexIDMap2 bez ponownego embeddingu."""
+    return build_id_index(index.reconstruct_n(0, index.ntotal), chunk_ids)
+
+
+def apply_changes(base: CorpusVersion, upserts: List[Dict[str, Any]], remove_ids: List[Any],
+                  embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None):
+    """
+    Zwraca (chunks, index, sentences) nowej wersji: usuwa `remove_ids`, a dla
+    `upserts` usuwa stare wektory o tych id i dodaje nowe. Liczone są embeddingi
+    tylko zmienionych fragmentów (i ich zdań); pozostałe wektory są kopiowane
+    z wersji bazowej.
+    """
+    index = faiss.clone_index(base.index)
+    changed = {chunk_int_id(c["id"]) for c in upserts} | {chunk_int_id(i) for i in remove_ids}
+    if changed:
+        index.remove_ids(faiss.IDSelectorBatch(np.array(sorted(changed), dtype=np.int64)))
+    if upserts:
+        if embed_fn is None:
+            raise CorpusError("Dodanie fragmentów wymaga funkcji embeddingu")
+        vectors = np.ascontiguousarray(embed_fn([c["text"] for c in upserts]), dtype=np.float32)
+        index.add_with_ids(vectors, np.array([chunk_int_id(c["id"]) for c in upserts], dtype=np.int64))
+
+    upsert_by_id = {chunk_int_id(c["id"]): {"id": str(c["id"]), "text": c["text"]} for c in upserts}
+    chunks = [c for c in base.chunks if chunk_int_id(c["id"]) not in changed]
+    chunks.extend(upsert_by_id.values())
+
+    sentences = None
+    if base.sentences is not None:
+        sentences = base.sentences.without_chunks(changed, chunk_int_id)
+        if upserts:
+            added = SentenceStore.build(list(upsert_by_id.values()), embed_fn, chunk_int_id)
+            sentences = sentences.merged_with(added, chunk_int_id)
+    return chunks, index, sentences
+
+
+class CorpusWatcher:
+    """
+    Wątek sprawdzający co `interval` sekund, czy pojawiła się nowsza wersja.
+    `on_new_version` dostaje już wczytaną i sprawdzoną CorpusVersion.
+    """
+
+    def __init__(self, root: str, current_version: Optional[str],
+                 on_new_version: Callable[[CorpusVersion], None], interval: float = 10.0):
+        self.root = root
+        self.current_version = current_version
+        self.on_new_version = on_new_version
+        self.interval = interval
+        self._rejected: set = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="corpus-watcher", daemon=True)
+
+    def start(self) -> "CorpusWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def check_once(self) -> bool:
+        versions = list_versions(self.root)
+        if not versions:
+            return False
+        newest = versions[-1]
+        if newest == self.current_version or newest in self._rejected:
+            return False
+        if self.current_version is not None and newest < self.current_version:
+            return False
+        try:
+            version = load_version(os.path.join(self.root, newest))
+        except (CorpusError, OSError, RuntimeError, ValueError, KeyError) as e:
+            logger.error("Odrzucono wersję korpusu %s: %s", newest, e)
+            self._rejected.add(newest)
+            return False
+        self.on_new_version(version)
+        self.current_version = newest
+        logger.info("Podmieniono korpus na %s (%d fragmentów)", newest, len(version))
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check_once()
+            except Exception as e:  # obserwator nie może zatrzymać aplikacji
+                logger.exception("Błąd obserwatora korpusu: %s", e)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Budowanie wersji korpusu RAG")
+    parser.add_argument("--root", default=CORPUS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_legacy = sub.add_parser("import-legacy", help="Spakuj istniejące summaries.json + summaries.index")
+    p_legacy.add_argument("--json", required=True)
+    p_legacy.add_argument("--index", required=True)
+    p_legacy.add_argument("--with-sentences", action="store_true",
+                          help="Policz też embeddingi zdań (wymaga modelu embeddingów)")
+    p_build = sub.add_parser("build", help="Zbuduj indeks od nowa (wymaga modelu embeddingów)")
+    p_build.add_argument("--json", required=True)
+    for p in (p_legacy, p_build):
+        p.add_argument("--dedup", action="store_true", help="Scal prawie-duplikaty (corpus_dedup.py)")
+        p.add_argument("--dedup-threshold", type=float, default=0.8)
+    p_upsert = sub.add_parser("upsert", help="Dodaj/podmień fragmenty w najnowszej wersji")
+    p_upsert.add_argument("--json", required=True)
+    p_remove = sub.add_parser("remove", help="Usuń fragmenty o podanych id z najnowszej wersji")
+    p_remove.add_argument("--ids", nargs="+", required=True)
+    sub.add_parser("list")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.root, exist_ok=True)
+    if args.command == "list":
+        for name in list_versions(args.root):
+            print(name)
+        return
+
+    models: Dict[str, Any] = {}
+
+    def embed(texts: List[str]) -> np.ndarray:
+        if "model" not in models:
+            from embedding_backend import load_embedding_backend
+            models["model"] = load_embedding_backend(os.environ.get("EMBEDDING_BACKEND", "torch"))
+        return models["model"].encode(texts, convert_to_numpy=True, batch_size=64)
+
+    if args.command in ("upsert", "remove"):
+        latest = latest_version_path(args.root)
+        if latest is None:
+            raise CorpusError(f"Brak wersji bazowej w {args.root}")
+        base = load_version(latest)
+        if args.command == "upsert":
+            chunks, index, sentences = apply_changes(base, read_source_chunks(args.json), [], embed)
+        else:
+            chunks, index, sentences = apply_changes(base, [], args.ids)
+        print(write_version(chunks, index, root=args.root, source=f"{args.command} @ {base.version}",
+                            sentences=sentences))
+        return
+
+    chunks = read_source_chunks(args.json)
+    chunk_ids = [c["id"] for c in chunks]
+    if args.dedup:
+        chunks, stats = deduplicate(chunks, threshold=args.dedup_threshold)
+        logger.info("Deduplikacja: %s", stats)
+        print(json.dumps(stats, ensure_ascii=False))
+    sentences = None
+    if args.command == "import-legacy":
+        index = wrap_positional_index(faiss.read_index(args.index), chunk_ids)
+        kept = {chunk_int_id(c["id"]) for c in chunks}
+        dropped = [chunk_int_id(i) for i in chunk_ids if chunk_int_id(i) not in kept]
+        if dropped:
+            # Wektory scalonych duplikatów usuwamy, zostają tylko reprezentanci grup
+            index.remove_ids(faiss.IDSelectorBatch(np.array(dropped, dtype=np.int64)))
+        if args.with_sentences:
+            sentences = SentenceStore.build(chunks, embed, chunk_int_id)
+    else:
+        index = build_id_index(embed([c["text"] for c in chunks]), [c["id"] for c in chunks])
+        sentences = SentenceStore.build(chunks, embed, chunk_int_id)
+    print(write_version(chunks, index, root=args.root, source=args.json, sentences=sentences))
+
+
+if __name__ == "__main__":
+    main()
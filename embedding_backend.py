@@ -0,0 +1,211 @@
+"""
+Wybór backendu modelu embeddingów zapytań.
+
+    torch      – SentenceTransformer (PyTorch), jak dotychczas
+    onnx       – ten sam model wyeksportowany do ONNX, uruchamiany przez ONNX Runtime
+    onnx-int8  – jak wyżej, z dynamiczną kwantyzacją wag do int8
+
+Eksport wykonywany jest raz (pliki trafiają do ONNX_CACHE_DIR), potem
+ładowany jest tylko plik .onnx i tokenizer – bez PyTorcha w procesie.
+Backendy ONNX wymagają pakietów `onnxruntime` i `transformers`
+(eksport dodatkowo `torch`).
+
+Weryfikacja (opóźnienie encode, pamięć RSS, zgodność cosinusowa z PyTorch):
+    python embedding_backend.py verify
+    python embedding_backend.py export --int8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+MAX_SEQ_LENGTH = 128  # tyle samo co SentenceTransformer dla tego modelu
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR", "RAG/onnx")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def onnx_model_path(int8: bool) -> str:
+    return os.path.join(ONNX_CACHE_DIR, "model.int8.onnx" if int8 else "model.onnx")
+
+
+def export_onnx(int8: bool = False) -> str:
+    """Eksportuje model do ONNX (i opcjonalnie kwantyzuje do int8); zwraca ścieżkę pliku."""
+    fp32_path = onnx_model_path(False)
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = AutoModel.from_pretrained(MODEL_NAME).eval()
+        sample = tokenizer(["przykładowe zdanie"], return_tensors="pt")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=14,
+            )
+        tokenizer.save_pretrained(ONNX_CACHE_DIR)
+
+    if not int8:
+        return fp32_path
+
+    int8_path = onnx_model_path(True)
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxEmbedder:
+    """
+    Zamiennik SentenceTransformer.encode oparty o ONNX Runtime:
+    ten sam tokenizer, mean pooling po masce uwagi (jak w modelu sentence-transformers).
+    """
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        tokenizer_dir = ONNX_CACHE_DIR if os.path.exists(
+            os.path.join(ONNX_CACHE_DIR, "tokenizer_config.json")) else MODEL_NAME
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, sentences: Sequence[str], convert_to_numpy: bool = True,
+               batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            batch = list(sentences[start:start + batch_size])
+            enc = self.tokenizer(batch, padding=True, truncation=True,
+                                 max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            mask = enc["attention_mask"].astype(np.int64)
+            hidden = self.session.run(None, {
+                "input_ids": enc["input_ids"].astype(np.int64),
+                "attention_mask": mask,
+            })[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            outputs.append(pooled.astype(np.float32))
+        result = np.concatenate(outputs, axis=0) if outputs else np.zeros((0, 384), dtype=np.float32)
+        return result[0] if single else result
+
+
+def load_embedding_backend(backend: str = "torch"):
+    """Zwraca obiekt z metodą `encode` zgodną z SentenceTransformer."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Nieznany backend embeddingów: {backend} (dostępne: {', '.join(BACKENDS)})")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer  # For embedding models
+        return SentenceTransformer(MODEL_NAME)
+    return OnnxEmbedder(export_onnx(int8=backend == "onnx-int8"))
+
+
+# --- Weryfikacja ---
+
+def _sample_texts(limit: int = 200) -> List[str]:
+    texts = [
+        "Jaki jest główny cel tej petycji?",
+        "Jakie konkretnie problemy ma rozwiązać?",
+        "Poproszę o streszczenie najważniejszych argumentów.",
+        "Kto jest organizatorem akcji?",
+        "Witaj",
+    ]
+    path = os.path.join("RAG", "rag old", "summaries.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend(item["content"] for item in json.load(f))
+    return texts[:limit]
+
+
+def _rss_mb() -> float:
+    import resource
+    # ru_maxrss: KB na Linuksie, bajty na macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _measure(backend: str, out_path: str) -> None:
+    """Uruchamiane w osobnym procesie, żeby RSS dotyczył tylko jednego backendu."""
+    texts = _sample_texts()
+    model = load_embedding_backend(backend)
+    model.encode(["rozgrzewka"], convert_to_numpy=True)
+    latencies = []
+    for text in texts[:50]:
+        t0 = time.perf_counter()
+        model.encode([text], convert_to_numpy=True)
+        latencies.append(time.perf_counter() - t0)
+    vectors = model.encode(texts, convert_to_numpy=True)
+    np.save(out_path, vectors)
+    latencies.sort()
+    print(json.dumps({
+        "backend": backend,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "rss_mb": _rss_mb(),
+    }))
+
+
+def verify(backends: Sequence[str]) -> None:
+    results = {}
+    for backend in backends:
+        out_path = os.path.join(ONNX_CACHE_DIR, f"verify_{backend}.npy")
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        proc = subprocess.run([sys.executable, __file__, "_measure", backend, out_path],
+                              capture_output=True, text=True, check=True)
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+        results[backend]["vectors"] = np.load(out_path)
+
+    reference = results["torch"]["vectors"] if "torch" in results else None
+    for backend, r in results.items():
+        line = f"{backend:<10} encode p50 {r['p50_ms']:6.1f} ms  p95 {r['p95_ms']:6.1f} ms  RSS {r['rss_mb']:7.1f} MB"
+        if reference is not None and backend != "torch":
+            a = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+            b = r["vectors"] / np.linalg.norm(r["vectors"], axis=1, keepdims=True)
+            cos = (a * b).sum(axis=1)
+            line += f"  cos vs torch: min {cos.min():.4f} mean {cos.mean():.4f}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backend embeddingów: eksport ONNX i weryfikacja")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export")
+    p_export.add_argument("--int8", action="store_true")
+    p_verify = sub.add_parser("verify")
+    p_verify.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    p_measure = sub.add_parser("_measure")
+    p_measure.add_argument("backend")
+    p_measure.add_argument("out_path")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(export_onnx(int8=args.int8))
+    elif args.command == "verify":
+        verify(args.backends)
+    else:
+        _measure(args.backend, args.out_path)
+
+
+if __name__ == "__main__":
+    main()
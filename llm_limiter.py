@@ -0,0 +1,255 @@
+"""
+Wspólny dla procesu limiter wywołań OpenAI.
+
+Wszystkie sesje Streamlit działają w jednym procesie, więc limity dostawcy
+(zapytania/min i tokeny/min) egzekwujemy tu, zanim zapytanie wyjdzie do API:
+
+- dwa kubełki tokenów (RPM i TPM) uzupełniane w sposób ciągły,
+- kolejka FIFO zgłoszeń: każda sesja czeka na co najwyżej jedno wywołanie naraz,
+  więc kolejność zgłoszeń jest zarazem sprawiedliwym podziałem między sesje,
+- szacunek tokenów przed wywołaniem, korygowany po odpowiedzi (`usage`),
+- osobny limit wiadomości na minutę dla jednego uczestnika.
+
+    python llm_limiter.py --rpm 60 --tpm 20000 --sessions 30
+"""
+import argparse
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+
+class AdmissionTimeout(Exception):
+    """Zgłoszenie nie zostało dopuszczone w zadanym czasie."""
+
+
+class TokenBucket:
+    """Kubełek o pojemności `capacity` uzupełniany z prędkością `per_minute` jednostek na minutę."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.clock = clock
+        self.level = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Ile sekund trzeba poczekać, aż w kubełku będzie `amount` (0 = od razu)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Korekta po fakcie (np. zwrot nadmiernie oszacowanych tokenów); poziom może być ujemny."""
+        self._refill()
+        self.level = min(self.capacity, self.level + delta)
+
+
+class Ticket:
+    __slots__ = ("session_id", "tokens", "enqueued_at", "admitted_at")
+
+    def __init__(self, session_id: str, tokens: int, enqueued_at: float):
+        self.session_id = session_id
+        self.tokens = tokens
+        self.enqueued_at = enqueued_at
+        self.admitted_at: Optional[float] = None
+
+    @property
+    def waited(self) -> float:
+        return (self.admitted_at or self.enqueued_at) - self.enqueued_at
+
+
+class AdmissionController:
+    """
+    Args:
+        rpm: limit zapytań na minutę.
+        tpm: limit tokenów (prompt + odpowiedź) na minutę.
+        poll_interval: co ile sekund czekający odświeża swoją pozycję (callback `on_wait`).
+    """
+
+    def __init__(self, rpm: float, tpm: float, poll_interval: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(rpm, clock=clock)
+        self.tokens = TokenBucket(tpm, clock=clock)
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._queue: Deque[Ticket] = deque()
+        self._cond = threading.Condition()
+        self.stats = {"admitted": 0, "timeouts": 0, "max_queue": 0, "total_wait_s": 0.0}
+
+    def _head_wait(self, ticket: Ticket) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(ticket.tokens))
+
+    def _estimate(self, position: int, ticket: Ticket) -> float:
+        """Szacowany czas oczekiwania: czas zwolnienia limitu dla czoła kolejki + kolejne zgłoszenia."""
+        head_wait = self._head_wait(self._queue[0]) if self._queue else 0.0
+        per_request = max(1.0 / self.requests.rate, ticket.tokens / self.tokens.rate)
+        return head_wait + position * per_request
+
+    def position(self, ticket: Ticket) -> int:
+        """0 = czoło kolejki."""
+        with self._cond:
+            try:
+                return self._queue.index(ticket)
+            except ValueError:
+                return -1
+
+    def acquire(self, session_id: str, tokens: int, timeout: Optional[float] = None,
+                on_wait: Optional[Callable[[int, float], None]] = None) -> Ticket:
+        """
+        Blokuje do chwili, aż zgłoszenie dotrze na czoło kolejki i oba kubełki
+        mają zapas. `on_wait(pozycja, szacowany_czas_s)` jest wołane (poza blokadą)
+        przy każdym odświeżeniu, dopóki zgłoszenie czeka.
+        """
+        ticket = Ticket(session_id, tokens, self.clock())
+        deadline = None if timeout is None else ticket.enqueued_at + timeout
+        with self._cond:
+            self._queue.append(ticket)
+            self.stats["max_queue"] = max(self.stats["max_queue"], len(self._queue))
+        try:
+            while True:
+                with self._cond:
+                    position = self._queue.index(ticket)
+                    if position == 0:
+                        wait = self._head_wait(ticket)
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            self._queue.popleft()
+                            ticket.admitted_at = self.clock()
+                            self.stats["admitted"] += 1
+                            self.stats["total_wait_s"] += ticket.waited
+                            self._cond.notify_all()
+                            return ticket
+                    estimate = self._estimate(position, ticket)
+                    if deadline is not None and self.clock() >= deadline:
+                        self.stats["timeouts"] += 1
+                        raise AdmissionTimeout(f"Brak miejsca w limicie API po {timeout:.0f} s")
+                    sleep = self.poll_interval if position else min(self.poll_interval, wait)
+                    if deadline is not None:
+                        sleep = min(sleep, max(0.0, deadline - self.clock()))
+                if on_wait is not None:
+                    on_wait(position, estimate)
+                with self._cond:
+                    self._cond.wait(sleep)
+        finally:
+            # Przerwanie (timeout, wyjątek, przerwany rerun Streamlit) nie może zostawić biletu w kolejce
+            with self._cond:
+                if ticket.admitted_at is None and ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+
+    def try_acquire(self, session_id: str, tokens: int) -> Optional[Ticket]:
+        """
+        Dopuszcza od razu albo wcale (None): tylko gdy nikt nie czeka w kolejce i oba kubełki
+        mają zapas – np. dla zapasowego zapytania (hedging), które nie może czekać.
+        """
+        with self._cond:
+            ticket = Ticket(session_id, tokens, self.clock())
+            if self._queue or self._head_wait(ticket) > 0:
+                return None
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            ticket.admitted_at = ticket.enqueued_at
+            self.stats["admitted"] += 1
+            return ticket
+
+    def settle(self, ticket: Ticket, actual_tokens: Optional[int]) -> None:
+        """Koryguje kubełek TPM o różnicę między szacunkiem a faktycznym zużyciem."""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            self.tokens.adjust(ticket.tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def queue_length(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+
+class MessageRateLimiter:
+    """Przesuwne okno: najwyżej `per_minute` wiadomości jednego uczestnika na minutę."""
+
+    def __init__(self, per_minute: int, window: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.per_minute = per_minute
+        self.window = window
+        self.clock = clock
+        self._sent: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, participant_id: str) -> float:
+        """0, jeśli wiadomość można wysłać; w przeciwnym razie liczba sekund do zwolnienia limitu."""
+        if self.per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            sent = self._sent.get(participant_id)
+            if not sent:
+                return 0.0
+            while sent and now - sent[0] >= self.window:
+                sent.popleft()
+            if len(sent) < self.per_minute:
+                return 0.0
+            return self.window - (now - sent[0])
+
+    def record(self, participant_id: str) -> None:
+        with self._lock:
+            now = self.clock()
+            self._sent.setdefault(participant_id, deque()).append(now)
+            # Porzucone sesje nie powinny rosnąć w nieskończoność
+            if len(self._sent) > 10000:
+                stale = [p for p, sent in self._sent.items() if not sent or now - sent[-1] >= self.window]
+                for p in stale:
+                    del self._sent[p]
+
+
+def estimate_tokens(messages: List[Dict[str, str]], completion_tokens: int = 500) -> int:
+    """Zgrubny szacunek tokenów: ~3 znaki na token dla polskiego tekstu + rezerwa na odpowiedź."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 3 + 4 * len(messages) + completion_tokens
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Symulacja kolejki dopuszczania wywołań LLM")
+    parser.add_argument("--rpm", type=float, default=60)
+    parser.add_argument("--tpm", type=float, default=20000)
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--tokens", type=int, default=1500)
+    args = parser.parse_args(argv)
+
+    controller = AdmissionController(args.rpm, args.tpm, poll_interval=0.1)
+    controller.requests.level = controller.tokens.level = 0  # zimny start: bez zapasu na burst
+    waits: List[float] = []
+    lock = threading.Lock()
+
+    def session(i: int):
+        ticket = controller.acquire(f"s{i}", args.tokens)
+        with lock:
+            waits.append(ticket.waited)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    waits.sort()
+    print(f"{args.sessions} zgłoszeń w {time.perf_counter() - t0:.1f} s; "
+          f"oczekiwanie mediana {waits[len(waits) // 2]:.1f} s, max {waits[-1]:.1f} s")
+    print(controller.stats)
+
+
+if __name__ == "__main__":
+    main()
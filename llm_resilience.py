@@ -0,0 +1,330 @@
+"""
+Odporny wrapper na `client.chat.completions.create`.
+
+- każda próba ma własny limit czasu, a całe wywołanie – twardy termin
+  (wątek sesji Streamlit nie wisi na wolnym upstreamie),
+- błędy przejściowe (timeout, połączenie, 408/409/429/5xx) są ponawiane
+  z losowym (full jitter) wykładniczym odstępem, z poszanowaniem Retry-After,
+- opcjonalny zapasowy (hedged) request: jeśli odpowiedź nie przyszła po
+  czasie równym p95 dotychczasowych opóźnień, wysyłamy drugi i bierzemy
+  pierwszą odpowiedź,
+- bezpiecznik (circuit breaker): po serii błędów przez `reset_timeout`
+  wywołania kończą się od razu, potem jedno próbne wywołanie decyduje,
+  czy wracamy do normalnej pracy.
+
+Symulacja ogona opóźnień z hedgingiem i bez:
+    python llm_resilience.py --calls 300
+"""
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+RETRYABLE_STATUS = {408, 409, 429}
+RETRYABLE_NAMES = {"APITimeoutError", "APIConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout"}
+
+
+class LLMUnavailableError(Exception):
+    """Upstream niedostępny: wyczerpane ponowienia, przekroczony termin albo otwarty bezpiecznik."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in RETRYABLE_NAMES
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """closed -> (failure_threshold kolejnych błędów) -> open -> (reset_timeout) -> half-open -> closed/open"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Asystent jest chwilowo niedostępny (bezpiecznik otwarty).")
+                self.state = "half-open"
+            if self.state == "half-open":
+                if self._probe_in_flight:
+                    raise CircuitOpenError("Asystent jest chwilowo niedostępny (trwa próba połączenia).")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = self.clock()
+
+
+class LatencyWindow:
+    """Ostatnie `size` czasów udanych prób – do wyznaczenia opóźnienia hedgingu i raportów."""
+
+    def __init__(self, size: int = 200):
+        self._values: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self._values.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class ResilientChatClient:
+    """
+    Args:
+        create_fn: np. `client.chat.completions.create`; dostaje argument `timeout` (sekundy).
+        attempt_timeout: limit czasu jednej próby.
+        deadline: limit czasu całego wywołania (z ponowieniami).
+        max_retries: liczba ponowień po pierwszej próbie.
+        backoff_base, backoff_max: parametry wykładniczego odstępu (full jitter).
+        hedge: czy wysyłać zapasowe zapytanie po czasie p95.
+        hedge_min_delay: dolne ograniczenie opóźnienia hedgingu.
+        hedge_min_samples: ile udanych prób trzeba zebrać, zanim p95 będzie miarodajne.
+        hedge_admit: dopuszczenie zapasowego zapytania: `hedge_admit(kwargs)` zwraca None
+            (bez zapasu, np. brak miejsca w limicie API) albo funkcję `settle(wynik)`, wołaną
+            po zakończeniu zapasowego zapytania (wynik None przy błędzie).
+        retry_admit: dopuszczenie ponowienia: `retry_admit(kwargs, timeout)` czeka (najdłużej
+            `timeout` s) na miejsce w limicie API i zwraca funkcję `release()`, wołaną po próbie;
+            wyjątek (np. przekroczony czas w kolejce) kończy wywołanie bez kolejnej próby.
+    """
+
+    def __init__(self, create_fn: Callable[..., Any], attempt_timeout: float = 30.0, deadline: float = 60.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge: bool = False, hedge_min_delay: float = 1.0, hedge_min_samples: int = 20,
+                 hedge_admit: Optional[Callable[[Dict[str, Any]], Optional[Callable[[Any], None]]]] = None,
+                 retry_admit: Optional[Callable[[Dict[str, Any], float], Callable[[], None]]] = None,
+                 breaker: Optional[CircuitBreaker] = None, max_workers: int = 32):
+        self.create_fn = create_fn
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_admit = hedge_admit
+        self.retry_admit = retry_admit
+        self.breaker = breaker or CircuitBreaker()
+        self.attempt_latency = LatencyWindow()
+        self.call_latency = LatencyWindow()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                      "timeouts": 0, "failures": 0, "circuit_rejections": 0}
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.attempt_latency) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.attempt_latency.percentile(0.95))
+
+    def _backoff(self, retry: int, exc: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+        server_hint = retry_after_seconds(exc)
+        return max(delay, server_hint) if server_hint is not None else delay
+
+    def _attempt(self, kwargs: Dict[str, Any], timeout: float) -> Any:
+        start = time.monotonic()
+        end = start + timeout
+        futures = [self._pool.submit(self.create_fn, timeout=timeout, **kwargs)]
+        pending = set(futures)
+
+        delay = self.hedge_delay()
+        if delay is not None and delay < timeout:
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            settle = None
+            if not done and self.hedge_admit is not None:
+                settle = self.hedge_admit(kwargs)
+            if not done and (self.hedge_admit is None or settle is not None):
+                hedge = self._pool.submit(self.create_fn, timeout=end - time.monotonic(), **kwargs)
+                if settle is not None:
+                    # Zapasowe zapytanie też zużywa limit API – rozliczamy je, gdy się zakończy
+                    hedge.add_done_callback(lambda f: settle(None if f.exception() else f.result()))
+                futures.append(hedge)
+                pending.add(hedge)
+                self._count("hedges")
+            pending |= done
+
+        last_exc: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self.attempt_latency.add(time.monotonic() - start)
+                    if len(futures) > 1 and future is futures[1]:
+                        self._count("hedge_wins")
+                    # Przegrany request kończy się w tle – jego wynik jest ignorowany
+                    return future.result()
+                last_exc = future.exception()
+        if last_exc is not None and not pending:
+            raise last_exc
+        self._count("timeouts")
+        raise TimeoutError(f"Brak odpowiedzi LLM w ciągu {timeout:.1f} s")
+
+    def create(self, **kwargs: Any) -> Any:
+        """Odpowiednik `chat.completions.create(**kwargs)` z terminami, ponowieniami i bezpiecznikiem."""
+        self._count("calls")
+        start = time.monotonic()
+        end = start + self.deadline
+        retry = 0
+        while True:
+            release = None
+            if retry and self.retry_admit is not None:
+                # Ponowienie (np. po 429) to kolejne zapytanie do API – przechodzi przez wspólny limit
+                try:
+                    release = self.retry_admit(kwargs, max(0.0, end - time.monotonic()))
+                except Exception as e:
+                    self._count("failures")
+                    raise LLMUnavailableError(f"Brak miejsca w limicie API na ponowienie: {e}") from e
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count("circuit_rejections")
+                if release is not None:
+                    release()
+                raise
+            remaining = end - time.monotonic()
+            self._count("attempts")
+            try:
+                try:
+                    result = self._attempt(kwargs, min(self.attempt_timeout, remaining))
+                finally:
+                    if release is not None:
+                        release()
+            except Exception as e:
+                if not is_retryable(e):
+                    # Błąd po naszej stronie (np. 400) – upstream działa, bezpiecznik bez zmian
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                pause = self._backoff(retry, e)
+                if retry >= self.max_retries or time.monotonic() + pause >= end:
+                    self._count("failures")
+                    raise LLMUnavailableError(f"Brak odpowiedzi asystenta po {retry + 1} próbach: {e}") from e
+                retry += 1
+                self._count("retries")
+                time.sleep(pause)
+                continue
+            self.breaker.record_success()
+            self.call_latency.add(time.monotonic() - start)
+            return result
+
+    def latency_summary(self) -> Dict[str, Optional[float]]:
+        return {f"p{int(q * 100)}_s": self.call_latency.percentile(q) for q in (0.5, 0.95, 0.99)}
+
+
+# --- Symulacja ---
+
+def _simulated_create(slow_fraction: float, fail_fraction: float):
+    """Zwykle ~0.5 s; `slow_fraction` odpowiedzi trwa 4–8 s, `fail_fraction` kończy się błędem 503."""
+
+    class _ServerError(Exception):
+        status_code = 503
+
+    def create(timeout: float, **kwargs):
+        r = random.random()
+        if r < fail_fraction:
+            time.sleep(0.05)
+            raise _ServerError("503 Service Unavailable")
+        latency = random.uniform(4, 8) if r < fail_fraction + slow_fraction else random.gauss(0.5, 0.1)
+        time.sleep(min(max(latency, 0.05), timeout))
+        if latency > timeout:
+            raise TimeoutError("timeout")
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    return create
+
+
+def _run(client: ResilientChatClient, calls: int, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+    per_thread = calls // concurrency
+
+    def worker():
+        for _ in range(per_thread):
+            t0 = time.monotonic()
+            try:
+                client.create(model="sim", messages=[])
+            except LLMUnavailableError:
+                pass
+            with lock:
+                latencies.append(time.monotonic() - t0)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ogon opóźnień wywołań LLM z hedgingiem i bez")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow", type=float, default=0.05, help="Odsetek bardzo wolnych odpowiedzi")
+    parser.add_argument("--fail", type=float, default=0.03, help="Odsetek odpowiedzi 503")
+    args = parser.parse_args(argv)
+
+    for hedge in (False, True):
+        client = ResilientChatClient(_simulated_create(args.slow, args.fail), attempt_timeout=10, deadline=20,
+                                     backoff_base=0.1, hedge=hedge, hedge_min_samples=10,
+                                     hedge_min_delay=0.5, breaker=CircuitBreaker(failure_threshold=50))
+        latencies = _run(client, args.calls, args.concurrency)
+        p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        print(f"hedge={'tak' if hedge else 'nie':<4} p50 {p(0.5):5.2f} s   p95 {p(0.95):5.2f} s   "
+              f"p99 {p(0.99):5.2f} s   {client.stats}")
+
+
+if __name__ == "__main__":
+    main()
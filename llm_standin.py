@@ -0,0 +1,302 @@
+"""
+Lokalny serwer zgodny z OpenAI (`/v1/chat/completions`) do testów wydajności offline.
+
+Tryby pracy:
+    replay    – odtwarza nagrane odpowiedzi z kasety JSONL (klucz = hash zapytania)
+    record    – przekazuje zapytania do prawdziwego API i dopisuje odpowiedzi do kasety
+    synthetic – generuje polskopodobny tekst z zadanym TTFT i tempem tokenów/s
+
+Uruchomienie:
+    python llm_standin.py --mode synthetic --port 8800 --ttft 0.4 --tps 40
+    python llm_standin.py --mode replay --cassette cassette.jsonl
+
+Aplikacja korzysta z serwera po ustawieniu OPENAI_BASE_URL=http://127.0.0.1:8800/v1
+(zmienna środowiskowa lub st.secrets).
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# Pola zapytania, które wpływają na treść odpowiedzi (stream nie wpływa)
+HASHED_FIELDS = ("model", "messages", "temperature", "top_p", "max_tokens")
+
+# Słownik do generowania "polskopodobnego" tekstu w trybie synthetic
+SYNTHETIC_WORDS: List[str] = [
+    "petycja", "zwierząt", "dobrostan", "pseudohodowle", "ustawa", "ochrona", "gminy",
+    "schroniska", "postulaty", "według", "dostępnych", "informacji", "wiele", "osób",
+    "poparło", "zmiany", "przepisów", "psów", "kotów", "warunki", "bytowania", "kastracja",
+    "zakaz", "łańcuchach", "kontrola", "hodowli", "należy", "również", "który", "oraz",
+    "jest", "się", "na", "w", "do", "z", "dla", "że", "ma", "celu", "poprawę", "prawa",
+]
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    """Zwraca stabilny hash zapytania (niezależny od kolejności kluczy i flagi stream)."""
+    relevant = {k: payload.get(k) for k in HASHED_FIELDS if k in payload}
+    canonical = json.dumps(relevant, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Kaseta JSONL: jedna linia = {"key", "request", "response"}."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    key = entry.get("key") or request_key(entry.get("request", {}))
+                    self._entries[key] = entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def record(self, payload: Dict[str, Any], response: Dict[str, Any]) -> None:
+        key = request_key(payload)
+        entry = {"key": key, "request": {k: payload.get(k) for k in HASHED_FIELDS if k in payload},
+                 "response": response}
+        with self._lock:
+            self._entries[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def synthetic_text(payload: Dict[str, Any], n_tokens: int) -> str:
+    """Generuje deterministyczny (dla danego zapytania) tekst złożony z polskich słów."""
+    rng = random.Random(request_key(payload))
+    sentences = []
+    words_left = n_tokens
+    while words_left > 0:
+        length = min(words_left, rng.randint(6, 14))
+        words = [rng.choice(SYNTHETIC_WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + rng.choice([".", ".", ".", "!", "?"]))
+        words_left -= length
+    return " ".join(sentences)
+
+
+def split_tokens(text: str) -> List[str]:
+    """Przybliżony podział na tokeny: słowa razem z poprzedzającą spacją."""
+    parts = text.split(" ")
+    return [parts[0]] + [" " + p for p in parts[1:]] if parts else []
+
+
+def completion_body(model: str, content: str, prompt_tokens: int) -> Dict[str, Any]:
+    completion_tokens = len(split_tokens(content))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def chunk_body(completion_id: str, model: str, delta: Dict[str, Any],
+               finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def estimate_prompt_tokens(payload: Dict[str, Any]) -> int:
+    """Zgrubne oszacowanie (~4 znaki na token), wystarczające do benchmarków."""
+    chars = sum(len(str(m.get("content", ""))) for m in payload.get("messages", []))
+    return max(1, chars // 4)
+
+
+class StandInConfig:
+    def __init__(self, mode: str, cassette: Optional[Cassette], ttft: float, tps: float,
+                 tokens: int, upstream: str, upstream_key: str):
+        self.mode = mode
+        self.cassette = cassette
+        self.ttft = ttft
+        self.tps = tps
+        self.tokens = tokens
+        self.upstream = upstream.rstrip("/")
+        self.upstream_key = upstream_key
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    config: StandInConfig  # ustawiane w make_server()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - sygnatura z BaseHTTPRequestHandler
+        pass
+
+    # --- odpowiedzi pomocnicze ---
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": {"message": message, "type": "standin_error"}})
+
+    def _stream(self, model: str, pieces: Iterator[str], ttft: float, tps: float) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+        def emit(body: Dict[str, Any]) -> None:
+            self.wfile.write(f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(ttft)
+        emit(chunk_body(completion_id, model, {"role": "assistant", "content": ""}))
+        for piece in pieces:
+            emit(chunk_body(completion_id, model, {"content": piece}))
+            if tps > 0:
+                time.sleep(1.0 / tps)
+        emit(chunk_body(completion_id, model, {}, finish_reason="stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    # --- źródła treści ---
+    def _forward_upstream(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        body = dict(payload)
+        body["stream"] = False
+        req = urllib.request.Request(
+            f"{self.config.upstream}/chat/completions",
+            data=json.dumps(body).encode("utf-8"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.config.upstream_key}",
+            },
+        )
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def _content_for(self, payload: Dict[str, Any]) -> Optional[str]:
+        cfg = self.config
+        if cfg.mode == "synthetic":
+            return synthetic_text(payload, cfg.tokens)
+
+        key = request_key(payload)
+        entry = cfg.cassette.get(key) if cfg.cassette else None
+        if entry is not None:
+            return entry["response"]["content"]
+        if cfg.mode == "record":
+            upstream = self._forward_upstream(payload)
+            content = upstream["choices"][0]["message"]["content"]
+            cfg.cassette.record(payload, {"content": content, "usage": upstream.get("usage")})
+            return content
+        return None
+
+    # --- routing ---
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "standin", "object": "model"}]})
+        elif self.path.rstrip("/") == "/health":
+            self._send_json(200, {"status": "ok", "mode": self.config.mode})
+        else:
+            self._send_error(404, f"Nieznana ścieżka: {self.path}")
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404, f"Nieznana ścieżka: {self.path}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_error(400, f"Niepoprawne JSON: {e}")
+            return
+
+        try:
+            content = self._content_for(payload)
+        except Exception as e:
+            self._send_error(502, f"Błąd upstream: {e}")
+            return
+        if content is None:
+            self._send_error(404, f"Brak nagrania dla zapytania {request_key(payload)[:12]}")
+            return
+
+        model = payload.get("model", "standin")
+        # W trybie replay/record TTFT i tempo również są symulowane, aby wyniki były powtarzalne
+        if payload.get("stream"):
+            self._stream(model, iter(split_tokens(content)), self.config.ttft, self.config.tps)
+        else:
+            n = len(split_tokens(content))
+            time.sleep(self.config.ttft + (n / self.config.tps if self.config.tps > 0 else 0))
+            self._send_json(200, completion_body(model, content, estimate_prompt_tokens(payload)))
+
+
+def make_server(config: StandInConfig, host: str = "127.0.0.1", port: int = 8800) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStandInHandler", (StandInHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Lokalny serwer zgodny z OpenAI /v1/chat/completions")
+    parser.add_argument("--mode", choices=["replay", "record", "synthetic"], default="synthetic")
+    parser.add_argument("--cassette", default="cassette.jsonl", help="Plik JSONL z nagraniami")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--ttft", type=float, default=0.4, help="Czas do pierwszego tokenu (s)")
+    parser.add_argument("--tps", type=float, default=40.0, help="Tokeny na sekundę (0 = bez opóźnienia)")
+    parser.add_argument("--tokens", type=int, default=60, help="Długość odpowiedzi w trybie synthetic")
+    parser.add_argument("--upstream", default="https://api.openai.com/v1", help="API dla trybu record")
+    args = parser.parse_args(argv)
+
+    cassette = Cassette(args.cassette) if args.mode in ("replay", "record") else None
+    config = StandInConfig(
+        mode=args.mode,
+        cassette=cassette,
+        ttft=args.ttft,
+        tps=args.tps,
+        tokens=args.tokens,
+        upstream=args.upstream,
+        upstream_key=os.environ.get("OPENAI_API_KEY", ""),
+    )
+    server = make_server(config, args.host, args.port)
+    loaded = f", nagrań: {len(cassette)}" if cassette is not None else ""
+    print(f"Stand-in ({args.mode}{loaded}) nasłuchuje na http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Wiersz uczestnika w arkuszu (kolumny A–AN) utrzymywany przyrostowo.
+
+`build_full_row_data` wołane jest przy każdym zapisie do arkusza. Zamiast
+za każdym razem od zera sklejać cały log rozmowy, parsować `start_timestamp`
+i budować listy TIPI/BUS z dopełnieniem, rekord:
+
+- trzyma gotowy wiersz i zbiór zmienionych ("brudnych") kolumn,
+- przy synchronizacji z session_state porównuje tylko wartości kolumn,
+- log rozmowy (kolumna Y) serializuje dopisując wyłącznie nowe linie,
+- `dirty_ranges()` zwraca tylko zmienione zakresy do `batch_update`.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Indeksy kolumn (0 = A)
+COL_PARTICIPANT_ID = 0
+COL_START_TIMESTAMP = 1
+COL_GROUP = 2
+COL_AGE = 3
+COL_GENDER = 4
+COL_EDUCATION = 5
+COL_ATTITUDE = 6          # G–I
+COL_TIPI = 9              # J–S
+COL_CONV_START = 19       # T
+COL_CONV_END = 20         # U
+COL_CONV_DURATION = 21    # V
+COL_NUM_USER = 22         # W
+COL_NUM_BOT = 23          # X
+COL_CONVERSATION_LOG = 24 # Y
+COL_BUS = 25              # Z–AJ
+COL_DECISION = 36         # AK
+COL_FEEDBACK_NEG = 37     # AL
+COL_FEEDBACK_POS = 38     # AM
+COL_STUDY_DURATION = 39   # AN
+ROW_WIDTH = 40
+
+
+def column_letter(index: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA."""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class ParticipantRecord:
+    """
+    Args:
+        n_tipi: liczba pytań TIPI (kolumny od J).
+        n_bus: liczba pytań BUS (kolumny od Z).
+    """
+
+    __slots__ = (
+        "row", "dirty", "n_tipi", "n_bus",
+        "_start_ts", "_start_dt", "_conv_start", "_conv_end",
+        "_history", "_turn", "_turn_has_user", "_transcript",
+    )
+
+    def __init__(self, n_tipi: int = 10, n_bus: int = 11):
+        self.row: List[Any] = [""] * ROW_WIDTH
+        self.dirty = set(range(ROW_WIDTH))
+        self.n_tipi = n_tipi
+        self.n_bus = n_bus
+        self._start_ts: Optional[str] = None
+        self._start_dt: Optional[datetime] = None
+        self._conv_start: Optional[datetime] = None
+        self._conv_end: Optional[datetime] = None
+        # Stan przyrostowego logu: TurnStore, z którego czytamy, pozycja i gotowy tekst
+        self._history: Any = None
+        self._turn = 0
+        self._turn_has_user = False
+        self._transcript = ""
+
+    def set(self, column: int, value: Any) -> None:
+        if self.row[column] != value:
+            self.row[column] = value
+            self.dirty.add(column)
+
+    def _set_padded(self, first: int, width: int, values: List[Any]) -> None:
+        n = len(values)
+        for i in range(width):
+            self.set(first + i, values[i] if i < n else "")
+
+    def _sync_transcript(self, history: Any) -> None:
+        if history is not self._history or len(history) < self._turn:
+            # Nowa lista tur (np. początek rozmowy) – log budujemy od nowa
+            self._history = history
+            self._turn = 0
+            self._turn_has_user = False
+            self._transcript = ""
+        lines = []
+        while self._turn < len(history):
+            turn = history[self._turn]
+            if not self._turn_has_user and turn.user is not None:
+                lines.append(f"User: {turn.user}")
+                self._turn_has_user = True
+            if not turn.has_bot:
+                break  # tura czeka na odpowiedź bota
+            lines.append(f"Bot: {turn.bot_text}")
+            self._turn += 1
+            self._turn_has_user = False
+        if lines:
+            joined = "\n".join(lines)
+            self._transcript = f"{self._transcript}\n{joined}" if self._transcript else joined
+            self.set(COL_CONVERSATION_LOG, self._transcript)
+
+    def sync(self, state: Any, now: Optional[datetime] = None) -> List[Any]:
+        """
+        Uzgadnia wiersz z session_state (koszt proporcjonalny do liczby kolumn,
+        nie do długości rozmowy) i zwraca go. Zwracana lista to wewnętrzny
+        wiersz rekordu – nie należy jej modyfikować.
+        """
+        self.set(COL_PARTICIPANT_ID, state.participant_id)
+
+        start_ts = state.start_timestamp
+        if start_ts != self._start_ts:
+            self._start_ts = start_ts
+            try:
+                self._start_dt = datetime.fromisoformat(start_ts)
+            except (TypeError, ValueError):
+                self._start_dt = None
+            self.set(COL_START_TIMESTAMP, start_ts)
+
+        self.set(COL_GROUP, state.get("group", ""))
+
+        demo = state.get("demographics", {})
+        self.set(COL_AGE, demo.get("age", ""))
+        self.set(COL_GENDER, demo.get("gender", ""))
+        self.set(COL_EDUCATION, demo.get("education", ""))
+
+        att = state.get("attitude", {})
+        for i in range(3):
+            self.set(COL_ATTITUDE + i, att.get(f"attitude{i + 1}", ""))
+
+        self._set_padded(COL_TIPI, self.n_tipi, state.get("tipi_answers") or [])
+
+        conv_start = state.get("timer_start_time")
+        conv_end = state.get("conversation_end_time")
+        if conv_start is not self._conv_start or conv_end is not self._conv_end:
+            self._conv_start, self._conv_end = conv_start, conv_end
+            self.set(COL_CONV_START, conv_start.isoformat() if conv_start else "")
+            self.set(COL_CONV_END, conv_end.isoformat() if conv_end else "")
+            self.set(COL_CONV_DURATION,
+                     int((conv_end - conv_start).total_seconds()) if conv_start and conv_end else "")
+
+        self.set(COL_NUM_USER, state.get("num_user_messages", 0))
+        self.set(COL_NUM_BOT, state.get("num_bot_messages", 0))
+        self._sync_transcript(state.get("conversation_history", []))
+
+        self._set_padded(COL_BUS, self.n_bus, state.get("bus_answers") or [])
+        self.set(COL_DECISION, state.get("decision", ""))
+
+        feedback = state.get("feedback", {})
+        self.set(COL_FEEDBACK_NEG, feedback.get("negative", ""))
+        self.set(COL_FEEDBACK_POS, feedback.get("positive", ""))
+
+        # Łączny czas trwania badania jako "MM:SS"
+        if self._start_dt is not None:
+            total_sec = int(((now or datetime.now()) - self._start_dt).total_seconds())
+            minutes, seconds = divmod(total_sec, 60)
+            self.set(COL_STUDY_DURATION, f"{minutes:02d}:{seconds:02d}")
+        else:
+            self.set(COL_STUDY_DURATION, "")
+        return self.row
+
+    def dirty_ranges(self, row_index: int) -> List[Dict[str, Any]]:
+        """Zmienione kolumny jako ciągłe zakresy A1 (dane dla `worksheet.batch_update`)."""
+        ranges = []
+        columns = sorted(self.dirty)
+        i = 0
+        while i < len(columns):
+            j = i
+            while j + 1 < len(columns) and columns[j + 1] == columns[j] + 1:
+                j += 1
+            first, last = columns[i], columns[j]
+            ranges.append({
+                "range": f"{column_letter(first)}{row_index}:{column_letter(last)}{row_index}",
+                "values": [self.row[first:last + 1]],
+            })
+            i = j + 1
+        return ranges
+
+    def mark_clean(self) -> None:
+        self.dirty.clear()
@@ -0,0 +1,141 @@
+"""
+Szybka ścieżka dla pytań o numerowane postulaty petycji.
+
+Pytania typu "Co mówi postulat 5?" albo "wymień wszystkie postulaty" nie
+potrzebują wyszukiwania wektorowego: roles_cache.json zawiera postulaty
+z rolą `postulaty`, więc przy starcie budujemy tabelę numer -> tekst, a tani
+matcher intencji zwraca gotowy, zwięzły tekst postulatu, który aplikacja
+podaje modelowi zamiast fragmentów z wyszukiwania (bez encode i FAISS).
+Fragmentów z samą rolą `postulaty` jest kilkaset, więc do promptu trafia
+tylko ta zwięzła główna lista.
+
+    python postulates.py --source RAG/roles_cache.json "Co mówi postulat 5?"
+"""
+import argparse
+import json
+import re
+from typing import Dict, List, Optional
+
+POSTULATE_ROLE = "postulaty"
+
+_NUMBERED_ITEM = re.compile(r"^\s*(\d{1,2})\.\s+(.*)$", re.DOTALL)
+# Kontynuacja punktu po podziale strony zaczyna się od numeru strony, np. "2 \n \npracowników..."
+_PAGE_NUMBER_PREFIX = re.compile(r"^\s*\d+\s*\n[\s\n]*")
+# Koniec punktu: pusta linia (dalej zaczyna się już inny akapit dokumentu)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+_ORDINAL_STEMS = [
+    "pierwsz", "drug", "trzec", "czwart", "piąt", "szóst", "siódm", "ósm", "dziewiąt",
+    "dziesiąt", "jedenast", "dwunast", "trzynast", "czternast", "piętnast", "szesnast",
+    "siedemnast", "osiemnast", "dziewiętnast", "dwudziest",
+]
+_ORDINALS = {stem: n for n, stem in enumerate(_ORDINAL_STEMS, start=1)}
+
+# Tylko liczba pojedyncza ("postulat 5", "o postulacie 5") – liczba mnoga ("3 postulaty",
+# "w 5 punktach") to zwykle polecenie dotyczące formy odpowiedzi, nie pytanie o numer
+_POSTULATE_WORD = r"postula(?:t|tu|tem|towi|cie)\b"
+_POINT_WORD = r"(?:punk(?:t|tu|tem|towi|cie)\b|pkt\.?)"
+_NUMBER_AFTER = re.compile(
+    r"\b(?:" + _POSTULATE_WORD + r"|" + _POINT_WORD + r")\s*(?:nr\.?|numer\s+)?\s*(\d{1,2})\b", re.IGNORECASE)
+# "5. postulat", "postulat nr 5"; przed słowem "punkt" numer musi mieć kropkę porządkową ("5. punkt")
+_NUMBER_BEFORE = re.compile(
+    r"\b(\d{1,2})(?:\.?\s*" + _POSTULATE_WORD + r"|\.\s*" + _POINT_WORD + r")", re.IGNORECASE)
+# Liczebnik porządkowy tylko z "postulat" ("drugi punkt widzenia" to nie pytanie o postulat)
+_ORDINAL = re.compile(r"\b(" + "|".join(_ORDINAL_STEMS) + r")\w*\s+" + _POSTULATE_WORD, re.IGNORECASE)
+_LIST_ALL = re.compile(
+    r"\b(?:wymień|wymien|wypisz|podaj|wylistuj|przedstaw|pokaż|pokaz)\s+(?:mi\s+)?"
+    r"(?:wszystkie\s+|kolejne\s+)?postulaty\b"
+    r"|\bjakie\s+(?:są\s+|sa\s+)?(?:wszystkie\s+)?postulaty\b"
+    r"|\bile\s+(?:jest\s+|ma\s+)?postulatów\b"
+    r"|\blist[aęy]\s+(?:wszystkich\s+)?postulatów\b"
+    r"|\bwszystkie\s+postulaty\b",
+    re.IGNORECASE,
+)
+
+
+def _clean(text: str) -> str:
+    text = _PARAGRAPH_BREAK.split(text, maxsplit=1)[0]
+    return " ".join(text.split()).rstrip(" ;,")
+
+
+class PostulateTable:
+    """Tabela numer -> treść postulatu (główna lista)."""
+
+    def __init__(self, numbered: Dict[int, str]):
+        self.numbered = numbered
+
+    @classmethod
+    def from_roles_cache(cls, roles_cache: Dict[str, List[str]]) -> "PostulateTable":
+        # Numerowane listy z rolą "postulaty": ciągi 1, 2, 3, ... (z kontynuacjami po podziale
+        # strony). Główną listą postulatów jest najdłuższy taki ciąg.
+        runs: List[Dict[int, str]] = []
+        current: Dict[int, str] = {}
+        last = 0
+        for text, roles in roles_cache.items():
+            match = _NUMBERED_ITEM.match(text)
+            if match and POSTULATE_ROLE in roles:
+                number = int(match.group(1))
+                if number == last + 1:
+                    current[number] = match.group(2)
+                    last = number
+                    continue
+                if current:
+                    runs.append(current)
+                current, last = ({1: match.group(2)}, 1) if number == 1 else ({}, 0)
+            elif current and POSTULATE_ROLE in roles and not match:
+                current[last] += " " + _PAGE_NUMBER_PREFIX.sub("", text)
+            else:
+                if current:
+                    runs.append(current)
+                current, last = {}, 0
+        if current:
+            runs.append(current)
+
+        main_list = max(runs, key=len) if runs else {}
+        return cls({n: _clean(t) for n, t in main_list.items()})
+
+    @classmethod
+    def load(cls, path: str) -> "PostulateTable":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_roles_cache(json.load(f))
+
+    def match(self, user_message: str) -> Optional[List[str]]:
+        """
+        Zwraca zwięzły tekst postulatów dla pytania o konkretny numer lub o całą listę
+        albo None, gdy pytanie nie dotyczy numerowanych postulatów.
+        """
+        if not self.numbered:
+            return None
+        numbers = [int(n) for n in _NUMBER_AFTER.findall(user_message)]
+        numbers += [int(n) for n in _NUMBER_BEFORE.findall(user_message)]
+        numbers += [_ORDINALS[stem.lower()] for stem in _ORDINAL.findall(user_message)
+                    if stem.lower() in _ORDINALS]
+        numbers = sorted(set(numbers))
+
+        if numbers and all(n in self.numbered for n in numbers):
+            return [f"Postulat {n}: {self.numbered[n]}" for n in numbers]
+        if numbers or _LIST_ALL.search(user_message):
+            # Pytanie o całą listę albo o numer spoza zakresu – podajemy pełną, zwięzłą listę
+            header = f"Petycja zawiera {len(self.numbered)} postulatów (1–{max(self.numbered)}):"
+            return [header] + [f"{n}. {text}" for n, text in sorted(self.numbered.items())]
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Tabela postulatów i test matchera intencji")
+    parser.add_argument("--source", default="RAG/roles_cache.json")
+    parser.add_argument("questions", nargs="*")
+    args = parser.parse_args(argv)
+
+    table = PostulateTable.load(args.source)
+    if not args.questions:
+        for n, text in sorted(table.numbered.items()):
+            print(f"{n:>2}. {text}")
+        return
+    for question in args.questions:
+        print(f"> {question}")
+        print("\n".join(table.match(question) or ["(brak dopasowania – zwykłe wyszukiwanie)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Wektor zapytania RAG świadomy rozmowy.
+
+Zamiast kodować za każdym razem `"<pytanie> pseudohodowle dobrostan zwierząt
+petycja"`, kodujemy tylko nowy tekst użytkownika i składamy wektor zapytania
+z trzech części:
+
+    q = |e(pytanie)| * norm( e(pytanie) + w_s * e(dopisek) + w_h * norm(h) )
+
+gdzie e(dopisek) liczy się raz na proces, a h to wykładniczo wygaszana suma
+embeddingów poprzednich pytań tej sesji (trzymana w session_state). Dzięki h
+krótkie dopytania ("a dlaczego?") wyszukują w temacie poprzedniej tury.
+
+Indeks FAISS to IndexFlatL2 na nienormalizowanych wektorach MiniLM (normy
+ok. 2–4), więc wynik ma długość embeddingu pytania: wektor jednostkowy
+w odległości L2 faworyzowałby fragmenty o najmniejszej normie.
+
+Zgodność z dotychczasowym zapytaniem z doklejonym dopiskiem:
+    python query_vector.py --json "RAG/rag old/summaries.json" --index "RAG/rag old/summaries.index"
+"""
+import argparse
+import json
+from typing import List, Optional
+
+import numpy as np
+
+from rag_config import RAG_QUERY_SUFFIX
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 1e-12 else vector
+
+
+class QueryVectorBuilder:
+    """
+    Args:
+        suffix_embedding: embedding stałego dopisku tematycznego (liczony raz).
+        suffix_weight: waga dopisku względem nowego pytania.
+        history_weight: waga historii poprzednich pytań.
+        history_decay: mnożnik wygaszania historii na każdą turę (0 = bez historii).
+    """
+
+    def __init__(self, suffix_embedding: np.ndarray, suffix_weight: float = 0.5,
+                 history_weight: float = 0.35, history_decay: float = 0.5):
+        self.suffix = _normalize(suffix_embedding).reshape(-1)
+        self.suffix_weight = suffix_weight
+        self.history_weight = history_weight
+        self.history_decay = history_decay
+
+    def combine(self, text_embedding: np.ndarray, history: Optional[np.ndarray] = None) -> np.ndarray:
+        """Wektor zapytania z embeddingu nowego tekstu, dopisku i historii sesji (o długości e(tekst))."""
+        text_embedding = np.asarray(text_embedding, dtype=np.float32).reshape(-1)
+        query = _normalize(text_embedding) + self.suffix_weight * self.suffix
+        if history is not None and self.history_weight > 0:
+            query = query + self.history_weight * _normalize(history)
+        return _normalize(query) * np.float32(np.linalg.norm(text_embedding))
+
+    def update(self, history: Optional[np.ndarray], text_embedding: np.ndarray) -> Optional[np.ndarray]:
+        """Nowa historia po turze: h' = decay * h + norm(e(pytanie))."""
+        if self.history_decay <= 0:
+            return None
+        current = _normalize(text_embedding).reshape(-1)
+        if history is None:
+            return current
+        return (self.history_decay * np.asarray(history, dtype=np.float32) + current).astype(np.float32)
+
+
+# --- Zgodność z dotychczasowym wyszukiwaniem ---
+
+DEFAULT_SUFFIX = RAG_QUERY_SUFFIX
+
+
+def agreement(texts: List[str], index, encode, suffix: str = DEFAULT_SUFFIX, k: int = 20,
+              queries: int = 100, prefix_chars: int = 160, seed: int = 7) -> dict:
+    """
+    Porównuje top-k dla zapytań będących początkami losowych fragmentów (prawie-kopie):
+    dotychczasowe `e("<pytanie> <dopisek>")` kontra QueryVectorBuilder.combine(e(pytanie)).
+    """
+    rng = np.random.RandomState(seed)
+    picks = rng.choice(len(texts), size=min(queries, len(texts)), replace=False)
+    questions = [texts[i][:prefix_chars] for i in picks]
+    builder = QueryVectorBuilder(encode([suffix])[0])
+    old_vectors = np.asarray(encode([f"{q} {suffix}" for q in questions]), dtype=np.float32)
+    new_vectors = np.vstack([builder.combine(e) for e in encode(questions)]).astype(np.float32)
+    _, old_ids = index.search(old_vectors, k)
+    _, new_ids = index.search(new_vectors, k)
+
+    norms = np.linalg.norm(index.reconstruct_n(0, index.ntotal), axis=1)
+    low_norm = set(np.argsort(norms)[:60].tolist())
+
+    def low_share(ids):
+        hits = [int(i) for i in ids.ravel() if i >= 0]
+        return round(sum(i in low_norm for i in hits) / max(1, len(hits)), 3)
+
+    return {
+        "queries": len(questions),
+        "overlap_at_k": round(float(np.mean([len(set(a) & set(b)) / k for a, b in zip(old_ids, new_ids)])), 3),
+        "self_hit_old": round(float(np.mean([p in row for p, row in zip(picks, old_ids)])), 3),
+        "self_hit_new": round(float(np.mean([p in row for p, row in zip(picks, new_ids)])), 3),
+        "low_norm_share_old": low_share(old_ids),
+        "low_norm_share_new": low_share(new_ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zgodność wektora zapytania z dotychczasowym zapytaniem z dopiskiem")
+    parser.add_argument("--json", required=True, help="fragmenty (lista {'text': ...}) w kolejności indeksu")
+    parser.add_argument("--index", required=True, help="pozycyjny indeks FAISS tych fragmentów")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--min-overlap", type=float, default=0.6)
+    args = parser.parse_args()
+
+    import faiss
+    from embedding_backend import load_embedding_backend
+
+    with open(args.json, encoding="utf-8") as f:
+        texts = [item["text"] for item in json.load(f)]
+    model = load_embedding_backend()
+    report = agreement(texts, faiss.read_index(args.index),
+                       lambda batch: model.encode(batch, convert_to_numpy=True, batch_size=64),
+                       k=args.k, queries=args.queries)
+    print(json.dumps(report, indent=2))
+    ok = report["overlap_at_k"] >= args.min_overlap and report["self_hit_new"] >= report["self_hit_old"] - 0.05
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
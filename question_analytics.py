@@ -0,0 +1,326 @@
+"""
+Analiza pytań uczestników (offline).
+
+Z kolumny z logiem rozmowy (Y) wyciągane są wszystkie wypowiedzi "User: ...".
+Unikalne pytania są kodowane tym samym modelem MiniLM co w aplikacji, dużymi
+paczkami w puli procesów (każdy proces ładuje model raz), a następnie:
+
+1. grupowane sferycznym k-means – dla każdego tematu: liczność, pytanie
+   najbliższe środkowi, przykłady i udział w grupach A/B/C,
+2. odtwarzane jest wyszukiwanie RAG z aplikacji (wektor zapytania z historią
+   rozmowy, query_vector.py; ustawienia z rag_config.py, także re-ranking
+   cross-encoderem przy RERANK_ENABLED=1 – offline bez budżetu czasu tury;
+   pytania o postulaty omijają wyszukiwanie jak w retrieve_context) – raport
+   liczy trafienia fragmentów i wypisuje fragmenty, których nie pobrało
+   żadne pytanie,
+3. najczęstsze pierwsze pytania trafiają do RAG/frequent_openers.json,
+   z którego aplikacja liczy cache wyszukiwania przy starcie
+   (load_frequent_openers / precompute_openers).
+
+    python question_analytics.py --backend local --path sheets.sqlite --out analytics
+    python question_analytics.py --backend google --credentials sa.json --workers 8 --clusters 15
+"""
+import argparse
+import csv
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from participant_record import COL_CONVERSATION_LOG, COL_GROUP
+from rag_config import (
+    FREQUENT_OPENERS_PATH, POSTULATES_SOURCE, QUERY_HISTORY_DECAY, QUERY_HISTORY_WEIGHT, QUERY_SUFFIX_WEIGHT,
+    RAG_CANDIDATES_K, RAG_CORPUS_DIR, RAG_QUERY_SUFFIX, RERANK_ENABLED, RERANK_MODEL, RERANK_TOP_N,
+    TOP_K, normalize_query,
+)
+from study_export import DEFAULT_SHEET_ID, GROUPS, read_rows, to_matrix
+
+_SPEAKER = re.compile(r"^(User|Bot): ", re.MULTILINE)
+
+
+def parse_user_turns(log: str) -> List[str]:
+    """Wypowiedzi użytkownika z logu "User: ...\\nBot: ..." (wiadomość może mieć kilka linii)."""
+    return parse_turns(log, "User")
+
+
+def parse_turns(log: str, speaker: str) -> List[str]:
+    """Wypowiedzi jednej strony ("User" albo "Bot") z logu rozmowy."""
+    turns = []
+    marks = list(_SPEAKER.finditer(log or ""))
+    for i, mark in enumerate(marks):
+        if mark.group(1) != speaker:
+            continue
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(log)
+        text = log[mark.end():end].strip()
+        if text:
+            turns.append(text)
+    return turns
+
+
+# --- Embeddingi w puli procesów ---
+
+_worker_model = None
+
+
+def _init_worker(backend: str, threads: int) -> None:
+    global _worker_model
+    # Kilka procesów po kilka wątków zamiast jednego procesu rywalizującego o wszystkie rdzenie
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    from embedding_backend import load_embedding_backend
+    _worker_model = load_embedding_backend(backend)
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_model.encode(texts, convert_to_numpy=True, batch_size=64), dtype=np.float32)
+
+
+def embed_texts(texts: Sequence[str], backend: str = "torch", workers: int = 1,
+                batch_size: int = 512) -> np.ndarray:
+    """Embeddingi tekstów (kolejność zachowana); workers > 1 – pula procesów."""
+    if not texts:
+        return np.zeros((0, 384), dtype=np.float32)
+    batches = [list(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+    workers = max(1, min(workers, len(batches)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    if workers == 1:
+        _init_worker(backend, threads)
+        return np.vstack([_encode(b) for b in batches])
+    # spawn: procesy nie dziedziczą stanu wątków PyTorch/ONNX z procesu głównego
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn"),
+                             initializer=_init_worker, initargs=(backend, threads)) as pool:
+        return np.vstack(list(pool.map(_encode, batches)))
+
+
+# --- Grupowanie ---
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 50,
+                     seed: int = 7) -> Tuple[np.ndarray, np.ndarray]:
+    """(etykiety, środki) k-means na sferze (podobieństwo cosinusowe), inicjalizacja k-means++."""
+    x = _unit(vectors)
+    n = len(x)
+    k = max(1, min(k, n))
+    rng = np.random.RandomState(seed)
+    centers = [x[rng.randint(n)]]
+    closest = 1 - x @ centers[0]
+    for _ in range(1, k):
+        weights = np.clip(closest, 0, None) ** 2
+        total = weights.sum()
+        pick = rng.choice(n, p=weights / total) if total > 0 else rng.randint(n)
+        centers.append(x[pick])
+        closest = np.minimum(closest, 1 - x @ x[pick])
+    centers = np.vstack(centers)
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        new_labels = np.argmax(x @ centers.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = x[labels == c]
+            if len(members):
+                centers[c] = members.sum(axis=0)
+        centers = _unit(centers)
+    return labels, centers
+
+
+def default_clusters(n: int) -> int:
+    return int(max(2, min(20, round(np.sqrt(n / 2)))))
+
+
+# --- Odtworzenie wyszukiwania RAG ---
+
+def replay_retrieval(conversations: List[List[int]], embeddings: np.ndarray, texts: Sequence[str],
+                     skip: np.ndarray, suffix_embedding: np.ndarray, corpus, k: int = TOP_K,
+                     reranker=None, top_n: int = RERANK_TOP_N) -> Counter:
+    """
+    Liczba pobrań każdego fragmentu przy wyszukiwaniu jak w retrieve_context: dla każdej
+    rozmowy kolejne pytania z wygaszaną historią; `skip` – pytania o postulaty, obsłużone
+    bez wyszukiwania. Wszystkie wektory zapytań idą do FAISS jednym `search`; z `reranker`
+    kandydaci są zawężani do `top_n` jak w aplikacji.
+    """
+    from query_vector import QueryVectorBuilder
+    builder = QueryVectorBuilder(suffix_embedding, suffix_weight=QUERY_SUFFIX_WEIGHT,
+                                 history_weight=QUERY_HISTORY_WEIGHT, history_decay=QUERY_HISTORY_DECAY)
+    vectors = []
+    asked = []
+    for question_ids in conversations:
+        history = None
+        for q in question_ids:
+            if skip[q]:
+                continue  # tabela postulatów nie zmienia też historii wektora zapytania
+            vectors.append(builder.combine(embeddings[q], history))
+            asked.append(q)
+            history = builder.update(history, embeddings[q])
+    hits: Counter = Counter()
+    if not vectors:
+        return hits
+    _, ids = corpus.search(np.vstack(vectors), k)
+    for q, row in zip(asked, ids):
+        row = [int(i) for i in row if int(i) in corpus.text_by_id]
+        if reranker is not None:
+            id_by_text = {corpus.text_by_id[i]: i for i in row}
+            ranked = reranker.rerank(texts[q], [corpus.text_by_id[i] for i in row], top_n=top_n)
+            row = [id_by_text[text] for text in ranked]
+        hits.update(row)
+    return hits
+
+
+def load_corpus(corpus_dir: str):
+    from corpus_store import latest_version_path, load_version
+    latest = latest_version_path(corpus_dir)
+    return load_version(latest) if latest else None
+
+
+# --- Raport ---
+
+def analyse(rows: Sequence[Sequence[str]], out_dir: str, backend: str = "torch", workers: int = 1,
+            clusters: Optional[int] = None, corpus_dir: str = RAG_CORPUS_DIR, top_k: int = TOP_K,
+            openers_out: str = FREQUENT_OPENERS_PATH, openers_limit: int = 30,
+            openers_min_count: int = 2, rerank: bool = RERANK_ENABLED) -> Dict[str, Any]:
+    _, matrix = to_matrix(rows)
+
+    # Pytania: unikalne teksty (po normalizacji) kodujemy raz
+    unique: Dict[str, int] = {}
+    texts: List[str] = []
+    conversations: List[List[int]] = []
+    question_groups: List[str] = []
+    question_ids: List[int] = []
+    opener_counts: Counter = Counter()
+    opener_surface: Dict[str, Counter] = defaultdict(Counter)
+    for log, group in zip(matrix[:, COL_CONVERSATION_LOG], matrix[:, COL_GROUP]):
+        turns = parse_user_turns(log)
+        conversation = []
+        for position, text in enumerate(turns):
+            key = normalize_query(text)
+            if not key:
+                continue
+            if key not in unique:
+                unique[key] = len(texts)
+                texts.append(text)
+            conversation.append(unique[key])
+            question_groups.append(group)
+            question_ids.append(unique[key])
+            if position == 0:
+                opener_counts[key] += 1
+                opener_surface[key][text.strip()] += 1
+        conversations.append(conversation)
+
+    os.makedirs(out_dir, exist_ok=True)
+    report: Dict[str, Any] = {"conversations": len(conversations), "questions": len(question_ids),
+                              "unique_questions": len(texts)}
+    if not texts:
+        return report
+
+    corpus = load_corpus(corpus_dir)
+    embeddings = embed_texts(texts + [RAG_QUERY_SUFFIX], backend, workers)
+    suffix_embedding, embeddings = embeddings[-1], embeddings[:-1]
+
+    # 1) Tematy
+    k = clusters or default_clusters(len(texts))
+    labels, centers = spherical_kmeans(embeddings, k)
+    unit = _unit(embeddings)
+    counts = np.zeros((len(GROUPS), len(centers)), dtype=np.int64)
+    group_pos = {g: i for i, g in enumerate(GROUPS)}
+    for group, q in zip(question_groups, question_ids):
+        counts[group_pos[group], labels[q]] += 1
+    topics = []
+    for c in np.argsort(-counts.sum(axis=0)):
+        members = np.flatnonzero(labels == c)
+        if not len(members):
+            continue
+        order = members[np.argsort(-(unit[members] @ centers[c]))]
+        topics.append({
+            "topic": int(c),
+            "questions": int(counts[:, c].sum()),
+            "representative": texts[order[0]],
+            "examples": [texts[i] for i in order[1:6]],
+            "by_group": {g: int(counts[group_pos[g], c]) for g in GROUPS},
+        })
+    with open(os.path.join(out_dir, "question_topics.json"), "w", encoding="utf-8") as f:
+        json.dump(topics, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(out_dir, "group_topics.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["group", "questions"] + [f"topic_{t['topic']}" for t in topics])
+        for g in GROUPS:
+            row = counts[group_pos[g]]
+            total = int(row.sum())
+            writer.writerow([g, total] + [round(row[t["topic"]] / total, 4) if total else 0 for t in topics])
+    report["topics"] = len(topics)
+
+    # 2) Fragmenty, których nie pobrało żadne pytanie
+    if corpus is not None:
+        skip = np.zeros(len(texts), dtype=bool)
+        if os.path.exists(POSTULATES_SOURCE):
+            from postulates import PostulateTable
+            table = PostulateTable.load(POSTULATES_SOURCE)
+            skip = np.array([bool(table.match(t)) for t in texts])
+        reranker = None
+        if rerank:
+            from reranker import CrossEncoderReranker
+            reranker = CrossEncoderReranker(RERANK_MODEL)
+        search_k = max(top_k, RAG_CANDIDATES_K) if reranker is not None else top_k
+        hits = replay_retrieval(conversations, embeddings, texts, skip, suffix_embedding, corpus, search_k, reranker)
+        from corpus_store import chunk_int_id
+        chunk_usage = sorted(
+            ({"id": c["id"], "hits": hits.get(chunk_int_id(c["id"]), 0), "text": c["text"][:200]}
+             for c in corpus.chunks),
+            key=lambda item: item["hits"],
+        )
+        never = [item for item in chunk_usage if item["hits"] == 0]
+        with open(os.path.join(out_dir, "chunk_usage.json"), "w", encoding="utf-8") as f:
+            json.dump({"corpus_version": corpus.version, "top_k": top_k, "reranked": reranker is not None,
+                       "never_retrieved": never, "chunks": chunk_usage}, f, ensure_ascii=False, indent=2)
+        report["never_retrieved"] = len(never)
+        report["chunks"] = len(chunk_usage)
+
+    # 3) Najczęstsze pierwsze pytania (cache wyszukiwania działa na dokładnym, znormalizowanym tekście)
+    openers = [opener_surface[key].most_common(1)[0][0]
+               for key, count in opener_counts.most_common(openers_limit) if count >= openers_min_count]
+    if openers_out:
+        os.makedirs(os.path.dirname(openers_out) or ".", exist_ok=True)
+        with open(f"{openers_out}.tmp", "w", encoding="utf-8") as f:
+            json.dump(openers, f, ensure_ascii=False, indent=2)
+        os.replace(f"{openers_out}.tmp", openers_out)
+    report["frequent_openers"] = len(openers)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analiza pytań uczestników (tematy, pokrycie korpusu, częste pierwsze pytania)")
+    parser.add_argument("--backend", choices=("local", "google"), default="local")
+    parser.add_argument("--path", default=os.environ.get("GSHEETS_LOCAL_PATH", "sheets.sqlite"))
+    parser.add_argument("--credentials", default="")
+    parser.add_argument("--sheet-id", default=DEFAULT_SHEET_ID)
+    parser.add_argument("--out", default="analytics")
+    parser.add_argument("--embedding-backend", default=os.environ.get("EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)))
+    parser.add_argument("--clusters", type=int, default=None, help="liczba tematów (domyślnie ~sqrt(n/2))")
+    parser.add_argument("--corpus-dir", default=RAG_CORPUS_DIR)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--rerank", action=argparse.BooleanOptionalAction, default=RERANK_ENABLED,
+                        help="re-ranking cross-encoderem jak w aplikacji (domyślnie RERANK_ENABLED)")
+    parser.add_argument("--openers-out", default=FREQUENT_OPENERS_PATH,
+                        help="plik listy częstych pierwszych pytań ('' = nie zapisuj)")
+    parser.add_argument("--openers-limit", type=int, default=30)
+    parser.add_argument("--openers-min-count", type=int, default=2)
+    args = parser.parse_args()
+
+    rows = read_rows(args.backend, args.path, args.credentials, args.sheet_id)
+    report = analyse(rows, args.out, args.embedding_backend, args.workers, args.clusters,
+                     args.corpus_dir, args.top_k, args.openers_out, args.openers_limit,
+                     args.openers_min_count, args.rerank)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
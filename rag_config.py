@@ -0,0 +1,43 @@
+"""
+Wspólne ustawienia wyszukiwania RAG.
+
+Importowane przez aplikację (ConversBOT_TEST.py) i przez narzędzia offline
+(question_analytics.py, query_vector.py), żeby odtworzenie wyszukiwania
+nie rozjechało się z tym, co widzą uczestnicy. Wartości można nadpisać
+zmiennymi środowiskowymi o tych samych nazwach.
+"""
+import os
+
+TOP_K = 20  # Number of top results to return from RAG search
+
+# Stały dopisek tematyczny do zapytań RAG – jego embedding liczony jest raz (query_vector.py)
+RAG_QUERY_SUFFIX = "pseudohodowle dobrostan zwierząt petycja"
+# Składanie wektora zapytania: waga dopisku, waga i wygaszanie historii poprzednich pytań sesji
+QUERY_SUFFIX_WEIGHT = float(os.environ.get("QUERY_SUFFIX_WEIGHT", "0.5"))
+QUERY_HISTORY_WEIGHT = float(os.environ.get("QUERY_HISTORY_WEIGHT", "0.35"))
+QUERY_HISTORY_DECAY = float(os.environ.get("QUERY_HISTORY_DECAY", "0.5"))
+
+# Opcjonalny re-ranking cross-encoderem (reranker.py): szerszy zbiór kandydatów z FAISS,
+# z którego zostaje kilka najlepszych; pomijany, gdy nie mieści się w budżecie tury
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "40"))
+RERANK_TOP_N = int(os.environ.get("RERANK_TOP_N", "6"))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "300"))
+
+# Liczba kandydatów pobieranych z FAISS (i liczonych z góry dla częstych pierwszych pytań)
+RAG_CANDIDATES_K = max(TOP_K, RERANK_CANDIDATES) if RERANK_ENABLED else TOP_K
+
+# Wersjonowany katalog korpusu (corpus_store.py)
+RAG_CORPUS_DIR = os.environ.get("RAG_CORPUS_DIR", "RAG/corpus")
+
+# Opcjonalna lista dodatkowych częstych pierwszych pytań (JSON: lista napisów)
+FREQUENT_OPENERS_PATH = os.environ.get("FREQUENT_OPENERS_PATH", "RAG/frequent_openers.json")
+
+# Tabela postulatów (postulates.py) budowana z roles_cache.json
+POSTULATES_SOURCE = os.environ.get("POSTULATES_SOURCE", "RAG/roles_cache.json")
+
+
+def normalize_query(text: str) -> str:
+    """Klucz cache: małe litery, pojedyncze spacje, bez końcowej interpunkcji."""
+    return " ".join(text.lower().split()).rstrip(" .!?")
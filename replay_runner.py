@@ -0,0 +1,178 @@
+"""
+Odtwarzanie zapisanych rozmów przez bota wszystkich grup (bez interfejsu).
+
+Każda rozmowa z pliku skryptów jest przechodzona osobno dla grup A/B/C
+dokładnie tak, jak w kroku 3 aplikacji: powitanie grupy, retrieve_context
+z historią wektora zapytania, build_chat_messages, create_chat_completion
+(wspólny limiter i odporny klient), podział odpowiedzi na zdania. Moduł
+aplikacji importowany jest bez serwera Streamlit (tryb "bare"), więc
+potrzebuje tych samych sekretów co aplikacja.
+
+Rozmowy × grupy wykonują się współbieżnie (asyncio, najwyżej `--concurrency`
+naraz); tury jednej rozmowy – kolejno. Wyszukiwania z równoległych rozmów
+łączą się w paczki w RetrievalBatcher, a wywołania API przechodzą przez
+limit RPM/TPM, więc pilot 100 rozmów × 3 grupy trwa minuty.
+
+Plik skryptów (JSON lub JSONL): {"id": "r1", "turns": ["Pytanie 1", "Pytanie 2"]}
+albo sama lista pytań. Wynik: jedna linia JSONL na turę (odpowiedź, tokeny,
+czasy) i podsumowanie na grupę.
+
+    python replay_runner.py scripts.jsonl --out replay.jsonl
+    python replay_runner.py scripts.jsonl --prompts wariant_B.json --groups B --concurrency 32
+    OPENAI_BASE_URL=http://127.0.0.1:8800/v1 python replay_runner.py scripts.jsonl   # llm_standin.py
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+GROUPS = ("A", "B", "C")
+
+
+def load_scripts(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = json.load(f)
+    scripts = []
+    for i, item in enumerate(items):
+        if isinstance(item, list):
+            item = {"turns": item}
+        scripts.append({"id": str(item.get("id", i)), "turns": [str(t) for t in item["turns"]]})
+    return scripts
+
+
+def load_prompts(app, path: Optional[str]) -> Dict[str, Dict[str, str]]:
+    """DEFAULT_PROMPTS aplikacji z nadpisanymi polami z pliku wariantu ({"B": {"system_prompt": ...}})."""
+    prompts = {group: dict(values) for group, values in app.DEFAULT_PROMPTS.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for group, values in json.load(f).items():
+                prompts.setdefault(group, {}).update(values)
+    return prompts
+
+
+def replay_conversation(app, script: Dict[str, Any], group: str, prompt: Dict[str, str],
+                        model: str, temperature: float) -> List[Dict[str, Any]]:
+    """Jedna rozmowa w jednej grupie (synchronicznie, jak przebieg kroku 3)."""
+    history = app.TurnStore([app.Turn(bot=prompt.get("welcome", "Witaj!"))])
+    query_history = None
+    session_id = f"replay:{group}:{script['id']}"
+    records = []
+    for turn_no, user_message in enumerate(script["turns"], start=1):
+        history.append_user(user_message)
+        record: Dict[str, Any] = {"conversation": script["id"], "group": group, "turn": turn_no,
+                                  "user": user_message}
+        turn_start = time.perf_counter()
+        try:
+            retrieved_context, query_history = app.retrieve_context(user_message, turn_start, query_history)
+            retrieval_end = time.perf_counter()
+            messages = app.build_chat_messages(prompt.get("system_prompt", ""), history, retrieved_context)
+            resp = app.create_chat_completion(session_id, messages, model=model, temperature=temperature)
+            bot_text = resp.choices[0].message.content
+            usage = getattr(resp, "usage", None)
+            record.update({
+                "response": bot_text,
+                "context_chunks": len(retrieved_context),
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+                "total_tokens": getattr(usage, "total_tokens", None),
+                "retrieval_ms": round((retrieval_end - turn_start) * 1000, 1),
+                "llm_ms": round((time.perf_counter() - retrieval_end) * 1000, 1),
+            })
+            history.append_bot(app.split_sentences(bot_text))
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            history.append_bot(f"Błąd: {e}")
+        record["latency_ms"] = round((time.perf_counter() - turn_start) * 1000, 1)
+        records.append(record)
+    return records
+
+
+async def run(app, scripts: Sequence[Dict[str, Any]], groups: Sequence[str], prompts: Dict[str, Dict[str, str]],
+              out_path: str, concurrency: int = 16, model: Optional[str] = None,
+              temperature: float = 0.4) -> List[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    # Wywołania aplikacji są blokujące – każda aktywna rozmowa dostaje własny wątek
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay")
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Dict[str, Any]] = []
+    done = 0
+    total = len(scripts) * len(groups)
+
+    with open(out_path, "w", encoding="utf-8") as out:
+        async def one(script, group):
+            nonlocal done
+            async with semaphore:
+                records = await loop.run_in_executor(
+                    executor, replay_conversation, app, script, group, prompts[group],
+                    model or app.DEFAULT_MODEL, temperature)
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            results.extend(records)
+            done += 1
+            if done % 10 == 0 or done == total:
+                print(f"  {done}/{total} rozmów")
+
+        try:
+            await asyncio.gather(*(one(script, group) for script in scripts for group in groups))
+        finally:
+            executor.shutdown(wait=False)
+    return results
+
+
+def summarize(records: Sequence[Dict[str, Any]], groups: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    for group in groups:
+        rows = [r for r in records if r["group"] == group]
+        ok = [r for r in rows if "error" not in r]
+        latency = np.array([r["latency_ms"] for r in ok]) if ok else np.zeros(0)
+        summary[group] = {
+            "conversations": len({r["conversation"] for r in rows}),
+            "turns": len(rows),
+            "errors": len(rows) - len(ok),
+            "latency_p50_ms": round(float(np.percentile(latency, 50)), 1) if latency.size else None,
+            "latency_p95_ms": round(float(np.percentile(latency, 95)), 1) if latency.size else None,
+            "total_tokens": int(sum(r.get("total_tokens") or 0 for r in ok)),
+            "mean_response_chars": round(float(np.mean([len(r["response"]) for r in ok])), 1) if ok else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Odtwarzanie rozmów przez boty grup A/B/C")
+    parser.add_argument("scripts", help="plik JSON/JSONL z rozmowami")
+    parser.add_argument("--out", default="replay.jsonl")
+    parser.add_argument("--groups", nargs="+", default=list(GROUPS), choices=GROUPS)
+    parser.add_argument("--prompts", default=None, help="JSON z nadpisaniami DEFAULT_PROMPTS (wariant promptu)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--model", default=None, help="domyślnie DEFAULT_MODEL aplikacji")
+    parser.add_argument("--temperature", type=float, default=0.4)
+    args = parser.parse_args()
+
+    import ConversBOT_TEST as app  # ładuje też zasoby RAG w tle
+
+    scripts = load_scripts(args.scripts)
+    prompts = load_prompts(app, args.prompts)
+    t0 = time.perf_counter()
+    app.rag_resources.wait()
+    if app.rag_resources.error:
+        raise SystemExit(f"Zasoby RAG niedostępne: {app.rag_resources.error}")
+    print(f"RAG gotowy po {time.perf_counter() - t0:.1f} s; {len(scripts)} rozmów × {len(args.groups)} grup, "
+          f"współbieżność {args.concurrency}")
+
+    t0 = time.perf_counter()
+    records = asyncio.run(run(app, scripts, args.groups, prompts, args.out, args.concurrency,
+                              args.model, args.temperature))
+    print(f"Gotowe w {time.perf_counter() - t0:.1f} s, wynik: {args.out}")
+    print(json.dumps(summarize(records, args.groups), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Opcjonalny etap re-rankingu fragmentów po `search_rag`.
+
+FAISS (bi-encoder MiniLM) zwraca szerszą listę kandydatów, a mały
+wielojęzyczny cross-encoder ocenia pary (pytanie, fragment) i zostawia
+kilka najlepszych. Wyniki par są cache'owane (LRU), a etap pomija się
+sam, jeśli szacowany czas przekroczyłby budżet bieżącej tury.
+
+Koszt pary to średnia krocząca z rzeczywistych wywołań modelu, zasiana
+w `warm_up()` pomiarem paczki o rozmiarze listy kandydatów. Co
+`probe_every`-ta tura ponad budżetem i tak jest oceniana, żeby zawyżone
+oszacowanie (np. po chwilowym obciążeniu) mogło się skorygować.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class ScoreCache:
+    """Wątkowo bezpieczny LRU: (pytanie, fragment) -> wynik cross-encodera."""
+
+    def __init__(self, max_size: int = 20000):
+        self.max_size = max_size
+        self._data: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str, text: str) -> Tuple[str, str]:
+        # Fragmenty mają ~500 znaków – w kluczu trzymamy ich skrót, nie całą treść
+        normalized = " ".join(query.lower().split())
+        return normalized, hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._data.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key: Tuple[str, str], score: float) -> None:
+        with self._lock:
+            self._data[key] = score
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+class CrossEncoderReranker:
+    """
+    Args:
+        model_name: nazwa modelu CrossEncoder (sentence-transformers).
+        cache_size: pojemność cache wyników par.
+        initial_pair_ms: startowe oszacowanie kosztu jednej pary, zanim warm_up() je zmierzy
+            (potem średnia krocząca).
+        probe_every: co która tura pominięta z powodu budżetu jest mimo to oceniana
+            (0 = nigdy).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, cache_size: int = 20000,
+                 initial_pair_ms: float = 5.0, probe_every: int = 20):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=256)
+        self.cache = ScoreCache(cache_size)
+        self._pair_cost_s = initial_pair_ms / 1000.0
+        self._lock = threading.Lock()
+        self.probe_every = probe_every
+        self._skip_streak = 0
+        self.skipped = 0
+        self.probes = 0
+
+    def warm_up(self, n_pairs: int = 40, text_chars: int = 500) -> None:
+        """Inicjalizuje model i mierzy koszt pary na paczce wielkości listy kandydatów."""
+        self.model.predict([("rozgrzewka", "rozgrzewka")])
+        text = ("Petycja dotyczy dobrostanu zwierząt w hodowlach. " * (text_chars // 50 + 1))[:text_chars]
+        pairs = [("Jaki jest główny cel tej petycji?", text)] * max(1, n_pairs)
+        t0 = time.perf_counter()
+        self.model.predict(pairs, batch_size=32)
+        with self._lock:
+            self._pair_cost_s = (time.perf_counter() - t0) / len(pairs)
+
+    def _over_budget(self, n_pairs: int, deadline: Optional[float]) -> bool:
+        """Czy pominąć ocenę; co `probe_every`-te przekroczenie i tak ją przepuszcza (pomiar)."""
+        if deadline is None or time.perf_counter() + self.estimated_cost(n_pairs) <= deadline:
+            self._skip_streak = 0
+            return False
+        self._skip_streak += 1
+        if self.probe_every and self._skip_streak >= self.probe_every:
+            self._skip_streak = 0
+            self.probes += 1
+            return False
+        return True
+
+    def estimated_cost(self, n_pairs: int) -> float:
+        return self._pair_cost_s * n_pairs
+
+    def _record_cost(self, n_pairs: int, elapsed: float) -> None:
+        with self._lock:
+            self._pair_cost_s = 0.8 * self._pair_cost_s + 0.2 * (elapsed / n_pairs)
+
+    def rerank(self, query: str, candidates: Sequence[str], top_n: int,
+               deadline: Optional[float] = None, fallback_k: Optional[int] = None) -> List[str]:
+        """
+        Zwraca `top_n` najlepszych fragmentów według cross-encodera.
+
+        Jeśli ocena brakujących par nie zmieści się przed `deadline`
+        (time.perf_counter()), etap jest pomijany i zwracane jest pierwsze
+        `fallback_k` kandydatów w kolejności z FAISS.
+        """
+        if not candidates:
+            return []
+        keys = [self.cache.key(query, text) for text in candidates]
+        scores: List[Optional[float]] = [self.cache.get(k) for k in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+
+        if missing:
+            if self._over_budget(len(missing), deadline):
+                self.skipped += 1
+                return list(candidates[:fallback_k or len(candidates)])
+            t0 = time.perf_counter()
+            predicted = self.model.predict([(query, candidates[i]) for i in missing], batch_size=32)
+            self._record_cost(len(missing), time.perf_counter() - t0)
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                self.cache.put(keys[i], float(score))
+
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_n]]
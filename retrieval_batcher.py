@@ -0,0 +1,227 @@
+"""
+Wspólny wykonawca wyszukiwania RAG dla wszystkich sesji Streamlit.
+
+Każda sesja działa w osobnym wątku; zamiast wywoływać `encode([q])` i
+`faiss_index.search(q, k)` osobno, wątki oddają zapytania do kolejki.
+Jeden wątek roboczy zbiera zapytania, które przyszły w ciągu kilku
+milisekund, i wykonuje jedno zbiorcze `encode` oraz jedno `search`.
+
+Benchmark (model kosztów z blokadą symulującą GIL/CPU):
+    python retrieval_batcher.py --sessions 32 --queries 20
+"""
+import argparse
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class _Request:
+    __slots__ = ("query", "k", "search_fn", "vector_fn", "future")
+
+    def __init__(self, query: str, k: int, search_fn: Callable[[Any, int], Tuple[Any, Any]],
+                 vector_fn: Optional[Callable[[Any], Any]] = None):
+        self.query = query
+        self.k = k
+        self.search_fn = search_fn
+        self.vector_fn = vector_fn
+        self.future: Future = Future()
+
+
+class RetrievalBatcher:
+    """
+    Args:
+        encode_fn: lista zapytań -> macierz embeddingów (n, dim).
+        search_fn: (macierz embeddingów, k) -> (distances, indices), każde o kształcie (n, k).
+            Domyślna funkcja wyszukiwania; pojedyncze zapytanie może podać własną
+            (np. indeks konkretnej wersji korpusu) – wtedy paczka dzieli się na grupy.
+        max_wait_ms: jak długo czekać na kolejne zapytania po pierwszym w paczce.
+        max_batch: górny limit rozmiaru paczki (ogranicza czas jednej paczki, a więc ogon opóźnień).
+
+    Zapytanie może też podać `vector_fn` – przekształcenie embeddingu tekstu w wektor,
+    którym faktycznie się wyszukuje (np. dołożenie dopisku tematycznego i historii rozmowy).
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], Any],
+                 search_fn: Callable[[Any, int], Tuple[Any, Any]],
+                 max_wait_ms: float = 5.0, max_batch: int = 32):
+        self.encode_fn = encode_fn
+        self.search_fn = search_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self.stats = {"batches": 0, "queries": 0, "max_batch_seen": 0}
+        self._worker = threading.Thread(target=self._run, name="rag-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, query: str, k: int,
+               search_fn: Optional[Callable[[Any, int], Tuple[Any, Any]]] = None,
+               vector_fn: Optional[Callable[[Any], Any]] = None) -> Future:
+        """
+        Dodaje zapytanie do kolejki; Future zwraca (distances_row, indices_row, embedding),
+        gdzie embedding to embedding samego tekstu zapytania (przed `vector_fn`).
+        """
+        request = _Request(query, k, search_fn or self.search_fn, vector_fn)
+        self._queue.put(request)
+        return request.future
+
+    def search(self, query: str, k: int, timeout: Optional[float] = None,
+               search_fn: Optional[Callable[[Any, int], Tuple[Any, Any]]] = None,
+               vector_fn: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, Any, Any]:
+        """Wersja blokująca `submit` – do użycia bezpośrednio w search_rag."""
+        return self.submit(query, k, search_fn, vector_fn).result(timeout=timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # zachowaj sygnał zamknięcia dla pętli głównej
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            self._execute(batch)
+
+    def _execute(self, batch: List[_Request]) -> None:
+        try:
+            embeddings = self.encode_fn([r.query for r in batch])
+        except Exception as e:
+            for r in batch:
+                r.future.set_exception(e)
+            return
+
+        vectors = embeddings
+        failed = set()
+        if any(r.vector_fn is not None for r in batch):
+            vectors = embeddings.copy()
+            for position, r in enumerate(batch):
+                if r.vector_fn is None:
+                    continue
+                try:
+                    vectors[position] = r.vector_fn(embeddings[position])
+                except Exception as e:
+                    # Błąd jednego zapytania (np. historia z NaN) nie może zatrzymać wspólnego wątku
+                    r.future.set_exception(e)
+                    failed.add(position)
+
+        # Jedno search na każdą funkcję wyszukiwania (zwykle jedna – bieżąca wersja korpusu);
+        # metody związane porównują się po obiekcie, więc `corpus.search` z różnych sesji trafia razem
+        groups: Dict[Callable, List[int]] = {}
+        for position, r in enumerate(batch):
+            if position not in failed:
+                groups.setdefault(r.search_fn, []).append(position)
+        for search_fn, positions in groups.items():
+            try:
+                k_max = max(batch[p].k for p in positions)
+                distances, indices = search_fn(_take_rows(vectors, positions, len(batch)), k_max)
+            except Exception as e:
+                for p in positions:
+                    batch[p].future.set_exception(e)
+                continue
+            for row, p in enumerate(positions):
+                r = batch[p]
+                # Embedding zapytania wraca razem z wynikiem – przydaje się dalej (np. kompresja kontekstu)
+                r.future.set_result((distances[row][:r.k], indices[row][:r.k], embeddings[p]))
+        self.stats["batches"] += 1
+        self.stats["queries"] += len(batch)
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+
+
+def _take_rows(embeddings: Any, positions: List[int], total: int) -> Any:
+    if len(positions) == total:
+        return embeddings
+    if hasattr(embeddings, "take"):  # numpy
+        return embeddings.take(positions, axis=0)
+    return [embeddings[p] for p in positions]
+
+
+# --- Benchmark ---
+
+def _simulated_backend(overhead_ms: float, per_item_ms: float):
+    """Koszt wywołania = stały narzut + koszt na element; blokada odwzorowuje jeden rdzeń/GIL."""
+    cpu = threading.Lock()
+
+    def encode(queries: Sequence[str]):
+        with cpu:
+            time.sleep((overhead_ms + per_item_ms * len(queries)) / 1000.0)
+        return [[0.0] for _ in queries]
+
+    def search(embeddings, k: int):
+        with cpu:
+            time.sleep((overhead_ms / 4 + per_item_ms / 4 * len(embeddings)) / 1000.0)
+        return [[0.0] * k for _ in embeddings], [list(range(k)) for _ in embeddings]
+
+    return encode, search
+
+
+def _run_load(call: Callable[[str], Any], sessions: int, queries: int) -> Tuple[float, List[float]]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def session(i: int):
+        for j in range(queries):
+            t0 = time.perf_counter()
+            call(f"pytanie {i}-{j}")
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, latencies
+
+
+def _report(name: str, wall: float, latencies: List[float]) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:<10} {len(latencies) / wall:8.1f} zapytań/s   p50 {p50:7.1f} ms   p99 {p99:7.1f} ms")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Porównanie wyszukiwania per-zapytanie i zbiorczego")
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--overhead-ms", type=float, default=8.0)
+    parser.add_argument("--per-item-ms", type=float, default=1.0)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    encode, search = _simulated_backend(args.overhead_ms, args.per_item_ms)
+
+    def per_query(q: str):
+        return search(encode([q]), 20)
+
+    _report("per-query", *_run_load(per_query, args.sessions, args.queries))
+
+    batcher = RetrievalBatcher(encode, search, max_wait_ms=args.max_wait_ms)
+    _report("batched", *_run_load(lambda q: batcher.search(q, 20), args.sessions, args.queries))
+    print(f"paczek: {batcher.stats['batches']}, największa: {batcher.stats['max_batch_seen']}")
+    batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Profilowanie przebiegów skryptu Streamlit (tryb opcjonalny).
+
+Każdy przebieg (cały skrypt albo sam fragment czatu) jest próbkowany przez
+wątek, który co `interval` sekund odczytuje stos wątku skryptu
+(`sys._current_frames`) – bez zależności i bez instrumentowania funkcji,
+więc narzut nie zależy od liczby wywołań. Próbka waży tyle, ile czasu minęło
+od poprzedniej: przy obliczeniach trzymających GIL wątek próbkujący budzi się
+rzadziej i zwykłe zliczanie próbek zaniżałoby ich udział.
+
+Profil dostaje etykietę kroku (`step3`, `step3-fragment`, ...). Przebieg tylko
+odkłada go do kolejki; zapis na dysk robi wątek tła, więc profilowanie nie
+wydłuża przebiegów o zapis plików:
+
+    profiles/
+        step3/20250701-120000-000042.folded   – stosy jednego przebiegu (ostatnie `keep_runs` na krok)
+        step3/aggregate.folded                 – suma wszystkich przebiegów kroku (co `flush_interval` s)
+        summary.json                           – czasy (wall/CPU) i najgorętsze funkcje na krok
+
+Pliki .folded ("ramka;ramka;ramka mikrosekundy") otwiera np. speedscope
+albo flamegraph.pl.
+
+    python run_profiler.py profiles            # podsumowanie kroków
+"""
+import argparse
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List
+
+MAX_DEPTH = 128
+KEEP_RUN_TIMES = 1000
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Próbkuje stos jednego wątku w osobnym wątku tła."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005, max_duration: float = 300.0):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_duration = max_duration
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="run-profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        deadline = last + self.max_duration  # przebieg przerwany bez stop() nie próbkuje w nieskończoność
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = int((now - last) * 1e6), now
+            if now > deadline:
+                break
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or frame.f_code.co_filename == __file__:
+                continue  # wątek skryptu właśnie kończy profil
+            labels: List[str] = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += weight
+
+
+class RunProfile:
+    """Profil jednego przebiegu: próbki stosu oraz czas wall i CPU wątku skryptu."""
+
+    def __init__(self, store: "ProfileStore", tag: str, interval: float):
+        self.store = store
+        self.tag = tag
+        self.stopped = False
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.thread_time()
+        self._sampler = StackSampler(threading.get_ident(), interval).start()
+
+    def stop(self) -> None:
+        """Kończy profil (wołać z wątku skryptu) i oddaje go do zapisu; kolejne wywołania nic nie robią."""
+        if self.stopped:
+            return
+        self.stopped = True
+        wall = time.perf_counter() - self._wall0
+        cpu = time.thread_time() - self._cpu0
+        self.store.record(self.tag, wall, cpu, self._sampler.stop())
+
+    def __enter__(self) -> "RunProfile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class ProfileStore:
+    """
+    Args:
+        root: katalog profili.
+        interval: odstęp próbkowania w sekundach.
+        keep_runs: ile plików pojedynczych przebiegów trzymać na krok (starsze są usuwane).
+        flush_interval: co ile sekund wątek tła zapisuje aggregate.folded i summary.json.
+    """
+
+    def __init__(self, root: str, interval: float = 0.005, keep_runs: int = 200,
+                 flush_interval: float = 5.0):
+        self.root = root
+        self.interval = interval
+        self.keep_runs = keep_runs
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._seq = 0
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._runs: Dict[str, deque] = {}
+        self._dirty = set()
+        os.makedirs(root, exist_ok=True)
+        self._writer = threading.Thread(target=self._flush_loop, name="run-profiler-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def start(self, tag: str) -> RunProfile:
+        return RunProfile(self, tag, self.interval)
+
+    def record(self, tag: str, wall: float, cpu: float, stacks: Counter) -> None:
+        """Odkłada profil przebiegu do zapisu w tle (bez I/O w wątku skryptu)."""
+        self._queue.put((tag, wall, cpu, stacks))
+
+    def flush(self) -> None:
+        """Czeka na zapis odłożonych profili i zapisuje sumy kroków oraz summary.json."""
+        self._queue.join()
+        self._write_aggregates()
+
+    def _flush_loop(self) -> None:
+        last_dump = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                try:
+                    self._add_run(*item)
+                except Exception:
+                    pass  # błąd zapisu profilu nie może zatrzymać wątku
+                finally:
+                    self._queue.task_done()
+            if time.monotonic() - last_dump >= self.flush_interval:
+                last_dump = time.monotonic()
+                try:
+                    self._write_aggregates()
+                except OSError:
+                    pass
+
+    def _add_run(self, tag: str, wall: float, cpu: float, stacks: Counter) -> None:
+        with self._lock:
+            self._seq += 1
+            step = self._steps.setdefault(tag, {
+                "runs": 0, "sampled_us": 0, "cpu_s": 0.0, "wall_s": [],
+                "self": Counter(), "total": Counter(), "stacks": Counter(),
+            })
+            step["runs"] += 1
+            step["cpu_s"] += cpu
+            step["wall_s"] = (step["wall_s"] + [wall])[-KEEP_RUN_TIMES:]
+            step["sampled_us"] += sum(stacks.values())
+            step["stacks"].update(stacks)
+            for stack, count in stacks.items():
+                frames = stack.split(";")
+                step["self"][frames[-1]] += count
+                for label in set(frames):  # rekurencja liczy się raz
+                    step["total"][label] += count
+            self._dirty.add(tag)
+            seq = self._seq
+
+        directory = os.path.join(self.root, tag)
+        runs = self._runs.get(tag)
+        if runs is None:
+            os.makedirs(directory, exist_ok=True)
+            # Pliki z poprzednich uruchomień procesu też podlegają limitowi
+            runs = self._runs[tag] = deque(sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.endswith(".folded") and name != "aggregate.folded"))
+        path = os.path.join(directory, f"{datetime.now():%Y%m%d-%H%M%S}-{seq:06d}.folded")
+        self._write_folded(path, stacks)
+        runs.append(path)
+        while len(runs) > self.keep_runs:
+            try:
+                os.remove(runs.popleft())
+            except OSError:
+                pass
+
+    def _write_aggregates(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshot = {tag: Counter(self._steps[tag]["stacks"]) for tag in dirty}
+            summary = self._summary_locked() if dirty else None
+        for tag, stacks in snapshot.items():
+            self._write_folded(os.path.join(self.root, tag, "aggregate.folded"), stacks)
+        if summary is not None:
+            path = os.path.join(self.root, "summary.json")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _write_folded(path: str, stacks: Counter) -> None:
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(f"{path}.tmp", path)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._summary_locked()
+
+    def _summary_locked(self) -> Dict[str, Any]:
+        result = {}
+        for tag, step in sorted(self._steps.items()):
+            walls = sorted(step["wall_s"])
+            samples = max(1, step["sampled_us"])
+            result[tag] = {
+                "runs": step["runs"],
+                "wall_ms_p50": round(walls[len(walls) // 2] * 1000, 1),
+                "wall_ms_p95": round(walls[min(len(walls) - 1, int(len(walls) * 0.95))] * 1000, 1),
+                "cpu_ms_mean": round(step["cpu_s"] / step["runs"] * 1000, 1),
+                "sampled_ms": round(step["sampled_us"] / 1000, 1),
+                "top_self": [{"frame": k, "share": round(v / samples, 4)} for k, v in step["self"].most_common(15)],
+                "top_total": [{"frame": k, "share": round(v / samples, 4)} for k, v in step["total"].most_common(15)],
+            }
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Podsumowanie profili przebiegów aplikacji")
+    parser.add_argument("root", nargs="?", default=os.environ.get("PROFILE_DIR", "profiles"))
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.root, "summary.json"), encoding="utf-8") as f:
+        summary = json.load(f)
+    for tag, step in summary.items():
+        print(f"\n{tag}: {step['runs']} przebiegów, wall p50 {step['wall_ms_p50']} ms, "
+              f"p95 {step['wall_ms_p95']} ms, CPU śr. {step['cpu_ms_mean']} ms")
+        for item in step["top_total"][:args.top]:
+            print(f"  {item['share'] * 100:5.1f}%  {item['frame']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Lokalne punkty kontrolne sesji uczestnika.
+
+Po zerwaniu połączenia lub odświeżeniu strony Streamlit tworzy nową sesję,
+a `main()` potraktowałby uczestnika jak nowego (nowe UUID, assign_group,
+kolejny wiersz w arkuszu). Stan sesji zapisujemy więc na dysku pod losowym
+tokenem, który trafia do parametru `?resume=` w adresie strony; nowa sesja
+z tym tokenem wczytuje stan zamiast zaczynać od nowa.
+
+Zapis jest atomowy (plik tymczasowy + os.replace), pliki starsze niż `ttl`
+są usuwane.
+"""
+import os
+import pickle
+import re
+import secrets
+import time
+from typing import Any, Dict, Optional
+
+_TOKEN = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+
+class CheckpointStore:
+    """
+    Args:
+        root: katalog na pliki punktów kontrolnych.
+        ttl: po ilu sekundach punkt kontrolny wygasa.
+    """
+
+    def __init__(self, root: str, ttl: float = 24 * 3600):
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def new_token() -> str:
+        return secrets.token_urlsafe(18)
+
+    def _path(self, token: str) -> Optional[str]:
+        # Token pochodzi z adresu URL – dopuszczamy tylko własny format (bez ścieżek)
+        if not isinstance(token, str) or not _TOKEN.fullmatch(token):
+            return None
+        return os.path.join(self.root, f"{token}.pkl")
+
+    def save(self, token: str, data: Dict[str, Any]) -> None:
+        path = self._path(token)
+        if path is None:
+            raise ValueError("Nieprawidłowy token punktu kontrolnego")
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load(self, token: str) -> Optional[Dict[str, Any]]:
+        path = self._path(token)
+        if path is None or not os.path.exists(path):
+            return None
+        if time.time() - os.path.getmtime(path) > self.ttl:
+            self.delete(token)
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def delete(self, token: str) -> None:
+        path = self._path(token)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def prune(self) -> int:
+        """Usuwa wygasłe punkty kontrolne; zwraca ich liczbę."""
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
@@ -0,0 +1,84 @@
+"""
+Rozliczanie pamięci sesji Streamlit.
+
+Wszystkie sesje żyją w jednym procesie, a Streamlit nie udostępnia
+session_state innych sesji – każda sesja sama raportuje więc swój rozmiar
+(głęboki `sys.getsizeof`) do wspólnego rejestru, co najwyżej raz na
+`interval` sekund albo przy zmianie kroku. Widok diagnostyczny czyta rejestr.
+"""
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Przybliżony rozmiar obiektu razem z zawartością (kontenery, sloty, __dict__, tablice numpy)."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, np.ndarray):
+        return size if obj.base is None else size + obj.nbytes
+    if isinstance(obj, dict):
+        return size + sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(deep_sizeof(item, seen) for item in obj)
+    if isinstance(obj, type) or callable(obj):
+        return size
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def measure(items: Iterable[Tuple[str, Any]]) -> Tuple[int, Dict[str, int]]:
+    """(łączny rozmiar, rozmiar każdego pola) dla par (klucz, wartość) session_state."""
+    seen: set = set()
+    by_field = {key: deep_sizeof(value, seen) for key, value in items}
+    return sum(by_field.values()), by_field
+
+
+class SessionMemoryRegistry:
+    """Ostatnio zgłoszony rozmiar każdej sesji (klucz: participant_id)."""
+
+    def __init__(self, interval: float = 30.0, forget_after: float = 6 * 3600):
+        self.interval = interval
+        self.forget_after = forget_after
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def due(self, session_id: str, step: int) -> bool:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        return entry is None or entry["step"] != step or time.time() - entry["measured_at"] >= self.interval
+
+    def report(self, session_id: str, step: int, nbytes: int, by_field: Dict[str, int]) -> None:
+        now = time.time()
+        top = dict(sorted(by_field.items(), key=lambda kv: kv[1], reverse=True)[:5])
+        with self._lock:
+            self._sessions[session_id] = {"step": step, "bytes": nbytes, "top_fields": top, "measured_at": now}
+            stale = [s for s, e in self._sessions.items() if now - e["measured_at"] > self.forget_after]
+            for s in stale:
+                del self._sessions[s]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            rows = [{"session": s, "step": e["step"], "bytes": e["bytes"],
+                     "idle_s": int(now - e["measured_at"]), "top_fields": e["top_fields"]}
+                    for s, e in self._sessions.items()]
+        return sorted(rows, key=lambda r: r["bytes"], reverse=True)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(e["bytes"] for e in self._sessions.values())
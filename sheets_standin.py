@@ -0,0 +1,238 @@
+"""
+Lokalny zamiennik klienta gspread (in-memory lub SQLite) do testów offline.
+
+Udostępnia podzbiór API używany przez aplikację:
+    client.open_by_key(key).sheet1
+    worksheet.append_row / update / batch_update / col_values / get_all_values
+
+Symuluje opóźnienie sieci oraz limit zapisów Google Sheets
+(domyślnie 60 zapisów na minutę na użytkownika), żeby batchowanie
+i kolejkowanie zapisów można było mierzyć realistycznie.
+"""
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+_A1_CELL = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+class APIError(Exception):
+    """Odpowiednik gspread.exceptions.APIError (z kodem HTTP)."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"APIError: [{code}]: {message}")
+        self.code = code
+
+
+def col_to_index(letters: str) -> int:
+    """'A' -> 1, 'Z' -> 26, 'AN' -> 40."""
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - ord("A") + 1)
+    return n
+
+
+def parse_a1_range(a1: str) -> Tuple[int, int, int, int]:
+    """Zwraca (row_start, col_start, row_end, col_end) dla zakresu typu 'A5:AN5' lub 'B3'."""
+    a1 = a1.split("!")[-1]
+    parts = a1.split(":")
+    m1 = _A1_CELL.match(parts[0])
+    m2 = _A1_CELL.match(parts[-1])
+    if not m1 or not m2:
+        raise APIError(400, f"Unable to parse range: {a1}")
+    r1, c1 = int(m1.group(2)), col_to_index(m1.group(1))
+    r2, c2 = int(m2.group(2)), col_to_index(m2.group(1))
+    return r1, c1, r2, c2
+
+
+class QuotaLimiter:
+    """Okno przesuwne: maksymalnie `limit` operacji w ciągu `window` sekund."""
+
+    def __init__(self, limit: int, metric: str, window: float = 60.0, block: bool = False):
+        self.limit = limit
+        self.metric = metric
+        self.window = window
+        self.block = block
+        self._events: deque = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.limit <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0] >= self.window:
+                    self._events.popleft()
+                if len(self._events) < self.limit:
+                    self._events.append(now)
+                    return
+                wait = self.window - (now - self._events[0])
+            if not self.block:
+                raise APIError(429, f"Quota exceeded for quota metric '{self.metric} requests' "
+                                    f"and limit '{self.metric} requests per minute per user'")
+            time.sleep(wait)
+
+
+class _Store:
+    """Przechowuje wiersze arkuszy w SQLite (":memory:" lub plik)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " sheet TEXT NOT NULL, row_idx INTEGER NOT NULL, data TEXT NOT NULL,"
+                " PRIMARY KEY (sheet, row_idx))"
+            )
+            self._conn.commit()
+
+    def all_rows(self, sheet: str) -> List[List[str]]:
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT row_idx, data FROM rows WHERE sheet = ? ORDER BY row_idx", (sheet,))
+            stored = cur.fetchall()
+        if not stored:
+            return []
+        result: List[List[str]] = [[] for _ in range(stored[-1][0])]
+        for row_idx, data in stored:
+            result[row_idx - 1] = json.loads(data)
+        return result
+
+    def append(self, sheet: str, values: List[Any]) -> int:
+        with self._lock:
+            cur = self._conn.execute("SELECT MAX(row_idx) FROM rows WHERE sheet = ?", (sheet,))
+            row_idx = (cur.fetchone()[0] or 0) + 1
+            self._conn.execute("INSERT INTO rows VALUES (?, ?, ?)",
+                               (sheet, row_idx, json.dumps(_as_cells(values), ensure_ascii=False)))
+            self._conn.commit()
+        return row_idx
+
+    def write_block(self, sheet: str, r1: int, c1: int, values: List[List[Any]]) -> int:
+        """Nadpisuje prostokąt komórek zaczynając od (r1, c1); zwraca liczbę zmienionych komórek."""
+        updated = 0
+        with self._lock:
+            for offset, new_values in enumerate(values):
+                row_idx = r1 + offset
+                cur = self._conn.execute(
+                    "SELECT data FROM rows WHERE sheet = ? AND row_idx = ?", (sheet, row_idx))
+                found = cur.fetchone()
+                row = json.loads(found[0]) if found else []
+                cells = _as_cells(new_values)
+                end = c1 - 1 + len(cells)
+                if len(row) < end:
+                    row.extend([""] * (end - len(row)))
+                row[c1 - 1:end] = cells
+                while row and row[-1] == "":
+                    row.pop()
+                self._conn.execute("INSERT OR REPLACE INTO rows VALUES (?, ?, ?)",
+                                   (sheet, row_idx, json.dumps(row, ensure_ascii=False)))
+                updated += len(cells)
+            self._conn.commit()
+        return updated
+
+
+def _as_cells(values: List[Any]) -> List[str]:
+    # Google Sheets zwraca wszystko jako tekst; None zapisuje się jako pusta komórka
+    return ["" if v is None else str(v) for v in values]
+
+
+class FakeWorksheet:
+    def __init__(self, client: "FakeClient", key: str):
+        self._client = client
+        self._key = key
+        self.title = "Sheet1"
+
+    # --- odczyty ---
+    def get_all_values(self) -> List[List[str]]:
+        self._client._simulate_read()
+        rows = self._client._store.all_rows(self._key)
+        width = max((len(r) for r in rows), default=0)
+        return [r + [""] * (width - len(r)) for r in rows]
+
+    def col_values(self, col: int) -> List[str]:
+        self._client._simulate_read()
+        rows = self._client._store.all_rows(self._key)
+        values = [r[col - 1] if len(r) >= col else "" for r in rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    # --- zapisy ---
+    def append_row(self, values: List[Any], value_input_option: str = "RAW", **kwargs) -> Dict[str, Any]:
+        self._client._simulate_write()
+        row_idx = self._client._store.append(self._key, values)
+        return {"updates": {"updatedRange": f"Sheet1!A{row_idx}", "updatedCells": len(values)}}
+
+    def update(self, range_name: Any, values: Optional[List[List[Any]]] = None, **kwargs) -> Dict[str, Any]:
+        # gspread 6 akceptuje również kolejność update(values, range_name)
+        if isinstance(range_name, list):
+            range_name, values = values, range_name
+        self._client._simulate_write()
+        r1, c1, _, _ = parse_a1_range(range_name)
+        updated = self._client._store.write_block(self._key, r1, c1, values or [])
+        return {"updatedRange": range_name, "updatedCells": updated}
+
+    def batch_update(self, data: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        """Jeden zapis (jedna jednostka limitu) dla wielu zakresów."""
+        self._client._simulate_write()
+        total = 0
+        for item in data:
+            r1, c1, _, _ = parse_a1_range(item["range"])
+            total += self._client._store.write_block(self._key, r1, c1, item["values"])
+        return {"totalUpdatedCells": total, "responses": len(data)}
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: "FakeClient", key: str):
+        self.id = key
+        self.sheet1 = FakeWorksheet(client, key)
+
+
+class FakeClient:
+    """
+    Zamiennik `gspread.Client`.
+
+    Args:
+        path: ":memory:" lub ścieżka do pliku SQLite (współdzielonego między procesami).
+        latency_ms: (min, max) opóźnienia każdej operacji w milisekundach.
+        writes_per_minute: limit zapisów na minutę (0 = bez limitu).
+        reads_per_minute: limit odczytów na minutę (0 = bez limitu).
+        block_on_quota: True – czekaj na zwolnienie limitu zamiast zgłaszać APIError 429.
+    """
+
+    def __init__(self, path: str = ":memory:", latency_ms: Tuple[float, float] = (0.0, 0.0),
+                 writes_per_minute: int = 60, reads_per_minute: int = 0,
+                 block_on_quota: bool = False):
+        self._store = _Store(path)
+        self.latency_ms = latency_ms
+        self._write_quota = QuotaLimiter(writes_per_minute, "Write", block=block_on_quota)
+        self._read_quota = QuotaLimiter(reads_per_minute, "Read", block=block_on_quota)
+        self.stats = {"reads": 0, "writes": 0}
+        self._stats_lock = threading.Lock()
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        return FakeSpreadsheet(self, key)
+
+    def _sleep(self) -> None:
+        lo, hi = self.latency_ms
+        if hi > 0:
+            time.sleep(random.uniform(lo, hi) / 1000.0)
+
+    def _simulate_read(self) -> None:
+        self._read_quota.acquire()
+        self._sleep()
+        with self._stats_lock:
+            self.stats["reads"] += 1
+
+    def _simulate_write(self) -> None:
+        self._write_quota.acquire()
+        self._sleep()
+        with self._stats_lock:
+            self.stats["writes"] += 1
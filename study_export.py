@@ -0,0 +1,313 @@
+"""
+Eksport i punktacja wyników badania (offline).
+
+Cały arkusz jest czytany jednym `get_all_values()` (Google Sheets albo lokalny
+SQLite z sheets_standin.py), kolumny A–AN trafiają do tablic NumPy i wszystkie
+wskaźniki liczone są wektorowo:
+
+- TIPI-PL: pięć wymiarów Big Five jako średnia dwóch pozycji, z pozycjami
+  odwróconymi (2, 4, 6, 8, 10 -> 8 - x),
+- BUS-11: suma i średnia 11 pozycji (1–5),
+- czas rozmowy, czas całego badania, liczba wiadomości, decyzja o petycji.
+
+Wynik: tabela uczestników (`participants.csv` / `.parquet`) oraz średnie
+w grupach A/B/C (`groups.csv` / `.parquet`).
+
+Przebiegi są przyrostowe: plik stanu zapamiętuje numer wiersza, do którego
+wszystkie wiersze są już ostateczne (badanie rozpoczęte dawniej niż
+`--settle-hours` temu). Arkusz nie ma znacznika ostatniego kroku – po decyzji
+dopisywane są jeszcze opinie (AL–AM), a łączny czas (AN) zmienia się przy
+każdym zapisie – więc o ostateczności decyduje tylko wiek wiersza. Kolejny
+eksport punktuje tylko wiersze za tą granicą i dołącza je do poprzedniego
+wyniku.
+
+    python study_export.py --backend local --path sheets.sqlite --out export
+    python study_export.py --backend google --credentials sa.json --format parquet
+    python study_export.py --backend local --path sheets.sqlite --full
+"""
+import argparse
+import csv
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from participant_record import (
+    COL_AGE, COL_ATTITUDE, COL_BUS, COL_CONV_DURATION, COL_DECISION, COL_EDUCATION, COL_GENDER,
+    COL_GROUP, COL_NUM_BOT, COL_NUM_USER, COL_PARTICIPANT_ID, COL_START_TIMESTAMP,
+    COL_STUDY_DURATION, COL_TIPI, ROW_WIDTH,
+)
+
+GROUPS = ("A", "B", "C")
+N_TIPI = 10
+N_BUS = 11
+# Wymiar -> (pozycja wprost, pozycja odwrócona), numeracja pozycji od 1
+TIPI_SCALES: Dict[str, Tuple[int, int]] = {
+    "extraversion": (1, 6),
+    "agreeableness": (7, 2),
+    "conscientiousness": (3, 8),
+    "emotional_stability": (9, 4),
+    "openness": (5, 10),
+}
+TIPI_MAX = 7
+# Domyślny arkusz aplikacji (GDRIVE_SHEET_ID w ConversBOT_TEST.py)
+DEFAULT_SHEET_ID = os.environ.get("GDRIVE_SHEET_ID", "1R47dD1SaAWIRCQkuYfLveHXtXJAWJEk18J2m1kbyHUo")
+
+PARTICIPANT_COLUMNS = (
+    ["row_index", "participant_id", "start_timestamp", "group", "age", "gender", "education",
+     "attitude1", "attitude2", "attitude3"]
+    + list(TIPI_SCALES)
+    + ["bus_total", "bus_mean", "bus_answered", "conversation_seconds", "study_seconds",
+       "num_user_messages", "num_bot_messages", "signed_petition", "complete"]
+)
+_NUMERIC_SUMMARY = list(TIPI_SCALES) + [
+    "bus_total", "bus_mean", "conversation_seconds", "study_seconds",
+    "num_user_messages", "num_bot_messages", "signed_petition",
+]
+
+
+# --- Odczyt ---
+
+def read_rows(backend: str, path: str = "", credentials: str = "",
+              sheet_id: str = DEFAULT_SHEET_ID) -> List[List[str]]:
+    """Wszystkie wiersze arkusza jednym odczytem."""
+    if backend == "local":
+        from sheets_standin import FakeClient
+        client = FakeClient(path=path, writes_per_minute=0)
+    else:
+        import gspread
+        client = gspread.service_account(filename=credentials)
+    return client.open_by_key(sheet_id).sheet1.get_all_values()
+
+
+def to_matrix(rows: Sequence[Sequence[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (indeksy wierszy arkusza od 1, macierz tekstu n x ROW_WIDTH) tylko dla wierszy uczestników –
+    nagłówek i puste wiersze odpadają, bo nie mają grupy A/B/C.
+    """
+    keep = [i for i, r in enumerate(rows)
+            if len(r) > COL_GROUP and r[COL_PARTICIPANT_ID] and r[COL_GROUP] in GROUPS]
+    matrix = np.full((len(keep), ROW_WIDTH), "", dtype=object)
+    for out, i in enumerate(keep):
+        row = rows[i][:ROW_WIDTH]
+        matrix[out, :len(row)] = row
+    return np.asarray(keep, dtype=np.int64) + 1, matrix
+
+
+def _numeric(block: np.ndarray) -> np.ndarray:
+    """Tekst -> float (puste i nieliczbowe -> NaN), dowolny kształt."""
+    text = np.char.strip(np.asarray(block, dtype=str))
+    text[text == ""] = "nan"
+    try:
+        return text.astype(np.float64)  # zwykły przypadek: same liczby i puste komórki
+    except ValueError:
+        pass
+    # Rzadki przypadek: pojedyncze nieliczbowe komórki – tylko tu konwersja po komórce
+    flat = text.ravel()
+    out = np.full(flat.shape, np.nan)
+    for i, value in enumerate(flat):
+        try:
+            out[i] = float(value)
+        except ValueError:
+            pass
+    return out.reshape(text.shape)
+
+
+def _mmss_seconds(column: np.ndarray) -> np.ndarray:
+    """Kolumna "MM:SS" -> sekundy (NaN dla pustych)."""
+    parts = np.array([v.split(":") if isinstance(v, str) and v.count(":") == 1 else ["", ""]
+                      for v in column], dtype=object).reshape(-1, 2)
+    minutes, seconds = _numeric(parts[:, 0]), _numeric(parts[:, 1])
+    return minutes * 60 + seconds
+
+
+# --- Punktacja ---
+
+def score(row_index: np.ndarray, matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Tabela kolumnowa (nazwa -> tablica) dla podanych wierszy."""
+    tipi = _numeric(matrix[:, COL_TIPI:COL_TIPI + N_TIPI])
+    tipi[(tipi < 1) | (tipi > TIPI_MAX)] = np.nan
+    bus = _numeric(matrix[:, COL_BUS:COL_BUS + N_BUS])
+    bus[(bus < 1) | (bus > 5)] = np.nan
+
+    table: Dict[str, np.ndarray] = {
+        "row_index": row_index,
+        "participant_id": matrix[:, COL_PARTICIPANT_ID],
+        "start_timestamp": matrix[:, COL_START_TIMESTAMP],
+        "group": matrix[:, COL_GROUP],
+        "age": _numeric(matrix[:, COL_AGE]),
+        "gender": matrix[:, COL_GENDER],
+        "education": matrix[:, COL_EDUCATION],
+    }
+    for i in range(3):
+        table[f"attitude{i + 1}"] = _numeric(matrix[:, COL_ATTITUDE + i])
+    for name, (direct, reverse) in TIPI_SCALES.items():
+        table[name] = (tipi[:, direct - 1] + (TIPI_MAX + 1 - tipi[:, reverse - 1])) / 2
+
+    answered = np.sum(~np.isnan(bus), axis=1)
+    table["bus_total"] = np.where(answered == N_BUS, np.nansum(bus, axis=1), np.nan)
+    with np.errstate(invalid="ignore"):
+        table["bus_mean"] = np.where(answered > 0, np.nansum(bus, axis=1) / np.maximum(answered, 1), np.nan)
+    table["bus_answered"] = answered
+    table["conversation_seconds"] = _numeric(matrix[:, COL_CONV_DURATION])
+    table["study_seconds"] = _mmss_seconds(matrix[:, COL_STUDY_DURATION])
+    table["num_user_messages"] = _numeric(matrix[:, COL_NUM_USER])
+    table["num_bot_messages"] = _numeric(matrix[:, COL_NUM_BOT])
+    decision = matrix[:, COL_DECISION]
+    table["signed_petition"] = np.where(decision == "Tak", 1.0, np.where(decision == "Nie", 0.0, np.nan))
+    # Ukończenie = decyzja o petycji (krok 5); AN zapisuje każdy zapis wiersza, więc nic tu nie wnosi
+    table["complete"] = decision != ""
+    return table
+
+
+def group_summary(table: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Liczebność oraz średnie i odchylenia standardowe wskaźników w grupach A/B/C (tylko ukończone)."""
+    summary: Dict[str, List] = {"group": [], "n": [], "n_complete": []}
+    for column in _NUMERIC_SUMMARY:
+        summary[f"{column}_mean"] = []
+        summary[f"{column}_sd"] = []
+    complete = table["complete"].astype(bool)
+    for group in GROUPS:
+        in_group = table["group"] == group
+        mask = in_group & complete
+        summary["group"].append(group)
+        summary["n"].append(int(in_group.sum()))
+        summary["n_complete"].append(int(mask.sum()))
+        for column in _NUMERIC_SUMMARY:
+            values = table[column][mask].astype(float)
+            values = values[~np.isnan(values)]
+            summary[f"{column}_mean"].append(float(values.mean()) if values.size else np.nan)
+            summary[f"{column}_sd"].append(float(values.std(ddof=1)) if values.size > 1 else np.nan)
+    return {k: np.asarray(v) for k, v in summary.items()}
+
+
+def settled_through(row_index: np.ndarray, table: Dict[str, np.ndarray],
+                    settle_after: timedelta, now: Optional[datetime] = None) -> int:
+    """
+    Najwyższy numer wiersza, do którego wszystkie wiersze są ostateczne: badanie rozpoczęte
+    dawniej niż `settle_after`. Także ukończone wiersze czekają – po decyzji uczestnik
+    wypełnia jeszcze opinie, a czas badania (AN) jest nadpisywany przy każdym zapisie.
+    """
+    cutoff = (now or datetime.now()) - settle_after
+    last = 0
+    for idx, started in zip(row_index, table["start_timestamp"]):
+        try:
+            if datetime.fromisoformat(started) > cutoff:
+                break
+        except (TypeError, ValueError):
+            pass  # bez poprawnej daty startu traktujemy wiersz jako porzucony
+        last = int(idx)
+    return last
+
+
+# --- Zapis ---
+
+def _write_csv(path: str, table: Dict[str, np.ndarray], columns: Sequence[str]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in zip(*(table[c] for c in columns)):
+            writer.writerow("" if isinstance(v, float) and np.isnan(v) else v for v in row)
+    os.replace(tmp, path)
+
+
+def _read_csv(path: str) -> Dict[str, np.ndarray]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    table = {}
+    for name, values in zip(header, columns):
+        values = np.asarray(values, dtype=object)
+        if name in ("participant_id", "start_timestamp", "group", "gender", "education"):
+            table[name] = values
+        elif name == "complete":
+            table[name] = values == "True"
+        elif name in ("row_index", "bus_answered"):
+            table[name] = _numeric(values).astype(np.int64)
+        else:
+            table[name] = _numeric(values)
+    return table
+
+
+def _write_parquet(path: str, table: Dict[str, np.ndarray], columns: Sequence[str]) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    arrays = {c: (table[c].tolist() if table[c].dtype == object else table[c]) for c in columns}
+    pq.write_table(pa.table(arrays), f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def _read_parquet(path: str) -> Dict[str, np.ndarray]:
+    import pyarrow.parquet as pq
+    data = pq.read_table(path).to_pydict()
+    return {k: np.asarray(v, dtype=object if v and isinstance(v[0], str) else None) for k, v in data.items()}
+
+
+def _concat(old: Dict[str, np.ndarray], new: Dict[str, np.ndarray], keep_old: np.ndarray) -> Dict[str, np.ndarray]:
+    return {c: np.concatenate([np.asarray(old[c])[keep_old], np.asarray(new[c])]) for c in PARTICIPANT_COLUMNS}
+
+
+def export(rows: Sequence[Sequence[str]], out_dir: str, fmt: str = "csv", full: bool = False,
+           settle_hours: float = 24.0) -> Dict[str, int]:
+    """Punktuje nowe wiersze, dołącza je do poprzedniego eksportu i zapisuje tabele; zwraca statystyki."""
+    os.makedirs(out_dir, exist_ok=True)
+    write, read = (_write_parquet, _read_parquet) if fmt == "parquet" else (_write_csv, _read_csv)
+    participants_path = os.path.join(out_dir, f"participants.{fmt}")
+    groups_path = os.path.join(out_dir, f"groups.{fmt}")
+    state_path = os.path.join(out_dir, "export_state.json")
+
+    done_through = 0
+    if not full and os.path.exists(state_path) and os.path.exists(participants_path):
+        with open(state_path, encoding="utf-8") as f:
+            done_through = int(json.load(f).get("settled_through", 0))
+
+    row_index, matrix = to_matrix(rows)
+    pending = row_index > done_through
+    new = score(row_index[pending], matrix[pending])
+    if done_through:
+        old = read(participants_path)
+        table = _concat(old, new, np.asarray(old["row_index"]) <= done_through)
+    else:
+        table = new
+
+    write(participants_path, table, PARTICIPANT_COLUMNS)
+    summary = group_summary(table)
+    write(groups_path, summary, list(summary))
+
+    settled = settled_through(new["row_index"], new, timedelta(hours=settle_hours)) or done_through
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump({"settled_through": max(settled, done_through),
+                   "exported_at": datetime.now().isoformat()}, f)
+    return {"rows": int(len(table["row_index"])), "scored": int(pending.sum()),
+            "settled_through": max(settled, done_through)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eksport i punktacja wyników badania (TIPI-PL, BUS-11, rozmowa)")
+    parser.add_argument("--backend", choices=("local", "google"), default="local")
+    parser.add_argument("--path", default=os.environ.get("GSHEETS_LOCAL_PATH", "sheets.sqlite"),
+                        help="plik SQLite dla --backend local")
+    parser.add_argument("--credentials", default="", help="plik JSON konta serwisowego dla --backend google")
+    parser.add_argument("--sheet-id", default=DEFAULT_SHEET_ID)
+    parser.add_argument("--out", default="export")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--full", action="store_true", help="przelicz wszystkie wiersze od nowa")
+    parser.add_argument("--settle-hours", type=float, default=24.0,
+                        help="po ilu godzinach od startu wiersz uznajemy za ostateczny")
+    args = parser.parse_args()
+
+    rows = read_rows(args.backend, args.path, args.credentials, args.sheet_id)
+    stats = export(rows, args.out, args.format, args.full, args.settle_hours)
+    print(f"Wierszy w eksporcie: {stats['rows']}, przeliczonych teraz: {stats['scored']}, "
+          f"ostateczne do wiersza: {stats['settled_through']}")
+    print(f"Wynik: {os.path.join(args.out, 'participants.' + args.format)}, "
+          f"{os.path.join(args.out, 'groups.' + args.format)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Zwarta reprezentacja rozmowy w session_state.
+
+Zamiast listy słowników {"user": ..., "bot": [zdania]} oraz osobnego słownika
+`shown_sentences` każda tura to obiekt ze slotami, a zdania bota trzymane są
+jako jeden napis z separatorem (jeden obiekt zamiast listy i napisu na zdanie).
+"""
+from typing import Iterator, List, Optional, Sequence, Union
+
+SENTENCE_SEP = "\x1f"
+
+
+class Turn:
+    __slots__ = ("user", "_bot", "shown")
+
+    def __init__(self, user: Optional[str] = None, bot: Union[None, str, Sequence[str]] = None,
+                 shown: bool = False):
+        self.user = user
+        self._bot: Optional[str] = None
+        self.shown = shown  # czy zdania bota zostały już wyświetlone (z efektem pisania)
+        if bot is not None:
+            self.bot = bot
+
+    @property
+    def bot(self) -> Optional[str]:
+        return self._bot
+
+    @bot.setter
+    def bot(self, value: Union[str, Sequence[str]]) -> None:
+        self._bot = value if isinstance(value, str) else SENTENCE_SEP.join(value)
+
+    @property
+    def has_bot(self) -> bool:
+        """Czy tura ma już odpowiedź – także pustą (model nic nie zwrócił), żeby nie pytać go ponownie."""
+        return self._bot is not None
+
+    @property
+    def bot_sentences(self) -> List[str]:
+        # "".split(SEP) dałoby [""], czyli pusty dymek
+        return self._bot.split(SENTENCE_SEP) if self._bot else []
+
+    @property
+    def bot_text(self) -> Optional[str]:
+        """Odpowiedź bota jako jeden tekst (zdania łączone przez ". ", jak w logu i prompcie)."""
+        return self._bot.replace(SENTENCE_SEP, ". ") if self._bot is not None else None
+
+
+class TurnStore:
+    """Lista tur rozmowy; tura użytkownika czeka na odpowiedź bota w tym samym obiekcie."""
+
+    __slots__ = ("turns",)
+
+    def __init__(self, turns: Optional[List[Turn]] = None):
+        self.turns: List[Turn] = turns or []
+
+    def append_user(self, text: str) -> Turn:
+        turn = Turn(user=text)
+        self.turns.append(turn)
+        return turn
+
+    def append_bot(self, bot: Union[str, Sequence[str]]) -> Turn:
+        """Dopisuje odpowiedź do czekającej tury użytkownika albo jako osobną turę bota."""
+        if self.turns and self.turns[-1].user is not None and not self.turns[-1].has_bot:
+            turn = self.turns[-1]
+            turn.bot = bot
+        else:
+            turn = Turn(bot=bot)
+            self.turns.append(turn)
+        turn.shown = False
+        return turn
+
+    def last_user_message(self) -> str:
+        for turn in reversed(self.turns):
+            if turn.user is not None:
+                return turn.user
+        return ""
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __getitem__(self, index: int) -> Turn:
+        return self.turns[index]
+
+    def __iter__(self) -> Iterator[Turn]:
+        return iter(self.turns)